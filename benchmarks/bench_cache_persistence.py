@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сохранения DNS кэша.
+
+Наполняет кэш до 100k записей и измеряет среднюю стоимость сохранения
+одного резолвинга на каждом отрезке роста кэша:
+  - legacy: полная перезапись dns_cache.json с indent=2 после каждого домена
+            (как было раньше, измеряется только до --legacy-limit записей)
+  - DNSCache: журнал + периодический снимок с атомарной заменой
+
+Запуск:
+    python benchmarks/bench_cache_persistence.py [--entries 100000] [--step 10000]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dns_routing.core.dns_cache import DNSCache
+
+
+def make_entry(i: int) -> dict:
+    now = time.time()
+    return {
+        'ips': [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"],
+        'timestamp': now,
+        'ttl': 300,
+        'expires': now + 300,
+    }
+
+
+def bench_legacy(workdir: Path, entries: int, step: int) -> list:
+    """Старое поведение: json.dump(indent=2) всего кэша на каждый домен"""
+    path = workdir / "legacy_cache.json"
+    cache = {}
+    rows = []
+    for start in range(0, entries, step):
+        began = time.perf_counter()
+        for i in range(start, start + step):
+            cache[f"domain{i}.example.com"] = make_entry(i)
+            with open(path, 'w') as f:
+                json.dump(cache, f, indent=2)
+        rows.append((start + step, (time.perf_counter() - began) / step))
+    return rows
+
+
+def bench_dns_cache(workdir: Path, entries: int, step: int,
+                    flush_every: int, flush_interval: float) -> list:
+    """DNSCache: отложенный пакетный сброс"""
+    cache = DNSCache(workdir / "dns_cache.json", flush_every=flush_every,
+                     flush_interval=flush_interval)
+    rows = []
+    for start in range(0, entries, step):
+        began = time.perf_counter()
+        for i in range(start, start + step):
+            cache.set(f"domain{i}.example.com", make_entry(i))
+        cache.flush()
+        rows.append((start + step, (time.perf_counter() - began) / step))
+
+    # Проверяем, что снимок и журнал вместе дают полный кэш
+    reloaded = DNSCache(cache.path)
+    assert reloaded.load() == entries, "reloaded cache is incomplete"
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--step', type=int, default=10_000)
+    parser.add_argument('--flush-every', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=5.0)
+    parser.add_argument('--legacy-limit', type=int, default=2_000,
+                        help='максимальный размер кэша для legacy режима (он квадратичный)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+
+        legacy_step = max(1, min(args.step, args.legacy_limit // 4))
+        legacy = bench_legacy(workdir, args.legacy_limit, legacy_step)
+        print("=== legacy: full indent=2 rewrite per domain ===")
+        for size, per_domain in legacy:
+            print(f"  cache size {size:>7}: {per_domain * 1e6:10.1f} us/domain")
+
+        rows = bench_dns_cache(workdir, args.entries, args.step,
+                               args.flush_every, args.flush_interval)
+        print(f"=== DNSCache: journal + snapshot (flush_every={args.flush_every}) ===")
+        for size, per_domain in rows:
+            print(f"  cache size {size:>7}: {per_domain * 1e6:10.1f} us/domain")
+
+
+if __name__ == '__main__':
+    main()
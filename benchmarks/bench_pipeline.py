@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк конвейера резолвинг -> маршруты.
+
+Синтетические списки доменов (1k/10k/100k, смесь точных, *. и **. записей),
+ответы локального stub DNS сервера, установка маршрутов в simulator бэкенд.
+По каждому размеру: domains/s, p50/p95/p99 по фазам, peak RSS, доля
+попаданий в кэш. Результаты пишутся в JSON для сравнения версий.
+
+Запуск:
+    python benchmarks/bench_pipeline.py [--sizes 1000,10000,100000] [--json out.json]
+    python benchmarks/bench_pipeline.py --sizes 10000 --baseline out.json
+
+То же доступно как dns-routing bench.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dns_routing.core import benchmark
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--mix', default='exact=0.8,wildcard=0.15,deep=0.05')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--nxdomain-rate', type=float, default=0.1)
+    parser.add_argument('--route-latency', type=float, default=0.0,
+                        help='задержка simulator бэкенда на операцию, секунды')
+    parser.add_argument('--json', help='файл для результатов в JSON')
+    parser.add_argument('--baseline', help='JSON отчет предыдущей версии для сравнения')
+    args = parser.parse_args()
+
+    mix = benchmark.parse_mix(args.mix)
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        result = benchmark.run_benchmark(size, mix, seed=args.seed, nxdomain_rate=args.nxdomain_rate,
+                                         route_latency=args.route_latency)
+        results.append(result)
+        print("\n".join(benchmark.format_result(result)))
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n".join(benchmark.compare_results(results, json.load(f)) or ["no matching sizes"]))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({**benchmark.environment_info(), 'results': results}, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пакетного протокола помощника маршрутов.
+
+Сравнивает:
+  - spawn: отдельный процесс на каждую операцию (как sudo route на каждый адрес,
+           вместо route выполняется true - замеряется только fork/exec)
+  - helper: один процесс помощника в режиме --fake, операции пакетом через pipe
+
+Root не нужен.
+
+Запуск:
+    python benchmarks/bench_route_helper.py [--routes 5000]
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dns_routing.core.route_helper import RouteHelper
+
+
+def make_commands(count: int, op: str = 'add') -> list:
+    return [['route', op, '-host', f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+             '-interface', 'utun4'] for i in range(count)]
+
+
+def bench_spawn(count: int) -> float:
+    began = time.perf_counter()
+    for _ in range(count):
+        subprocess.run(['true'], capture_output=True, text=True, timeout=30)
+    return time.perf_counter() - began
+
+
+def bench_helper(count: int) -> tuple:
+    with RouteHelper(fake=True) as helper:
+        began = time.perf_counter()
+        added = helper.run_batch(make_commands(count, 'add'))
+        add_time = time.perf_counter() - began
+
+        began = time.perf_counter()
+        deleted = helper.run_batch(make_commands(count, 'delete'))
+        delete_time = time.perf_counter() - began
+
+    assert all(ok for ok, _ in added), "fake helper rejected an add"
+    assert all(ok for ok, _ in deleted), "fake helper rejected a delete"
+    return add_time, delete_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', type=int, default=5000)
+    parser.add_argument('--spawn-limit', type=int, default=1000,
+                        help='сколько процессов запускать в режиме spawn')
+    args = parser.parse_args()
+
+    spawn_count = min(args.routes, args.spawn_limit)
+    spawn_time = bench_spawn(spawn_count)
+    print(f"spawn per op : {spawn_count:>7} ops in {spawn_time:7.3f}s "
+          f"({spawn_time / spawn_count * 1e6:8.1f} us/op)")
+
+    add_time, delete_time = bench_helper(args.routes)
+    print(f"helper add   : {args.routes:>7} ops in {add_time:7.3f}s "
+          f"({add_time / args.routes * 1e6:8.1f} us/op)")
+    print(f"helper delete: {args.routes:>7} ops in {delete_time:7.3f}s "
+          f"({delete_time / args.routes * 1e6:8.1f} us/op)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,63 +1,157 @@
 """
 CLI команды для DNS Routing Manager.
 Использует Click для создания удобного интерфейса.
+
+Модули резолвера, маршрутов и демона импортируются внутри команд:
+--help и status не должны платить за asyncio, сокеты и загрузку кэша.
 """
 import click
 import sys
+import time
 from typing import List
 from pathlib import Path
 
-from ..core.resolver import DNSResolver
-from ..core.route_manager import RouteManager
-from ..models import Domain, DomainType, RouteType
 from ..config import get_config
+from ..models import Domain, DomainType, RouteType
 
 
 @click.group(name="dns-routing")
 @click.version_option(version="1.0.0", prog_name="DNS Routing Manager")
-def cli():
+@click.option('--profile', is_flag=True,
+              help='Профилировать команду: pstats дамп и сводка по фазам в stderr')
+@click.option('--profile-out', type=click.Path(dir_okay=False),
+              help='Файл pstats (по умолчанию data/cache/profiles/<команда>-<время>.pstats)')
+@click.option('--profile-interval', type=float, default=0.0,
+              help='Выборка стеков раз в N секунд вместо cProfile (дешево для daemon)')
+@click.option('--verbose', '-v', is_flag=True,
+              help='Печатать результат резолвинга каждого имени (dns.verbose)')
+@click.pass_context
+def cli(ctx, profile, profile_out, profile_interval, verbose):
     """
     DNS Routing Manager - Инструмент для селективной маршрутизации сетевого трафика.
     
     Позволяет направлять трафик через разные интерфейсы на основе доменных имен.
     """
-    pass
+    if verbose:
+        try:
+            get_config().dns_verbose = True
+        except RuntimeError:
+            pass
+    
+    if not (profile or profile_out or profile_interval > 0):
+        return
+    from ..utils.profiling import RunProfiler
+    
+    if profile_out is None:
+        try:
+            profiles_dir = get_config().cache_dir / "profiles"
+        except RuntimeError:
+            profiles_dir = Path("profiles")
+        command = (ctx.invoked_subcommand or "cli").replace(' ', '-')
+        profile_out = profiles_dir / f"{command}-{time.strftime('%Y%m%d-%H%M%S')}.pstats"
+    
+    profiler = RunProfiler(Path(profile_out), interval=max(0.0, profile_interval))
+    profiler.start()
+    # Вызывается и после sys.exit в команде, и после остановки демона сигналом
+    ctx.call_on_close(profiler.finish)
+
+
+def _cache_summary(config, stats: dict) -> dict:
+    """
+    Секция dns_cache файла статистики. Если ее еще нет (кэш записан
+    старой версией), кэш читается один раз и секция создается.
+    """
+    if 'dns_cache' in stats:
+        return stats['dns_cache']
+    
+    from ..core.dns_cache import DNSCache
+    from ..utils.stats_file import read_stats
+    
+    cache = DNSCache(config.cache_dir / "dns_cache.json",
+                     max_entries=config.cache_max_entries,
+                     legacy_ttl=config.cache_ttl_hours * 3600,
+                     stats_path=config.stats_file)
+    if cache.path.exists() or cache.journal_path.exists():
+        cache.load()
+    cache.write_stats()
+    return read_stats(config.stats_file).get('dns_cache', {'entries': len(cache)})
+
+
+def _routes_summary(config, stats: dict) -> dict:
+    """Секция routes файла статистики или число маршрутов из routes.json"""
+    if 'routes' in stats:
+        return stats['routes']
+    
+    import json
+    try:
+        with open(config.routes_cache_file, 'r') as f:
+            return {'active_routes': len(json.load(f).get('routes', []))}
+    except (OSError, ValueError):
+        return {'active_routes': 0}
+
+
+def _list_file_counts(config, stats: dict) -> dict:
+    """
+    Число записей в файлах доменов и IP. Файл перечитывается только
+    при изменении размера или mtime, иначе берется число из статистики.
+    """
+    from ..utils.stats_file import update_stats
+    
+    known = stats.get('files', {})
+    counts = {}
+    changed = False
+    for path in (config.domains_ru_file, config.domains_com_file,
+                 config.ips_local_file, config.ips_vpn_file):
+        try:
+            stat = path.stat()
+        except OSError:
+            counts[str(path)] = None
+            continue
+        
+        entry = known.get(str(path))
+        if not entry or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                     'entries': len(load_domains_from_file(path))}
+            changed = True
+        counts[str(path)] = entry
+    
+    if changed:
+        update_stats(config.stats_file, 'files',
+                     {name: entry for name, entry in counts.items() if entry is not None})
+    return counts
 
 
 @cli.command()
 def status():
     """Показать текущий статус системы"""
+    from ..config import ConfigLoader
+    from ..utils.stats_file import count_valid, read_stats
+    
     click.echo("=== DNS Routing Manager Status ===")
     
     try:
         config = get_config()
         
+        click.echo(f"⚙️  Config: {ConfigLoader().config_file}")
         click.echo(f"📡 Local Interface: {config.local_interface.name} (gateway: {config.local_interface.gateway})")
         click.echo(f"🔒 VPN Interface: {config.vpn_interface.name}")
         
-        # Статистика DNS кэша
-        resolver = DNSResolver()
-        dns_stats = resolver.get_cache_stats()
-        click.echo(f"🗄️  DNS Cache: {dns_stats['valid_entries']}/{dns_stats['total_entries']} valid entries")
+        # Счетчики берутся из файла статистики, который ведут кэш и менеджер
+        # маршрутов, - сами dns_cache.json и routes.json не загружаются
+        stats = read_stats(config.stats_file)
         
-        # Статистика маршрутов
-        route_manager = RouteManager()
-        routes_count = route_manager.get_active_routes_count()
-        click.echo(f"🛣️  Active Routes: {routes_count}")
+        dns_stats = _cache_summary(config, stats)
+        click.echo(f"🗄️  DNS Cache: {count_valid(dns_stats)}/{dns_stats.get('entries', 0)} valid entries")
         
-        # Проверяем файлы конфигурации
-        config_files = [
-            ("domains_ru.txt", config.domains_ru_file),
-            ("domains_com.txt", config.domains_com_file),
-            ("ips_local.txt", config.ips_local_file),
-            ("ips_vpn.txt", config.ips_vpn_file),
-        ]
+        routes_stats = _routes_summary(config, stats)
+        backend = routes_stats.get('backend') or config.route_backend
+        click.echo(f"🛣️  Active Routes: {routes_stats['active_routes']} (backend: {backend})")
         
         click.echo("\n📁 Configuration Files:")
-        for name, path in config_files:
-            if path.exists():
-                line_count = len(path.read_text().strip().split('\n'))
-                click.echo(f"   ✅ {name}: {line_count} entries")
+        for path, entry in _list_file_counts(config, stats).items():
+            name = Path(path).name
+            if entry is not None:
+                click.echo(f"   ✅ {name}: {entry['entries']} entries")
             else:
                 click.echo(f"   ❌ {name}: not found")
         
@@ -80,10 +174,15 @@ def dns():
               help='Тип домена для резолвинга')
 def resolve(domain, domain_type):
     """Резолвить домен в IP адреса"""
+    from ..core.resolver import DNSResolver
+    from ..utils.metrics import PhaseTimer
+    
     click.echo(f"Resolving {domain} ({domain_type})...")
     
     try:
+        timer = PhaseTimer()
         resolver = DNSResolver()
+        timer.lap('load')
         
         # Создаем объект домена
         domain_obj = Domain(
@@ -93,6 +192,7 @@ def resolve(domain, domain_type):
         )
         
         result = resolver.resolve_domain(domain_obj)
+        timer.lap('resolve')
         
         if result.success:
             click.echo(f"✅ Success: Found {len(result.ips)} IP addresses")
@@ -109,6 +209,8 @@ def resolve(domain, domain_type):
 @dns.command()
 def cache():
     """Показать статистику DNS кэша"""
+    from ..core.resolver import DNSResolver
+    
     try:
         resolver = DNSResolver()
         stats = resolver.get_cache_stats()
@@ -117,6 +219,20 @@ def cache():
         click.echo(f"Total entries: {stats['total_entries']}")
         click.echo(f"Valid entries: {stats['valid_entries']}")
         click.echo(f"Expired entries: {stats['expired_entries']}")
+        click.echo(f"Max entries: {stats['max_entries'] or 'unlimited'}")
+        click.echo(f"Evicted on load: {stats['evictions']} LRU, {stats['expired_evictions']} expired")
+        
+        if stats['ttl_min'] is not None:
+            click.echo(f"TTL min/median/max: {stats['ttl_min']}s / "
+                       f"{stats['ttl_median']}s / {stats['ttl_max']}s")
+        kinds = ", ".join(f"{kind} {count}" for kind, count in stats['negative_by_kind'].items() if count)
+        click.echo(f"Negative entries: {stats['negative_entries']} "
+                   f"({stats['negative_valid']} valid{': ' + kinds if kinds else ''})")
+        click.echo(f"CNAME aliases: {stats['cname_entries']} entries")
+        click.echo("TTL distribution:")
+        for label, count in stats['ttl_distribution'].items():
+            click.echo(f"   {label:>7}: {count}")
+        
         click.echo(f"Cache file: {stats['cache_file']}")
         
     except Exception as e:
@@ -127,6 +243,8 @@ def cache():
 @click.confirmation_option(prompt='Are you sure you want to clear DNS cache?')
 def clear():
     """Очистить DNS кэш"""
+    from ..core.resolver import DNSResolver
+    
     try:
         resolver = DNSResolver()
         resolver.clear_cache()
@@ -148,13 +266,15 @@ def routes():
               help='Маршрутизировать через local или vpn')
 def add(target, via):
     """Добавить маршрут для IP или подсети"""
+    from ..core.route_manager import RouteManager
+    
     click.echo(f"Adding route {target} via {via}...")
     
     try:
-        route_manager = RouteManager()
         route_type = RouteType.LOCAL if via == 'local' else RouteType.VPN
         
-        result = route_manager.add_route(target, route_type)
+        with RouteManager() as route_manager:
+            result = route_manager.add_route(target, route_type)
         
         if result.success:
             click.echo(f"✅ {result.message}")
@@ -171,11 +291,13 @@ def add(target, via):
 @click.argument('target')
 def remove(target):
     """Удалить маршрут для IP или подсети"""
+    from ..core.route_manager import RouteManager
+    
     click.echo(f"Removing route for {target}...")
     
     try:
-        route_manager = RouteManager()
-        result = route_manager.remove_route(target)
+        with RouteManager() as route_manager:
+            result = route_manager.remove_route(target)
         
         if result.success:
             click.echo(f"✅ {result.message}")
@@ -187,22 +309,53 @@ def remove(target):
 
 
 @routes.command()
-@click.argument('target')
-def check(target):
-    """Проверить существующий маршрут"""
-    click.echo(f"Checking route for {target}...")
+@click.argument('targets', nargs=-1, required=True)
+def check(targets):
+    """Проверить существующие маршруты (несколько целей - по одному снимку таблицы)"""
+    from ..core.route_manager import RouteManager
     
     try:
-        route_manager = RouteManager()
-        route_info = route_manager.check_route(target)
-        
-        if route_info:
-            click.echo("✅ Route found:")
-            for key, value in route_info.items():
-                click.echo(f"   {key}: {value}")
-        else:
-            click.echo("❌ No route found")
+        with RouteManager() as route_manager:
+            if len(targets) == 1:
+                target = targets[0]
+                click.echo(f"Checking route for {target}...")
+                route_info = route_manager.check_route(target)
+                
+                if route_info:
+                    click.echo("✅ Route found:")
+                    for key, value in route_info.items():
+                        click.echo(f"   {key}: {value}")
+                else:
+                    click.echo("❌ No route found")
+                return
             
+            click.echo(f"Checking routes for {len(targets)} targets...")
+            found = 0
+            for target, entry in route_manager.check_routes(targets).items():
+                if entry is None:
+                    click.echo(f"❌ {target}: no route")
+                    continue
+                found += 1
+                via = entry.gateway or 'direct'
+                click.echo(f"✅ {target}: {entry.destination} via {via} dev {entry.interface or '-'}")
+            click.echo(f"📊 {found}/{len(targets)} targets have a route")
+
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+
+
+@routes.command()
+def sync():
+    """Восстановить список активных маршрутов по таблице маршрутизации ОС"""
+    from ..core.route_manager import RouteManager
+    
+    try:
+        with RouteManager() as route_manager:
+            recorded = route_manager.get_active_routes_count()
+            restored = route_manager.rebuild_from_route_table()
+            route_manager.save_routes_cache()
+        click.echo(f"✅ Routes cache synced: {restored} routes in routing table "
+                   f"({recorded} were recorded)")
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
 
@@ -211,11 +364,13 @@ def check(target):
 @click.confirmation_option(prompt='Are you sure you want to clear all routes?')
 def clear():
     """Очистить все маршруты (ОСТОРОЖНО!)"""
+    from ..core.route_manager import RouteManager
+    
     click.echo("⚠️  Clearing all routes...")
     
     try:
-        route_manager = RouteManager()
-        result = route_manager.clear_all_routes()
+        with RouteManager() as route_manager:
+            result = route_manager.clear_all_routes()
         
         if result.success:
             click.echo(f"✅ {result.message}")
@@ -245,72 +400,141 @@ def load_domains_from_file(file_path: Path) -> List[str]:
 @click.option('--ru-only', is_flag=True, help='Обработать только российские домены')
 @click.option('--com-only', is_flag=True, help='Обработать только международные домены')
 @click.option('--dry-run', is_flag=True, help='Показать что будет сделано без выполнения')
-def process(ru_only, com_only, dry_run):
+@click.option('--reconcile', is_flag=True,
+              help='Привести маршруты к желаемому состоянию: добавить недостающие, удалить устаревшие')
+@click.option('--force', is_flag=True, help='Разрешить reconcile удалить большую долю маршрутов')
+def process(ru_only, com_only, dry_run, reconcile, force):
     """Обработать все домены из конфигурационных файлов"""
+    from ..core.domain_processor import load_domain_index
+    from ..core.resolver import DNSResolver
+    from ..core.route_manager import RouteManager
+    from ..utils.metrics import REGISTRY, PhaseTimer, record_run
+    from ..utils.network import aggregate_for_config, build_prefix_tree, filter_covered
     
     if dry_run:
         click.echo("🔍 DRY RUN MODE - команды не будут выполнены")
     
+    # Фазы прогона: каждая отметка относит время с предыдущей к своей фазе
+    timer = PhaseTimer()
+    success = False
+    route_manager = None
     try:
         config = get_config()
         resolver = DNSResolver()
         route_manager = RouteManager()
         
         tasks = []
+        ips_local = load_domains_from_file(config.ips_local_file)
+        ips_vpn = load_domains_from_file(config.ips_vpn_file)
+        
+        # Файлы доменов читаются из скомпилированного индекса (перекомпилируются при изменении)
+        domain_index = load_domain_index(config)
+        if domain_index.compiled:
+            click.echo(f"🗂️  Domain index rebuilt for {domain_index.compiled} changed file(s)")
         
         # Загружаем российские домены
         if not com_only:
-            ru_domains = load_domains_from_file(config.domains_ru_file)
-            if ru_domains:
-                tasks.append(('Russian domains', ru_domains, RouteType.LOCAL))
+            ru_domains = domain_index.domains(RouteType.LOCAL)
+            if ru_domains or ips_local or reconcile:
+                tasks.append(('Russian domains', ru_domains, RouteType.LOCAL, ips_local))
                 click.echo(f"📁 Loaded {len(ru_domains)} Russian domains")
         
         # Загружаем международные домены
         if not ru_only:
-            com_domains = load_domains_from_file(config.domains_com_file)
-            if com_domains:
-                tasks.append(('International domains', com_domains, RouteType.VPN))
+            com_domains = domain_index.domains(RouteType.VPN)
+            if com_domains or ips_vpn or reconcile:
+                tasks.append(('International domains', com_domains, RouteType.VPN, ips_vpn))
                 click.echo(f"📁 Loaded {len(com_domains)} international domains")
         
         if not tasks:
             click.echo("❌ No domains to process")
             return
+        timer.lap('load')
+        
+        # Дерево уже заданных подсетей: списки IP обеих групп и установленные маршруты
+        # (в режиме reconcile установленные маршруты могут быть удалены - не учитываем их)
+        coverage_tree = None
+        if config.skip_covered:
+            prefixes = [(target, RouteType.LOCAL) for target in ips_local]
+            prefixes += [(target, RouteType.VPN) for target in ips_vpn]
+            if not reconcile:
+                interface_types = {config.local_interface.name: RouteType.LOCAL,
+                                   config.vpn_interface.name: RouteType.VPN}
+                for route_key in route_manager.active_routes:
+                    target, _, interface = route_key.rpartition(':')
+                    if interface in interface_types:
+                        prefixes.append((target, interface_types[interface]))
+            coverage_tree = build_prefix_tree(prefixes)
         
         # Обрабатываем каждую группу доменов
-        for group_name, domain_names, route_type in tasks:
+        routes_planned = 0
+        desired = {}
+        for group_name, domains, route_type, group_ips in tasks:
             click.echo(f"\n=== Processing {group_name} ===")
             
-            # Создаем объекты доменов
-            domains = []
-            for domain_name in domain_names:
-                domain = Domain(
-                    name=domain_name,
-                    domain_type=DomainType.EXACT,  # Определится автоматически в __post_init__
-                    route_type=route_type
-                )
-                domains.append(domain)
-            
             if dry_run:
                 click.echo(f"Would resolve {len(domains)} domains and add routes via {route_type.value}")
                 continue
             
             # Резолвим домены
             click.echo(f"🔍 Resolving {len(domains)} domains...")
+            timer.lap('plan')
             results = resolver.resolve_domains(domains)
+            timer.lap('resolve')
             
-            # Собираем все IP для добавления маршрутов
-            all_ips = []
+            # Собираем все IP для добавления маршрутов: списки IP/подсетей группы
+            # и адреса доменов
+            resolved_ips = []
             for result in results:
                 if result.success:
-                    all_ips.extend(result.ips)
+                    resolved_ips.extend(result.ips)
+            resolved_ips = list(dict.fromkeys(resolved_ips))
+            
+            # Адреса внутри подсетей того же типа не требуют своего маршрута
+            if coverage_tree is not None and resolved_ips:
+                coverage = filter_covered(resolved_ips, route_type, coverage_tree)
+                resolved_ips = coverage.targets
+                if coverage.redundant:
+                    click.echo(f"🌳 Skipped {len(coverage.redundant)} addresses already covered by subnet routes")
+                if coverage.conflicts:
+                    click.echo(f"⚠️  {len(coverage.conflicts)} addresses fall into subnets routed via another interface:")
+                    for address, subnet, other_type in coverage.conflicts[:10]:
+                        click.echo(f"   {address} in {subnet} ({other_type.value})")
+            
+            all_ips = group_ips + resolved_ips
             
             if all_ips:
                 # Убираем дубликаты
-                unique_ips = list(set(all_ips))
-                click.echo(f"🛣️  Adding {len(unique_ips)} unique routes...")
+                unique_ips = list(dict.fromkeys(all_ips))
+                targets = unique_ips
+                
+                # Бюджет маршрутов общий на весь прогон
+                if config.route_budget and routes_planned >= config.route_budget:
+                    click.echo(f"⚠️  Route budget of {config.route_budget} exhausted, skipping {group_name}")
+                    continue
+                
+                # Сворачиваем адреса в подсети
+                if config.aggregate_routes or config.route_budget:
+                    aggregation = aggregate_for_config(unique_ips, config, routes_planned)
+                    targets = aggregation.targets
+                    click.echo(f"🧮 Aggregated {len(unique_ips)} addresses into {len(targets)} routes"
+                               f" ({len(aggregation.promoted)} promoted)")
+                    if aggregation.dropped:
+                        click.echo(f"⚠️  Route budget exceeded: {len(aggregation.dropped)} routes skipped")
+                
+                routes_planned += len(targets)
+                
+                if reconcile:
+                    for target in targets:
+                        desired.setdefault(target, route_type)
+                    continue
+                
+                click.echo(f"🛣️  Adding {len(targets)} unique routes...")
                 
                 # Добавляем маршруты
-                route_result = route_manager.add_routes_bulk(unique_ips, route_type)
+                timer.lap('plan')
+                route_result = route_manager.add_routes_bulk(targets, route_type)
+                timer.lap('routes')
                 
                 if route_result.success:
                     click.echo(f"✅ {route_result.message}")
@@ -319,11 +543,196 @@ def process(ru_only, com_only, dry_run):
             else:
                 click.echo("❌ No IPs resolved for routing")
         
+        if reconcile and not dry_run:
+            click.echo(f"\n=== Reconciling routes ===")
+            route_types = [route_type for _, _, route_type, _ in tasks]
+            plan = route_manager.plan_reconcile(desired, route_types)
+            click.echo(f"🧭 Desired {len(desired)} routes: {len(plan.to_add)} to add, "
+                       f"{len(plan.to_remove)} to remove, {plan.unchanged} unchanged")
+            
+            # Защита: сбой DNS не должен снести большую часть маршрутов
+            if not force and plan.exceeds_delete_ratio(config.reconcile_max_delete_ratio):
+                click.echo(f"⚠️  Refusing to remove {len(plan.to_remove)} of {plan.in_scope} routes "
+                           f"(limit {config.reconcile_max_delete_ratio:.0%}), use --force to override")
+                plan.to_remove = []
+            
+            timer.lap('plan')
+            if plan.is_empty:
+                click.echo("✅ Routes already match the desired state")
+            else:
+                route_result = route_manager.apply_reconcile(plan)
+                timer.lap('routes')
+                if route_result.success:
+                    click.echo(f"✅ {route_result.message}")
+                else:
+                    click.echo(f"❌ {route_result.message}")
+                    for error in route_result.errors[:10]:
+                        click.echo(f"   Error: {error}")
+        
+        # Один снимок таблицы вместо route get на каждый маршрут
+        if not dry_run and config.verify_routes and route_manager.get_active_routes_count():
+            try:
+                present, missing = route_manager.verify_routes()
+                click.echo(f"\n🔎 Verified {len(present)}/{len(present) + len(missing)} "
+                           f"routes present in routing table")
+                for route_key in missing[:10]:
+                    click.echo(f"   Missing: {route_key}")
+                if missing:
+                    click.echo("   Run with --reconcile to restore missing routes")
+            except RuntimeError as e:
+                click.echo(f"⚠️  Route verification skipped: {e}")
+            timer.lap('verify')
+        
+        success = True
         click.echo(f"\n✅ Processing complete!")
         
     except Exception as e:
         click.echo(f"❌ Error: {e}", err=True)
         sys.exit(1)
+    finally:
+        if route_manager is not None:
+            route_manager.close()
+            timer.lap('persist')
+        # Метрики прогона для textfile collector (dry run ничего не делал)
+        if not dry_run and route_manager is not None:
+            record_run('process', timer.elapsed, success)
+            if config.metrics_textfile:
+                REGISTRY.write_textfile(config.metrics_textfile)
+
+
+
+@cli.command()
+@click.option('--metrics-port', type=int, help='Порт HTTP /metrics (по умолчанию metrics.port, 0 - выключено)')
+def daemon(metrics_port):
+    """Работать постоянно: обновлять имена по истечении TTL и применять разность маршрутов"""
+    from ..core.daemon import RoutingDaemon
+    
+    click.echo("🔁 Starting DNS routing daemon (SIGHUP reloads domain files, Ctrl+C stops)")
+    
+    try:
+        RoutingDaemon(metrics_port=metrics_port).run()
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--listen', help='Адрес прокси (по умолчанию proxy.listen)')
+@click.option('--port', type=int, help='Порт прокси (по умолчанию proxy.port)')
+@click.option('--upstream', multiple=True, help='Upstream DNS сервер host[:port], можно несколько раз')
+@click.option('--metrics-port', type=int, help='Порт HTTP /metrics (по умолчанию metrics.port, 0 - выключено)')
+def proxy(listen, port, upstream, metrics_port):
+    """
+    Локальный DNS прокси: пересылать запросы upstream и ставить маршруты
+    на адреса ответов для доменов из списков до отдачи ответа клиенту.
+    """
+    from ..core.dns_proxy import DNSProxy
+
+    click.echo("🛰️  Starting DNS routing proxy (SIGHUP reloads domain files, Ctrl+C stops)")
+
+    try:
+        DNSProxy(upstream=list(upstream) or None, listen=listen, port=port,
+                 metrics_port=metrics_port).run()
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('hostnames', nargs=-1)
+@click.option('--summary', is_flag=True, help='Вывести в stderr число имен по классам')
+def classify(hostnames, summary):
+    """
+    Определить класс маршрута для имен (аргументы или по одному в строке stdin).
+    
+    Вывод: имя, local/vpn/none и сработавшее правило через табуляцию.
+    """
+    from ..core.domain_processor import load_domain_index
+    
+    prefixes = {DomainType.EXACT: '', DomainType.WILDCARD: '*.', DomainType.DEEP_WILDCARD: '**.'}
+    
+    try:
+        trie = load_domain_index(get_config()).trie()
+    except Exception as e:
+        click.echo(f"❌ Error: {e}", err=True)
+        sys.exit(1)
+    
+    counts = {'local': 0, 'vpn': 0, 'none': 0}
+    out = sys.stdout
+    lines = []
+    for hostname in (hostnames or sys.stdin):
+        hostname = hostname.strip()
+        if not hostname or hostname.startswith('#'):
+            continue
+        match = trie.lookup(hostname)
+        if match is None:
+            counts['none'] += 1
+            lines.append(f"{hostname}\tnone\t-\n")
+        else:
+            route_type, kind, rule = match
+            counts[route_type.value] += 1
+            lines.append(f"{hostname}\t{route_type.value}\t{prefixes[kind]}{rule}\n")
+        if len(lines) >= 4096:
+            out.write(''.join(lines))
+            lines = []
+    out.write(''.join(lines))
+    out.flush()
+    
+    if summary:
+        click.echo(f"📊 {sum(counts.values())} names: {counts['local']} local, "
+                   f"{counts['vpn']} vpn, {counts['none']} unmatched", err=True)
+
+
+@cli.command()
+@click.option('--sizes', default='1000,10000,100000', show_default=True,
+              help='Размеры синтетических списков доменов через запятую')
+@click.option('--mix', default='exact=0.8,wildcard=0.15,deep=0.05', show_default=True,
+              help='Доли точных, *. и **. записей')
+@click.option('--seed', type=int, default=1, show_default=True, help='Seed генератора доменов')
+@click.option('--nxdomain-rate', type=float, default=0.1, show_default=True,
+              help='Доля несуществующих имен в ответах stub сервера')
+@click.option('--route-latency', type=float, default=0.0, show_default=True,
+              help='Задержка simulator бэкенда на операцию, секунды')
+@click.option('--json', 'json_path', type=click.Path(dir_okay=False),
+              help='Записать результаты в JSON файл (- для stdout)')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='JSON отчет предыдущей версии для сравнения')
+def bench(sizes, mix, seed, nxdomain_rate, route_latency, json_path, baseline):
+    """Бенчмарк конвейера резолвинг -> маршруты на stub DNS и simulator бэкенде"""
+    import json
+    from ..core import benchmark
+    
+    try:
+        size_list = [int(size) for size in sizes.split(',') if size.strip()]
+        domain_mix = benchmark.parse_mix(mix)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    
+    # С --json - отчет в stdout, таблицы уходят в stderr
+    to_stderr = json_path == '-'
+    results = []
+    for size in size_list:
+        click.echo(f"⏱️  Running pipeline benchmark for {size} domains...", err=to_stderr)
+        result = benchmark.run_benchmark(size, domain_mix, seed=seed, nxdomain_rate=nxdomain_rate,
+                                         route_latency=route_latency)
+        results.append(result)
+        for line in benchmark.format_result(result):
+            click.echo(line, err=to_stderr)
+    
+    if baseline:
+        with open(baseline) as f:
+            comparison = benchmark.compare_results(results, json.load(f))
+        click.echo(f"\n📊 Compared with {baseline}:", err=to_stderr)
+        for line in comparison or ["  no matching sizes"]:
+            click.echo(line, err=to_stderr)
+    
+    if json_path:
+        report = json.dumps({**benchmark.environment_info(), 'results': results}, indent=2)
+        if to_stderr:
+            click.echo(report)
+        else:
+            Path(json_path).write_text(report + "\n")
+            click.echo(f"💾 Results saved to {json_path}")
 
 
 if __name__ == '__main__':
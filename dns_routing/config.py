@@ -2,11 +2,10 @@
 Загрузчик конфигурации для DNS Routing Manager.
 Использует YAML для читаемости и singleton для единого экземпляра.
 """
-import yaml
 import os
 from pathlib import Path
 from typing import Optional
-from .models import RoutingConfig, NetworkInterface
+from .models import DEFAULT_PROBE_CANDIDATES, RoutingConfig, NetworkInterface
 
 
 class ConfigLoader:
@@ -16,6 +15,7 @@ class ConfigLoader:
     """
     _instance: Optional['ConfigLoader'] = None
     _config: Optional[RoutingConfig] = None
+    config_file: Optional[Path] = None
     
     def __new__(cls) -> 'ConfigLoader':
         """Singleton паттерн"""
@@ -65,8 +65,12 @@ class ConfigLoader:
         config_file = self._find_config_file()
         
         try:
+            # yaml импортируется здесь: --help и команды без конфигурации его не ждут
+            import yaml
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
             with open(config_file, 'r') as f:
-                yaml_data = yaml.safe_load(f)
+                yaml_data = yaml.load(f, Loader=loader)
+            self.config_file = config_file
             
             # Преобразуем относительные пути в абсолютные
             base_dir = config_file.parent.parent
@@ -87,6 +91,17 @@ class ConfigLoader:
                 is_tunnel=vpn_net.get('is_tunnel', True)
             )
             
+            # Необязательные секции
+            performance = yaml_data.get('performance') or {}
+            routing = yaml_data.get('routing') or {}
+            daemon = yaml_data.get('daemon') or {}
+            proxy = yaml_data.get('proxy') or {}
+            probing = yaml_data.get('probing') or {}
+            metrics = yaml_data.get('metrics') or {}
+            simulator = routing.get('simulator') or {}
+            netlink = routing.get('netlink') or {}
+            security = yaml_data.get('security') or {}
+            
             # Создаем конфигурацию
             self._config = RoutingConfig(
                 local_interface=local_interface,
@@ -100,11 +115,62 @@ class ConfigLoader:
                 log_file=base_dir / yaml_data['paths']['log_file'],
                 dns_timeout=yaml_data['dns']['timeout'],
                 dns_retries=yaml_data['dns']['retries'],
-                cache_ttl_hours=yaml_data['cache']['ttl_hours']
+                dns_servers=list(yaml_data['dns'].get('servers') or []),
+                dns_backend=yaml_data['dns'].get('backend', 'native'),
+                dns_hedge=yaml_data['dns'].get('hedge', True),
+                dns_hedge_delay=yaml_data['dns'].get('hedge_delay', 0.3),
+                dns_hedge_min_delay=yaml_data['dns'].get('hedge_min_delay', 0.02),
+                dns_verbose=yaml_data['dns'].get('verbose', False),
+                cache_ttl_hours=yaml_data['cache']['ttl_hours'],
+                cache_min_ttl=yaml_data['cache'].get('min_ttl', 60),
+                cache_max_ttl=yaml_data['cache'].get('max_ttl', 86400),
+                cache_max_entries=yaml_data['cache'].get('max_entries', 20000),
+                negative_ttl=yaml_data['cache'].get('negative_ttl', 300),
+                negative_max_ttl=yaml_data['cache'].get('negative_max_ttl', 3600),
+                timeout_backoff=yaml_data['cache'].get('timeout_backoff', 60),
+                timeout_backoff_max=yaml_data['cache'].get('timeout_backoff_max', 6 * 3600),
+                cache_flush_every=yaml_data['cache'].get('flush_every', 500),
+                cache_flush_interval=yaml_data['cache'].get('flush_interval', 5.0),
+                parallel_resolve=performance.get('parallel_resolve', True),
+                max_workers=performance.get('max_workers', 10),
+                batch_size=performance.get('batch_size', 50),
+                max_inflight=performance.get('max_inflight', 1000),
+                aggregate_routes=routing.get('aggregate', True),
+                promote_prefix=routing.get('promote_prefix', 24),
+                promote_min_hosts=routing.get('promote_min_hosts', 0),
+                route_budget=routing.get('route_budget', 0),
+                budget_min_prefix=routing.get('budget_min_prefix', 16),
+                route_backend=routing.get('backend', 'auto'),
+                netlink_table=netlink.get('table', 254),
+                netlink_rule_priority=netlink.get('rule_priority', 0),
+                simulator_latency=simulator.get('latency', 0.0),
+                simulator_failure_rate=simulator.get('failure_rate', 0.0),
+                use_route_helper=routing.get('helper', True),
+                reconcile_max_delete_ratio=routing.get('reconcile_max_delete_ratio', 0.5),
+                skip_covered=routing.get('skip_covered', True),
+                verify_routes=routing.get('verify', True),
+                daemon_min_refresh=daemon.get('min_refresh', 30),
+                daemon_max_batch=daemon.get('max_batch', 500),
+                daemon_max_sleep=daemon.get('max_sleep', 60),
+                proxy_listen=proxy.get('listen', "127.0.0.1"),
+                proxy_port=proxy.get('port', 53),
+                proxy_upstream=proxy.get('upstream') or [],
+                proxy_timeout=proxy.get('timeout', 2.0),
+                proxy_cache_size=proxy.get('cache_size', 10000),
+                proxy_route_wait=proxy.get('route_wait', 1.0),
+                proxy_stats_interval=proxy.get('stats_interval', 300),
+                probe_candidates=probing.get('candidates') or list(DEFAULT_PROBE_CANDIDATES),
+                probe_zones={zone.lower().rstrip('.'): labels
+                             for zone, labels in (probing.get('zones') or {}).items()},
+                probe_prune_after=probing.get('prune_after', 3),
+                probe_reprobe_days=probing.get('reprobe_days', 30),
+                probe_detect_wildcard=probing.get('detect_wildcard', True),
+                metrics_textfile=base_dir / metrics['textfile'] if metrics.get('textfile') else None,
+                metrics_listen=metrics.get('listen', "127.0.0.1"),
+                metrics_port=metrics.get('port', 0),
+                require_sudo=security.get('require_sudo', True)
             )
             
-            print(f"Configuration loaded from: {config_file}")
-            
         except Exception as e:
             raise RuntimeError(f"Failed to load configuration: {e}")
     
@@ -115,6 +181,12 @@ class ConfigLoader:
             self._load_config()
         return self._config
     
+    @classmethod
+    def reset(cls) -> None:
+        """Забывает загруженную конфигурацию: следующий доступ перечитает файл"""
+        if cls._instance is not None:
+            cls._instance._config = None
+    
     def reload(self) -> None:
         """Перезагружает конфигурацию"""
         self._config = None
@@ -0,0 +1,465 @@
+"""
+Воспроизводимый бенчмарк конвейера резолвинг -> маршруты.
+
+Генерирует синтетический список доменов (смесь точных, *. и **. записей),
+отвечает на запросы локальным stub DNS сервером и ставит маршруты в
+таблицу simulator бэкенда. Все файлы, кэш и настройки живут во временной
+директории, реальные DNS серверы и таблица маршрутов ОС не затрагиваются.
+
+Фазы одного прогона:
+    expand        - разбор строк доменов и wildcard расширение (на домен)
+    resolve_cold  - резолвинг всех имен с пустым кэшем (на имя)
+    cache_load    - загрузка сохраненного кэша новым резолвером
+    resolve_warm  - повторный резолвинг тех же имен из кэша (на имя)
+    plan          - отсев покрытых подсетями адресов и свертка маршрутов
+    apply         - установка маршрутов бэкендом (на операцию)
+
+Stub сервер работает в потоке того же процесса, поэтому время cold фазы
+включает и его обработку запросов, а задержка имени - ожидание в очереди
+max_inflight. Peak RSS - максимум процесса за все
+время работы (ru_maxrss), при нескольких размерах он не уменьшается.
+"""
+import contextlib
+import ipaddress
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import yaml
+
+from ..config import ConfigLoader
+from ..models import Domain, DomainType, Route, RouteType
+from ..utils.dns_wire import DNSRecord, QTYPE_A, RCODE_NOERROR
+from ..utils.network import aggregate_targets, build_prefix_tree, filter_covered
+from ..utils.stub_dns import StubDNSServer
+from .resolver import DNSResolver
+from .route_backend import SimulatorRouteBackend
+from .route_manager import RouteManager
+
+
+# Смесь по умолчанию: доля точных, *. и **. записей
+DEFAULT_MIX = {
+    DomainType.EXACT: 0.8,
+    DomainType.WILDCARD: 0.15,
+    DomainType.DEEP_WILDCARD: 0.05,
+}
+
+_MIX_PREFIXES = {
+    DomainType.EXACT: '',
+    DomainType.WILDCARD: '*.',
+    DomainType.DEEP_WILDCARD: '**.',
+}
+
+_TLDS = ['com', 'net', 'org', 'ru', 'io', 'dev']
+
+# Адреса ответов - из сети для тестирования (RFC 2544)
+_ANSWER_NETWORK = ipaddress.IPv4Network('198.18.0.0/15')
+
+# Подсети из ips_*.txt: часть ответов попадает в них и отсеивается фазой plan
+_COVERING_SUBNETS = {
+    RouteType.LOCAL: ['198.18.0.0/20'],
+    RouteType.VPN: ['198.19.0.0/20'],
+}
+
+PHASES = ['expand', 'resolve_cold', 'cache_load', 'resolve_warm', 'plan', 'apply']
+
+
+def parse_mix(text: str) -> Dict[DomainType, float]:
+    """
+    Разбирает смесь вида 'exact=0.8,wildcard=0.15,deep=0.05'.
+    Доли нормируются, пропущенные типы считаются нулевыми.
+    """
+    names = {'exact': DomainType.EXACT, 'wildcard': DomainType.WILDCARD,
+             'deep': DomainType.DEEP_WILDCARD}
+    mix = {domain_type: 0.0 for domain_type in names.values()}
+    for part in text.split(','):
+        key, sep, value = part.strip().partition('=')
+        if not sep or key not in names:
+            raise ValueError(f"Invalid mix entry '{part}', expected exact=, wildcard= or deep=")
+        mix[names[key]] = float(value)
+
+    total = sum(mix.values())
+    if total <= 0 or any(share < 0 for share in mix.values()):
+        raise ValueError(f"Invalid mix '{text}': shares must be non-negative and not all zero")
+    return {domain_type: share / total for domain_type, share in mix.items()}
+
+
+def format_mix(mix: Dict[DomainType, float]) -> str:
+    names = {DomainType.EXACT: 'exact', DomainType.WILDCARD: 'wildcard',
+             DomainType.DEEP_WILDCARD: 'deep'}
+    return ','.join(f"{names[domain_type]}={share:g}" for domain_type, share in mix.items())
+
+
+def generate_domains(count: int, mix: Optional[Dict[DomainType, float]] = None,
+                     seed: int = 1) -> List[str]:
+    """Синтетический список доменов: одинаковый для одинаковых count, mix и seed"""
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    types = list(mix)
+    weights = [mix[domain_type] for domain_type in types]
+
+    domains = []
+    for index, domain_type in enumerate(rng.choices(types, weights, k=count)):
+        name = f"site{index}-{rng.getrandbits(24):06x}.{rng.choice(_TLDS)}"
+        domains.append(_MIX_PREFIXES[domain_type] + name)
+    return domains
+
+
+def make_stub_handler(nxdomain_rate: float = 0.1, ttl: int = 300):
+    """
+    Обработчик stub сервера: детерминированный A адрес из хэша имени,
+    доля имен (nxdomain_rate) не существует.
+    """
+    base = int(_ANSWER_NETWORK.network_address)
+    size = _ANSWER_NETWORK.num_addresses
+    threshold = int(nxdomain_rate * 0x10000)
+
+    def handler(qname: str, qtype: int):
+        digest = zlib.crc32(qname.encode())
+        if (digest & 0xFFFF) < threshold:
+            return None
+        if qtype != QTYPE_A:
+            return RCODE_NOERROR, []
+        address = str(ipaddress.IPv4Address(base + (digest >> 7) % size))
+        return RCODE_NOERROR, [DNSRecord(name=qname, rtype=QTYPE_A, ttl=ttl, data=address)]
+
+    return handler
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 в миллисекундах (ближайший ранг)"""
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        f"p{q}_ms": round(ordered[min(last, int(q / 100 * len(ordered)))] * 1000, 4)
+        for q in (50, 95, 99)
+    }
+
+
+def peak_rss_mb() -> float:
+    """Максимальный RSS процесса (ru_maxrss - КБ на Linux, байты на macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class _TimedSimulatorBackend(SimulatorRouteBackend):
+    """Simulator, запоминающий длительность каждой операции"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.samples: List[float] = []
+
+    def add(self, route: Route) -> Tuple[bool, str]:
+        began = time.perf_counter()
+        try:
+            return super().add(route)
+        finally:
+            self.samples.append(time.perf_counter() - began)
+
+    def delete(self, route: Route) -> Tuple[bool, str]:
+        began = time.perf_counter()
+        try:
+            return super().delete(route)
+        finally:
+            self.samples.append(time.perf_counter() - began)
+
+
+class _PhaseTimer:
+    """Накопитель времени и поэлементных замеров по фазам"""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.samples: Dict[str, List[float]] = {}
+        self.items: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str, items: int = 0) -> Iterator[List[float]]:
+        samples = self.samples.setdefault(name, [])
+        began = time.perf_counter()
+        try:
+            yield samples
+        finally:
+            self.totals[name] = self.totals.get(name, 0.0) + time.perf_counter() - began
+            self.items[name] = self.items.get(name, 0) + items
+
+    def report(self) -> Dict[str, Dict]:
+        report = {}
+        for name in PHASES:
+            if name not in self.totals:
+                continue
+            total = self.totals[name]
+            items = self.items[name]
+            report[name] = {
+                'total_s': round(total, 4),
+                'items': items,
+                'items_per_s': round(items / total, 1) if items and total else None,
+                **percentiles(self.samples[name]),
+            }
+        return report
+
+
+def _write_settings(workdir: Path, dns_port: int, route_latency: float) -> Path:
+    """Настройки изолированного прогона: stub DNS, simulator, кэш без ограничения размера"""
+    config_dir = workdir / "config"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    settings = {
+        'network': {
+            'local': {'interface': 'bench0', 'gateway': '192.0.2.1', 'is_tunnel': False},
+            'vpn': {'interface': 'benchtun0', 'gateway': None, 'is_tunnel': True},
+        },
+        'files': {
+            'domains': {'ru': 'config/domains_ru.txt', 'com': 'config/domains_com.txt'},
+            'ips': {'local': 'config/ips_local.txt', 'vpn': 'config/ips_vpn.txt'},
+        },
+        'paths': {
+            'cache_dir': 'data/cache',
+            'routes_cache': 'data/routes.json',
+            'log_file': 'logs/dns_routing.log',
+        },
+        'dns': {
+            'timeout': 2,
+            'retries': 2,
+            'backend': 'native',
+            'servers': [f"127.0.0.1:{dns_port}"],
+        },
+        'cache': {'ttl_hours': 24, 'max_entries': 0},
+        'routing': {
+            'backend': 'simulator',
+            'simulator': {'latency': route_latency},
+            'helper': False,
+            'verify': False,
+        },
+        'security': {'require_sudo': False},
+        'performance': {'max_inflight': 256},
+    }
+    path = config_dir / "settings.yaml"
+    with open(path, 'w') as f:
+        yaml.safe_dump(settings, f, sort_keys=False)
+    return path
+
+
+@contextlib.contextmanager
+def _isolated_config(settings_path: Path) -> Iterator[None]:
+    """Временно подменяет глобальную конфигурацию настройками прогона"""
+    previous = os.environ.get('DNS_ROUTING_CONFIG')
+    os.environ['DNS_ROUTING_CONFIG'] = str(settings_path)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            ConfigLoader.reset()
+            ConfigLoader()
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('DNS_ROUTING_CONFIG', None)
+        else:
+            os.environ['DNS_ROUTING_CONFIG'] = previous
+        # Следующий get_config() перечитает настройки пользователя
+        ConfigLoader.reset()
+
+
+def _run_pipeline(domain_lines: List[str], timer: _PhaseTimer) -> Dict:
+    """Один прогон конвейера в уже подготовленной конфигурации"""
+    half = len(domain_lines) // 2
+    groups = [
+        (RouteType.LOCAL, domain_lines[:half]),
+        (RouteType.VPN, domain_lines[half:]),
+    ]
+
+    # expand: строки файла -> Domain -> имена для резолвинга
+    resolver = DNSResolver()
+    expansions: List[Tuple[RouteType, List[str]]] = []
+    with timer.phase('expand', items=len(domain_lines)) as samples:
+        for route_type, lines in groups:
+            names = []
+            for line in lines:
+                began = time.perf_counter()
+                domain = Domain(name=line, domain_type=DomainType.EXACT, route_type=route_type)
+                names.extend(resolver.expand_domain(domain))
+                samples.append(time.perf_counter() - began)
+            expansions.append((route_type, names))
+
+    all_names = list(dict.fromkeys(name for _, names in expansions for name in names))
+
+    with timer.phase('resolve_cold', items=len(all_names)) as samples:
+        # Имена всех расширений с повторами: их схлопывает single-flight резолвера
+        outcomes = resolver.resolve_names([name for _, names in expansions for name in names])
+        samples.extend(elapsed for _, _, elapsed in outcomes.values())
+    cold_stats = resolver.cache.get_stats()
+    deduplicated = resolver.deduplicated
+    resolved = sum(1 for ips, _, _ in outcomes.values() if ips)
+
+    # Новый резолвер читает кэш, сохраненный холодным прогоном
+    with timer.phase('cache_load'):
+        resolver = DNSResolver()
+
+    with timer.phase('resolve_warm', items=len(all_names)) as samples:
+        for name in all_names:
+            began = time.perf_counter()
+            resolver.resolve_names([name])
+            samples.append(time.perf_counter() - began)
+    warm_stats = resolver.cache.get_stats()
+
+    # plan: как desired_routes демона - покрытие подсетями, свертка,
+    # при совпадении цели в обеих группах побеждает LOCAL
+    with timer.phase('plan', items=len(all_names)):
+        tree = build_prefix_tree((subnet, route_type)
+                                 for route_type, subnets in _COVERING_SUBNETS.items()
+                                 for subnet in subnets)
+        desired: Dict[str, RouteType] = {}
+        covered = 0
+        for route_type, names in expansions:
+            addresses = list(dict.fromkeys(ip for name in names for ip in outcomes[name][0]))
+            coverage = filter_covered(addresses, route_type, tree)
+            covered += len(coverage.redundant)
+            for target in aggregate_targets(_COVERING_SUBNETS[route_type] + coverage.targets).targets:
+                desired.setdefault(target, route_type)
+        planned = [(route_type, [target for target, desired_type in desired.items()
+                                 if desired_type == route_type])
+                   for route_type, _ in groups]
+
+    backend = _TimedSimulatorBackend(latency=resolver.config.simulator_latency)
+    with RouteManager(backend=backend) as route_manager:
+        with timer.phase('apply', items=sum(len(targets) for _, targets in planned)) as samples:
+            errors = 0
+            for route_type, targets in planned:
+                errors += len(route_manager.add_routes_bulk(targets, route_type).errors)
+            samples.extend(backend.samples)
+        installed = len(backend.table)
+
+    return {
+        'names': len(all_names),
+        'resolved_names': resolved,
+        'cache': {
+            'cold_hit_rate': round(cold_stats['hit_rate'], 4),
+            'warm_hit_rate': round(warm_stats['hit_rate'], 4),
+            'warm_hits': warm_stats['hits'],
+            'warm_misses': warm_stats['misses'] + warm_stats['stale'],
+            'negative_hits': resolver.negative_hits,
+            'deduplicated': deduplicated,
+            'entries': len(resolver.cache),
+        },
+        'routes': {
+            'covered_addresses': covered,
+            'planned': sum(len(targets) for _, targets in planned),
+            'installed': installed,
+            'errors': errors,
+        },
+    }
+
+
+def run_benchmark(size: int, mix: Optional[Dict[DomainType, float]] = None, seed: int = 1,
+                  nxdomain_rate: float = 0.1, route_latency: float = 0.0,
+                  workdir: Optional[Path] = None) -> Dict:
+    """
+    Прогоняет конвейер на size синтетических доменах.
+    Возвращает словарь с результатами (сериализуется в JSON как есть).
+    """
+    mix = mix or DEFAULT_MIX
+    domain_lines = generate_domains(size, mix, seed)
+
+    server = StubDNSServer(handler=make_stub_handler(nxdomain_rate))
+    port = server.start_in_thread()
+    timer = _PhaseTimer()
+
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="dns-routing-bench-")))
+        stack.callback(server.stop)
+        stack.enter_context(_isolated_config(_write_settings(workdir, port, route_latency)))
+
+        # Резолвер и менеджер маршрутов печатают каждое имя и маршрут - вывод глушим
+        devnull = stack.enter_context(open(os.devnull, 'w'))
+        stack.enter_context(contextlib.redirect_stdout(devnull))
+
+        began = time.perf_counter()
+        result = _run_pipeline(domain_lines, timer)
+        wall = time.perf_counter() - began
+
+    phases = timer.report()
+    cold_total = sum(phases[name]['total_s'] for name in ('expand', 'resolve_cold', 'plan', 'apply'))
+    warm_total = sum(phases[name]['total_s'] for name in ('expand', 'resolve_warm', 'plan'))
+    return {
+        'size': size,
+        'mix': format_mix(mix),
+        'seed': seed,
+        'nxdomain_rate': nxdomain_rate,
+        'wall_s': round(wall, 4),
+        'domains_per_s': round(size / cold_total, 1) if cold_total else None,
+        'warm_domains_per_s': round(size / warm_total, 1) if warm_total else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'phases': phases,
+        **result,
+    }
+
+
+def environment_info() -> Dict:
+    """Версии и платформа - чтобы сравнивать только сопоставимые прогоны"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        commit = ''
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def format_result(result: Dict) -> List[str]:
+    """Таблица фаз одного прогона для вывода в терминал"""
+    lines = [
+        f"size {result['size']} ({result['mix']}): {result['names']} names, "
+        f"{result['domains_per_s']} domains/s cold, {result['warm_domains_per_s']} domains/s warm, "
+        f"peak RSS {result['peak_rss_mb']} MB",
+        f"  {'phase':<14}{'total s':>10}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for name, phase in result['phases'].items():
+        cells = [phase['items_per_s'], phase['p50_ms'], phase['p95_ms'], phase['p99_ms']]
+        cells = ['-' if value is None else f"{value:g}" for value in cells]
+        lines.append(f"  {name:<14}{phase['total_s']:>10.3f}{cells[0]:>12}"
+                     f"{cells[1]:>10}{cells[2]:>10}{cells[3]:>10}")
+
+    cache, routes = result['cache'], result['routes']
+    lines.append(f"  cache: warm hit rate {cache['warm_hit_rate']:.1%}, "
+                 f"{cache['negative_hits']} negative hits, {cache['entries']} entries, "
+                 f"{cache.get('deduplicated', 0)} duplicate lookups shared")
+    lines.append(f"  routes: {routes['installed']}/{routes['planned']} installed, "
+                 f"{routes['covered_addresses']} covered addresses skipped, {routes['errors']} errors")
+    return lines
+
+
+def compare_results(results: List[Dict], baseline: Dict) -> List[str]:
+    """Сравнение с сохраненным JSON отчетом по совпадающим размерам и смеси"""
+    previous = {(row['size'], row['mix']): row for row in baseline.get('results', [])}
+    lines = []
+    for result in results:
+        old = previous.get((result['size'], result['mix']))
+        if old is None:
+            continue
+        lines.append(f"size {result['size']}: domains/s {old['domains_per_s']} -> {result['domains_per_s']} "
+                     f"({_change(old['domains_per_s'], result['domains_per_s'])}), "
+                     f"peak RSS {old['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for name, phase in result['phases'].items():
+            old_phase = old['phases'].get(name)
+            if old_phase is not None:
+                lines.append(f"  {name:<14}{old_phase['total_s']:>10.3f} -> {phase['total_s']:<10.3f}"
+                             f"({_change(old_phase['total_s'], phase['total_s'])})")
+    return lines
+
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return 'n/a'
+    return f"{(new - old) / old:+.1%}"
@@ -0,0 +1,315 @@
+"""
+Демон DNS Routing Manager.
+
+Держит конфигурацию, DNS кэш и состояние маршрутов в памяти и
+перерезолвит каждое имя только по истечении его записи в кэше.
+Очередь обновлений - min-heap по времени истечения; изменения адресов
+применяются к маршрутам инкрементально (только разность).
+
+Метрики шагов (фазы resolve/plan/routes) пишутся в metrics.textfile
+после каждого шага с работой и отдаются по HTTP на metrics.port.
+
+Сигналы:
+    SIGHUP          - перечитать файлы доменов и списки IP
+    SIGTERM/SIGINT  - сохранить кэш и завершиться
+"""
+import heapq
+import signal
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import get_config
+from ..models import OperationResult, RouteType
+from ..utils.dns_wire import normalize_name
+from ..utils.metrics import REGISTRY, PhaseTimer, record_run, start_http_server
+from ..utils.network import aggregate_for_config, build_prefix_tree, filter_covered
+from .domain_processor import load_domain_index
+from .resolver import DNSResolver
+from .route_manager import RouteManager
+
+
+# Неудачи, при которых сохраняются последние известные адреса имени
+_TRANSIENT_FAILURES = ('timeout', 'servfail', 'error')
+
+
+def _read_list_file(file_path) -> List[str]:
+    """Строки файла без пустых и комментариев"""
+    if not file_path.exists():
+        return []
+    return [line.strip() for line in file_path.read_text().splitlines()
+            if line.strip() and not line.strip().startswith('#')]
+
+
+class RoutingDaemon:
+    """
+    Планировщик обновлений по истечению TTL.
+
+    Каждое имя (после wildcard расширения) стоит в куче со временем
+    следующего обновления. На каждом шаге резолвятся только наступившие
+    имена; если адреса изменились, желаемое состояние пересчитывается и
+    применяется через plan_reconcile/apply_reconcile.
+    """
+
+    def __init__(self, resolver: Optional[DNSResolver] = None,
+                 route_manager: Optional[RouteManager] = None,
+                 metrics_port: Optional[int] = None):
+        self.config = get_config()
+        self.resolver = resolver or DNSResolver()
+        self.route_manager = route_manager or RouteManager()
+        self.metrics_port = self.config.metrics_port if metrics_port is None else metrics_port
+
+        self.ip_lists: Dict[RouteType, List[str]] = {}
+        self.name_types: Dict[str, Set[RouteType]] = {}
+        self.name_ips: Dict[str, List[str]] = {}
+
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._wakeup = threading.Event()
+        self._reload_requested = False
+        self._stop_requested = False
+
+        # Счетчики за время работы
+        self.refreshed = 0
+        self.changed = 0
+        self.route_syncs = 0
+
+    # --- Домены ---
+
+    def load_domains(self) -> None:
+        """Читает файлы доменов (через индекс) и списки IP, ставит новые имена в очередь"""
+        groups = [
+            (RouteType.LOCAL, self.config.ips_local_file),
+            (RouteType.VPN, self.config.ips_vpn_file),
+        ]
+
+        domain_index = load_domain_index(self.config)
+        name_types: Dict[str, Set[RouteType]] = {}
+        for route_type, ips_file in groups:
+            self.ip_lists[route_type] = _read_list_file(ips_file)
+            for domain in domain_index.domains(route_type):
+                for name in self.resolver.expand_domain(domain):
+                    name_types.setdefault(name, set()).add(route_type)
+
+        now = time.time()
+        for name in name_types:
+            if name not in self._due:
+                self._schedule(name, self._initial_due(name, now))
+
+        # Удаленные из файлов имена выпадают из состояния; их элементы кучи устареют
+        for name in list(self._due):
+            if name not in name_types:
+                del self._due[name]
+                self.name_ips.pop(name, None)
+
+        self.name_types = name_types
+        print(f"Daemon: tracking {len(name_types)} names, "
+              f"{sum(len(ips) for ips in self.ip_lists.values())} IP list entries")
+
+    def _initial_due(self, name: str, now: float) -> float:
+        """Действующая запись кэша дает адреса сразу и откладывает резолвинг до ее истечения"""
+        entry = self.resolver.cache.get(normalize_name(name))
+        if entry is None or entry['expires'] <= now:
+            return now
+        if not entry.get('negative'):
+            self.name_ips[name] = entry['ips']
+        return entry['expires']
+
+    # --- Очередь ---
+
+    def _schedule(self, name: str, due: float) -> None:
+        self._due[name] = due
+        heapq.heappush(self._heap, (due, name))
+
+    def _pop_due(self, now: float, limit: int) -> List[str]:
+        """Имена, время обновления которых наступило (не больше limit)"""
+        names = []
+        while self._heap and len(names) < limit:
+            due, name = self._heap[0]
+            if self._due.get(name) != due:
+                # Имя удалено или перепланировано
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            names.append(name)
+        return names
+
+    def next_due(self) -> Optional[float]:
+        """Время ближайшего обновления"""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # --- Обновление ---
+
+    def refresh(self, names: List[str]) -> bool:
+        """
+        Резолвит имена и перепланирует их по новому времени истечения.
+        Возвращает True, если адреса хотя бы одного имени изменились.
+        """
+        if not names:
+            return False
+
+        timer = PhaseTimer()
+        outcomes = self.resolver.resolve_names(names)
+        self.resolver.cache.flush()
+
+        now = time.time()
+        changed = False
+        for name in names:
+            ips, _, _ = outcomes.get(name, ([], None, 0.0))
+            entry = self.resolver.cache.get(normalize_name(name)) or {}
+
+            # Временный сбой DNS не должен снимать маршруты - держим прежние адреса
+            if entry.get('negative') not in _TRANSIENT_FAILURES:
+                new_ips = sorted(ips)
+                if new_ips != sorted(self.name_ips.get(name, [])):
+                    changed = True
+                    self.changed += 1
+                if new_ips:
+                    self.name_ips[name] = new_ips
+                else:
+                    self.name_ips.pop(name, None)
+
+            expires = entry.get('expires', now + self.config.negative_ttl)
+            self._schedule(name, max(expires, now + self.config.daemon_min_refresh))
+
+        self.refreshed += len(names)
+        timer.lap('resolve')
+        return changed
+
+    def desired_routes(self) -> Dict[str, RouteType]:
+        """
+        Желаемые маршруты: списки IP плюс адреса имен, без адресов,
+        уже покрытых подсетями того же типа, со сверткой в подсети
+        по тем же настройкам и бюджету, что и в process.
+        LOCAL обрабатывается первым и побеждает при совпадении цели.
+        """
+        tree = None
+        if self.config.skip_covered:
+            tree = build_prefix_tree((target, route_type)
+                                     for route_type, targets in self.ip_lists.items()
+                                     for target in targets)
+
+        desired: Dict[str, RouteType] = {}
+        routes_planned = 0
+        for route_type in (RouteType.LOCAL, RouteType.VPN):
+            resolved = list(dict.fromkeys(
+                ip for name, ips in self.name_ips.items()
+                if route_type in self.name_types.get(name, ())
+                for ip in ips
+            ))
+            if tree is not None:
+                resolved = filter_covered(resolved, route_type, tree).targets
+
+            targets = list(dict.fromkeys(self.ip_lists.get(route_type, []) + resolved))
+            targets = aggregate_for_config(targets, self.config, routes_planned).targets
+            routes_planned += len(targets)
+
+            for target in targets:
+                desired.setdefault(target, route_type)
+        return desired
+
+    def sync_routes(self) -> OperationResult:
+        """Применяет разность между желаемыми и установленными маршрутами"""
+        timer = PhaseTimer()
+        plan = self.route_manager.plan_reconcile(self.desired_routes(),
+                                                 [RouteType.LOCAL, RouteType.VPN])
+        self.route_syncs += 1
+
+        # Та же защита, что и в process --reconcile
+        if plan.exceeds_delete_ratio(self.config.reconcile_max_delete_ratio):
+            print(f"Daemon: refusing to remove {len(plan.to_remove)} of {plan.in_scope} routes")
+            plan.to_remove = []
+
+        timer.lap('plan')
+        if plan.is_empty:
+            return OperationResult(success=True, message="Routes up to date", affected_routes=[])
+
+        result = self.route_manager.apply_reconcile(plan)
+        timer.lap('routes')
+        print(f"Daemon: {result.message}")
+        for error in result.errors[:10]:
+            print(f"  Error: {error}")
+        return result
+
+    def run_once(self, now: Optional[float] = None) -> bool:
+        """Один шаг: обновить наступившие имена и, если нужно, маршруты"""
+        now = time.time() if now is None else now
+        names = self._pop_due(now, self.config.daemon_max_batch)
+        if not names:
+            return False
+        started = time.perf_counter()
+        success = True
+        try:
+            if not self.refresh(names):
+                return False
+            success = self.sync_routes().success
+            return True
+        finally:
+            self._export_metrics(time.perf_counter() - started, success)
+
+    def _export_metrics(self, duration: float, success: bool) -> None:
+        """Отмечает шаг в метриках и обновляет textfile"""
+        record_run('daemon', duration, success)
+        if self.config.metrics_textfile:
+            REGISTRY.write_textfile(self.config.metrics_textfile)
+
+    # --- Основной цикл ---
+
+    def _handle_reload(self, signum, frame) -> None:
+        self._reload_requested = True
+        self._wakeup.set()
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stop_requested = True
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        self._stop_requested = True
+        self._wakeup.set()
+
+    def run(self) -> None:
+        """Работает до SIGTERM/SIGINT или stop()"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, self._handle_reload)
+            signal.signal(signal.SIGTERM, self._handle_stop)
+            signal.signal(signal.SIGINT, self._handle_stop)
+
+        metrics_server = None
+        if self.metrics_port:
+            metrics_server = start_http_server(self.metrics_port, self.config.metrics_listen)
+            print(f"Daemon metrics on http://{self.config.metrics_listen}:"
+                  f"{metrics_server.server_port}/metrics")
+
+        started = time.perf_counter()
+        self.load_domains()
+        self.refresh(self._pop_due(time.time(), len(self._due)))
+        self._export_metrics(time.perf_counter() - started, self.sync_routes().success)
+        print(f"Daemon started: {self.route_manager.get_active_routes_count()} routes active")
+
+        try:
+            while not self._stop_requested:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    print("Daemon: reloading domain files")
+                    self.load_domains()
+                    self.sync_routes()
+
+                self.run_once()
+
+                next_due = self.next_due()
+                timeout = self.config.daemon_max_sleep
+                if next_due is not None:
+                    timeout = min(timeout, max(0.0, next_due - time.time()))
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+        finally:
+            self.resolver.cache.flush()
+            self.route_manager.close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            print(f"Daemon stopped: {self.refreshed} names refreshed, "
+                  f"{self.changed} changed, {self.route_syncs} route syncs")
@@ -0,0 +1,359 @@
+"""
+Хранилище DNS кэша для DNS Routing Manager.
+Записи живут в памяти, на диск попадают отложенно и пакетами:
+изменения дописываются в журнал, который периодически сворачивается
+в компактный снимок с атомарной заменой файла.
+"""
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..utils.metrics import REGISTRY
+from ..utils.stats_file import update_stats
+
+
+# Компактная сериализация без отступов и лишних пробелов
+_dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+_LOOKUPS = REGISTRY.counter('dns_routing_dns_cache_lookups_total',
+                            'DNS cache lookups by result (hit, miss, stale)', ['result'])
+_CACHE_HIT = _LOOKUPS.labels('hit')
+_CACHE_MISS = _LOOKUPS.labels('miss')
+_CACHE_STALE = _LOOKUPS.labels('stale')
+_EVICTIONS = REGISTRY.counter('dns_routing_dns_cache_evictions_total',
+                              'DNS cache entries evicted on overflow', ['reason'])
+_ENTRIES = REGISTRY.gauge('dns_routing_dns_cache_entries', 'DNS cache entries in memory')
+
+
+class DNSCache:
+    """
+    Кэш DNS записей с отслеживанием изменений.
+
+    Файлы:
+        dns_cache.json          - снимок всех записей
+        dns_cache.json.journal  - изменения после снимка, по одной JSON строке
+                                  ["имя", запись] (запись null - удаление)
+
+    Сброс на диск происходит каждые flush_every изменений, раз в
+    flush_interval секунд и явно через flush() в конце прогона.
+    Журнал сворачивается в снимок, когда становится длиннее самого кэша,
+    поэтому стоимость записи на одно изменение не растет с размером кэша.
+
+    Размер ограничен max_entries (0 - без ограничения). При переполнении
+    сначала вытесняются истекшие записи (min-heap по времени истечения),
+    затем давно не использованные (порядок OrderedDict). Снимок хранит
+    записи в порядке LRU, поэтому при загрузке остаются самые свежие.
+    Каждая запись содержит поле 'expires' - абсолютное время истечения.
+
+    Если задан stats_path, при каждом сбросе в секцию dns_cache файла
+    статистики пишутся число записей и гистограмма истечений по минутам -
+    по ней status считает действующие записи без загрузки кэша.
+    """
+
+    def __init__(self, path: Path, flush_every: int = 500, flush_interval: float = 5.0,
+                 max_entries: int = 0, legacy_ttl: float = 24 * 3600,
+                 stats_path: Optional[Path] = None):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + '.journal')
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self.max_entries = max(0, max_entries or 0)
+        self.legacy_ttl = legacy_ttl
+        self.stats_path = Path(stats_path) if stats_path else None
+
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._expiry_minutes: Counter = Counter()
+        self._dirty: Dict[str, Optional[Dict]] = {}
+        self._journal_lines = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+        # Счетчики за время жизни объекта (один прогон)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.expired_evictions = 0
+
+    # --- Доступ к записям ---
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Возвращает запись независимо от срока жизни (без учета в LRU)"""
+        with self._lock:
+            return self._entries.get(name)
+
+    def lookup(self, name: str, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        Возвращает действующую запись и отмечает ее использование.
+        Учитывает попадания, промахи и истекшие записи.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                _CACHE_MISS.inc()
+                return None
+            if entry['expires'] <= now:
+                self.stale += 1
+                _CACHE_STALE.inc()
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            _CACHE_HIT.inc()
+            return entry
+
+    def is_fresh(self, name: str, now: Optional[float] = None) -> bool:
+        """Проверяет срок жизни записи, не влияя на LRU и счетчики"""
+        entry = self._entries.get(name)
+        return entry is not None and entry['expires'] > (time.time() if now is None else now)
+
+    def set(self, name: str, entry: Dict) -> None:
+        """Сохраняет запись и сбрасывает изменения на диск, если пора"""
+        with self._lock:
+            self._insert(name, entry)
+            self._dirty[name] = entry
+            self._evict_overflow()
+            self._maybe_flush()
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._forget(entry)
+                self._dirty[name] = None
+                self._maybe_flush()
+
+    def _insert(self, name: str, entry: Dict) -> None:
+        """Добавляет запись в конец LRU и в кучу истечений"""
+        if 'expires' not in entry:
+            # Записи старого формата живут legacy_ttl с момента резолвинга
+            entry['expires'] = entry.get('timestamp', 0) + self.legacy_ttl
+        previous = self._entries.get(name)
+        if previous is not None:
+            self._forget(previous)
+        self._entries[name] = entry
+        self._entries.move_to_end(name)
+        heapq.heappush(self._expiry_heap, (entry['expires'], name))
+        self._expiry_minutes[int(entry['expires'] // 60)] += 1
+
+    def _forget(self, entry: Dict) -> None:
+        """Убирает удаленную запись из гистограммы истечений"""
+        minute = int(entry['expires'] // 60)
+        self._expiry_minutes[minute] -= 1
+        if not self._expiry_minutes[minute]:
+            del self._expiry_minutes[minute]
+
+    # --- Вытеснение ---
+
+    def _evict_overflow(self, now: Optional[float] = None) -> None:
+        """Вытесняет записи сверх max_entries: сначала истекшие, затем по LRU"""
+        if not self.max_entries:
+            return
+
+        now = time.time() if now is None else now
+        while len(self._entries) > self.max_entries:
+            name = self._pop_expired(now)
+            if name is not None:
+                self.expired_evictions += 1
+                _EVICTIONS.labels('expired').inc()
+            else:
+                name, entry = self._entries.popitem(last=False)
+                self._forget(entry)
+                self.evictions += 1
+                _EVICTIONS.labels('lru').inc()
+            self._dirty[name] = None
+
+        # Устаревшие элементы кучи удаляются лениво; не даем ей разрастись
+        if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [(entry['expires'], name) for name, entry in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _pop_expired(self, now: float) -> Optional[str]:
+        """Удаляет самую давно истекшую запись. None, если истекших нет"""
+        heap = self._expiry_heap
+        while heap:
+            expires, name = heap[0]
+            entry = self._entries.get(name)
+            if entry is None or entry['expires'] != expires:
+                # Запись удалена или обновлена после добавления в кучу
+                heapq.heappop(heap)
+                continue
+            if expires > now:
+                return None
+            heapq.heappop(heap)
+            self._forget(self._entries.pop(name))
+            return name
+        return None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def values(self) -> List[Dict]:
+        with self._lock:
+            return list(self._entries.values())
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def get_stats(self) -> Dict:
+        """Счетчики использования кэша"""
+        lookups = self.hits + self.misses + self.stale
+        return {
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expired_evictions': self.expired_evictions,
+        }
+
+    # --- Загрузка ---
+
+    def load(self) -> int:
+        """Читает снимок и применяет журнал. Возвращает число записей"""
+        with self._lock:
+            self._entries = OrderedDict()
+            self._expiry_heap = []
+            self._expiry_minutes = Counter()
+            self._dirty = {}
+            self._journal_lines = 0
+
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    for name, entry in json.load(f).items():
+                        self._insert(name, entry)
+
+            if self.journal_path.exists():
+                with open(self.journal_path, 'r') as f:
+                    for line in f:
+                        try:
+                            name, entry = json.loads(line)
+                        except (ValueError, TypeError):
+                            # Оборванная при сбое последняя строка
+                            continue
+                        self._journal_lines += 1
+                        if entry is None:
+                            removed = self._entries.pop(name, None)
+                            if removed is not None:
+                                self._forget(removed)
+                        else:
+                            self._insert(name, entry)
+
+            # Файл мог быть записан с большим лимитом - вытесненное уйдет на диск
+            self._evict_overflow()
+            self._last_flush = time.monotonic()
+            _ENTRIES.set(len(self._entries))
+            return len(self._entries)
+
+    # --- Запись ---
+
+    def _maybe_flush(self) -> None:
+        if (len(self._dirty) >= self.flush_every or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Дописывает изменения в журнал или сворачивает журнал в снимок"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            _ENTRIES.set(len(self._entries))
+            if not self._dirty:
+                return
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            if self._journal_lines + len(self._dirty) > max(len(self._entries), self.flush_every):
+                self._write_snapshot()
+            else:
+                with open(self.journal_path, 'a') as f:
+                    f.write(''.join(_dumps([name, entry]) + '\n'
+                                    for name, entry in self._dirty.items()))
+                self._journal_lines += len(self._dirty)
+
+            self._dirty = {}
+            self.write_stats()
+
+    def _write_snapshot(self) -> None:
+        """Пишет снимок во временный файл и атомарно заменяет им старый"""
+        fd, tmp_path = tempfile.mkstemp(prefix=self.path.name + '.', suffix='.tmp',
+                                        dir=self.path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(_dumps(self._entries))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        # Журнал уже учтен в снимке; если удаление не успеет - повтор идемпотентен
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+        self._journal_lines = 0
+
+    def compact(self) -> None:
+        """Принудительно сворачивает кэш в один снимок"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._write_snapshot()
+            self._dirty = {}
+            self._last_flush = time.monotonic()
+            self.write_stats()
+
+    def write_stats(self, now: Optional[float] = None) -> None:
+        """Обновляет секцию dns_cache файла статистики (если он задан)"""
+        if self.stats_path is None:
+            return
+        minute = int((time.time() if now is None else now) // 60)
+        with self._lock:
+            upcoming = {bucket: count for bucket, count in self._expiry_minutes.items()
+                        if bucket > minute}
+            update_stats(self.stats_path, 'dns_cache', {
+                'entries': len(self._entries),
+                'expiry_minutes': upcoming,
+                'cache_file': str(self.path),
+            })
+
+    def clear(self) -> None:
+        """Очищает кэш в памяти и на диске"""
+        with self._lock:
+            self._entries = OrderedDict()
+            self._expiry_heap = []
+            self._expiry_minutes = Counter()
+            self._dirty = {}
+            self._journal_lines = 0
+            _ENTRIES.set(0)
+            for path in (self.path, self.journal_path):
+                if path.exists():
+                    path.unlink()
+            self.write_stats()
@@ -0,0 +1,392 @@
+"""
+Асинхронный DNS клиент для DNS Routing Manager.
+Отправляет запросы напрямую на DNS серверы по UDP (с переходом на TCP
+при усечении ответа) и держит тысячи запросов в полете на нескольких сокетах.
+
+Хеджирование: если сервер не ответил за p95 своей наблюдаемой задержки,
+тот же запрос уходит следующему серверу, и берется первый годный ответ.
+Сервер, переставший отвечать, уходит в конец очереди (failover).
+"""
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..utils.dns_wire import (
+    DNSMessage, DNSWireError, QTYPE_A, FLAG_TC, RCODE_REFUSED, RCODE_SERVFAIL,
+    build_query, normalize_name, parse_message,
+)
+
+Server = Tuple[str, int]
+
+
+class DNSQueryError(Exception):
+    """Ошибка DNS запроса"""
+    pass
+
+
+class DNSTimeoutError(DNSQueryError):
+    """Ни один сервер не ответил за отведенное время"""
+    pass
+
+
+def parse_server(server: str, default_port: int = 53) -> Tuple[str, int]:
+    """Разбирает адрес сервера: '8.8.8.8' или '127.0.0.1:5353'"""
+    host, sep, port = server.rpartition(':')
+    if sep and host and port.isdigit() and host.count(':') == 0:
+        return host, int(port)
+    return server, default_port
+
+
+class _UDPChannel(asyncio.DatagramProtocol):
+    """
+    Один UDP сокет к одному серверу.
+    Ответы сопоставляются с ожидающими запросами по ID и вопросу.
+    """
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.pending: Dict[int, Tuple[asyncio.Future, str, int]] = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) < 12:
+            return
+        qid = int.from_bytes(data[:2], 'big')
+        entry = self.pending.get(qid)
+        if entry is None:
+            return
+        future, qname, qtype = entry
+        if future.done():
+            return
+
+        try:
+            message = parse_message(data)
+        except DNSWireError:
+            # Усеченный ответ может не разбираться целиком - достаточно флага TC
+            flags = int.from_bytes(data[2:4], 'big')
+            if flags & FLAG_TC:
+                future.set_result(DNSMessage(id=qid, flags=flags))
+            return
+
+        # Отбрасываем ответы, не совпадающие с вопросом (защита от подмены)
+        if not message.is_response or not message.questions:
+            return
+        name, rtype, _ = message.questions[0]
+        if normalize_name(name) != qname or rtype != qtype:
+            return
+
+        future.set_result(message)
+
+    def error_received(self, exc) -> None:
+        # ICMP ошибки не привязаны к конкретному запросу - запросы отвалятся по таймауту
+        pass
+
+    def connection_lost(self, exc) -> None:
+        for future, _, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(DNSQueryError(f"Socket closed: {exc}"))
+        self.pending.clear()
+
+    def allocate_id(self) -> int:
+        """Выбирает случайный свободный ID запроса"""
+        while True:
+            qid = random.getrandbits(16)
+            if qid not in self.pending:
+                return qid
+
+
+class ServerLatency:
+    """
+    Скользящее окно задержек ответов по серверам.
+    Живет дольше одного клиента: резолвер передает его каждому новому клиенту.
+    """
+
+    # Меньше ответов - порог еще не надежен, используется начальный
+    MIN_SAMPLES = 20
+    # Столько таймаутов подряд - и сервер опрашивается последним
+    FAILOVER_AFTER = 2
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._samples: Dict[Server, Deque[float]] = {}
+        self._p95: Dict[Server, Optional[float]] = {}
+        # Таймауты подряд
+        self.failures: Dict[Server, int] = {}
+
+    def _add_sample(self, server: Server, seconds: float) -> None:
+        samples = self._samples.get(server)
+        if samples is None:
+            samples = self._samples[server] = deque(maxlen=self.window)
+        samples.append(seconds)
+        # Процентиль пересчитывается не на каждом ответе
+        if len(samples) % 16 == 0 or server not in self._p95:
+            self._p95[server] = None
+
+    def record(self, server: Server, seconds: float) -> None:
+        """Ответ сервера за seconds"""
+        self._add_sample(server, seconds)
+        self.failures[server] = 0
+
+    def record_lower_bound(self, server: Server, seconds: float) -> None:
+        """
+        Запрос отменен через seconds, потому что другой сервер ответил раньше:
+        ответ занял бы не меньше. Это не неудача, но порог дубля должен
+        расти вместе с реальной задержкой сервера.
+        """
+        self._add_sample(server, seconds)
+
+    def record_failure(self, server: Server) -> None:
+        self.failures[server] = self.failures.get(server, 0) + 1
+
+    def is_failing(self, server: Server) -> bool:
+        return self.failures.get(server, 0) >= self.FAILOVER_AFTER
+
+    def p95(self, server: Server) -> Optional[float]:
+        """p95 задержки сервера или None, пока ответов мало"""
+        samples = self._samples.get(server)
+        if samples is None or len(samples) < self.MIN_SAMPLES:
+            return None
+        value = self._p95.get(server)
+        if value is None:
+            ordered = sorted(samples)
+            value = self._p95[server] = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return value
+
+
+class AsyncDNSClient:
+    """
+    Stub-резолвер поверх asyncio.
+
+    Использование:
+        async with AsyncDNSClient(["8.8.8.8", "1.1.1.1"]) as client:
+            message = await client.query("example.com")
+    """
+
+    def __init__(self, servers: List[str], timeout: float = 5.0, retries: int = 3,
+                 sockets_per_server: int = 2, max_inflight: int = 1000,
+                 hedge: bool = True, hedge_delay: float = 0.3, hedge_min_delay: float = 0.02,
+                 latency: Optional[ServerLatency] = None):
+        if not servers:
+            raise ValueError("At least one DNS server is required")
+
+        self.servers = [parse_server(server) for server in servers]
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.sockets_per_server = max(1, sockets_per_server)
+        self.max_inflight = max(1, max_inflight)
+        self.hedge = hedge and len(self.servers) > 1
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = latency or ServerLatency()
+
+        # Счетчики: дублированные запросы, ответы дубля и переходы на другой сервер после ошибки
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+        self._channels: Dict[Tuple[str, int], List[_UDPChannel]] = {}
+        self._next_channel: Dict[Tuple[str, int], int] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> 'AsyncDNSClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Закрывает все сокеты"""
+        for channels in self._channels.values():
+            for channel in channels:
+                if channel.transport is not None:
+                    channel.transport.close()
+        self._channels.clear()
+
+    async def _channel(self, server: Tuple[str, int]) -> _UDPChannel:
+        """Возвращает следующий сокет для сервера, открывая их при первом обращении"""
+        channels = self._channels.get(server)
+        if channels is None:
+            loop = asyncio.get_running_loop()
+            channels = []
+            for _ in range(self.sockets_per_server):
+                _, protocol = await loop.create_datagram_endpoint(
+                    _UDPChannel, remote_addr=server
+                )
+                channels.append(protocol)
+            self._channels[server] = channels
+            self._next_channel[server] = 0
+
+        index = self._next_channel[server]
+        self._next_channel[server] = (index + 1) % len(channels)
+        return channels[index]
+
+    async def _query_udp(self, server: Tuple[str, int], qname: str, qtype: int,
+                         timeout: float) -> DNSMessage:
+        """Один UDP запрос к серверу"""
+        channel = await self._channel(server)
+        qid = channel.allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        channel.pending[qid] = (future, qname, qtype)
+
+        try:
+            channel.transport.sendto(build_query(qid, qname, qtype))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            channel.pending.pop(qid, None)
+
+    async def _query_tcp(self, server: Tuple[str, int], qname: str, qtype: int,
+                         timeout: float) -> DNSMessage:
+        """Запрос по TCP (после усечения UDP ответа)"""
+
+        async def exchange() -> DNSMessage:
+            reader, writer = await asyncio.open_connection(*server)
+            try:
+                qid = random.getrandbits(16)
+                payload = build_query(qid, qname, qtype)
+                writer.write(struct.pack("!H", len(payload)) + payload)
+                await writer.drain()
+
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                message = parse_message(await reader.readexactly(length))
+                if message.id != qid:
+                    raise DNSQueryError(f"Mismatched TCP response ID from {server[0]}")
+                return message
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(exchange(), timeout)
+
+    async def query_server(self, server: Tuple[str, int], name: str,
+                           qtype: int = QTYPE_A, timeout: Optional[float] = None) -> DNSMessage:
+        """Запрос к конкретному серверу: UDP, при усечении - TCP"""
+        qname = normalize_name(name)
+        timeout = self.timeout if timeout is None else timeout
+
+        message = await self._query_udp(server, qname, qtype, timeout)
+        if message.truncated:
+            message = await self._query_tcp(server, qname, qtype, timeout)
+        return message
+
+    def _server_order(self) -> List[Server]:
+        """Серверы в порядке настройки; не отвечающие подряд - в конце"""
+        return sorted(self.servers, key=self.latency.is_failing)
+
+    def _hedge_after(self, server: Server) -> float:
+        """Сколько ждать ответа сервера до отправки запроса следующему"""
+        p95 = self.latency.p95(server)
+        delay = self.hedge_delay if p95 is None else p95
+        return min(self.timeout, max(self.hedge_min_delay, delay))
+
+    async def _timed_query(self, server: Server, name: str, qtype: int) -> DNSMessage:
+        """Запрос к серверу с учетом задержки ответа и таймаутов"""
+        started = time.perf_counter()
+        try:
+            message = await self.query_server(server, name, qtype)
+        except asyncio.CancelledError:
+            # Отмена - другой сервер ответил раньше: сервер не отказал, он медленнее
+            self.latency.record_lower_bound(server, time.perf_counter() - started)
+            raise
+        except asyncio.TimeoutError:
+            self.latency.record_failure(server)
+            raise
+        self.latency.record(server, time.perf_counter() - started)
+        return message
+
+    @staticmethod
+    def _attempt_error(name: str, server: Server, error: BaseException) -> DNSQueryError:
+        if isinstance(error, asyncio.TimeoutError):
+            return DNSTimeoutError(f"DNS timeout for {name} via {server[0]}")
+        return DNSQueryError(f"DNS error for {name} via {server[0]}: {error}")
+
+    async def _hedged_query(self, name: str, qtype: int) -> DNSMessage:
+        """
+        Запросы к серверам по очереди: следующий уходит, когда предыдущий
+        не ответил за свой порог или завершился ошибкой. Побеждает первый
+        годный ответ; SERVFAIL/REFUSED возвращается, только если лучшего нет.
+        """
+        order = self._server_order()
+        attempts = max(self.retries, len(order))
+        running: Dict[asyncio.Task, Server] = {}
+        launched = 0
+        hedged = False
+        fallback: Optional[DNSMessage] = None
+        last_error: Optional[Exception] = None
+
+        def launch() -> Server:
+            nonlocal launched
+            server = order[launched % len(order)]
+            running[asyncio.ensure_future(self._timed_query(server, name, qtype))] = server
+            launched += 1
+            return server
+
+        current = launch()
+        try:
+            while running:
+                delay = self._hedge_after(current) if launched < attempts else None
+                done, _ = await asyncio.wait(set(running), timeout=delay,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    hedged = True
+                    current = launch()
+                    continue
+
+                for task in done:
+                    server = running.pop(task)
+                    try:
+                        message = task.result()
+                    except (asyncio.TimeoutError, OSError, DNSWireError, DNSQueryError,
+                            asyncio.IncompleteReadError) as e:
+                        last_error = self._attempt_error(name, server, e)
+                        continue
+                    if message.rcode in (RCODE_SERVFAIL, RCODE_REFUSED):
+                        fallback = fallback or message
+                        continue
+                    if hedged and server != order[0]:
+                        self.hedge_wins += 1
+                    return message
+
+                # Ошибка без других запросов в полете - сразу следующий сервер
+                if not running and launched < attempts:
+                    self.failovers += 1
+                    current = launch()
+        finally:
+            for task in running:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Ответ, пришедший одновременно с победителем, не нужен
+                    task.exception()
+
+        if fallback is not None:
+            return fallback
+        raise last_error
+
+    async def query(self, name: str, qtype: int = QTYPE_A) -> DNSMessage:
+        """
+        Выполняет запрос, перебирая серверы при таймаутах и ошибках.
+        С хеджированием медленный сервер дублируется следующим, не дожидаясь
+        таймаута; без него число последовательных попыток - retries.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+
+        last_error: Optional[Exception] = None
+        async with self._semaphore:
+            if self.hedge:
+                return await self._hedged_query(name, qtype)
+
+            for attempt in range(self.retries):
+                server = self.servers[attempt % len(self.servers)]
+                try:
+                    return await self._timed_query(server, name, qtype)
+                except (asyncio.TimeoutError, OSError, DNSWireError, DNSQueryError,
+                        asyncio.IncompleteReadError) as e:
+                    last_error = self._attempt_error(name, server, e)
+
+        raise last_error
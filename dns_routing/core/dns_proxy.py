@@ -0,0 +1,652 @@
+"""
+Локальный DNS прокси для DNS Routing Manager.
+
+Системный резолвер указывает на прокси; прокси пересылает запросы
+upstream серверам без изменений (кроме ID) и, если имя из ответа
+попадает под правило из файлов доменов, ставит маршруты на адреса
+ответа до того, как отдать ответ клиенту. Так маршрутизируются все
+поддомены, которые реально запрашиваются, а не только угаданные
+wildcard расширением.
+
+Горячий путь:
+    - ответ из кэша: копия готовых байт с новым ID и уменьшенными TTL
+    - маршрут: проверка по множеству известных адресов, установка
+      пакетом в отдельном потоке; ответ ждет не дольше route_wait
+
+Метрики (задержка по видам ответов, операции с маршрутами) отдаются
+по HTTP на metrics.port и пишутся в metrics.textfile на каждом такте.
+
+Сигналы:
+    SIGHUP          - перечитать файлы доменов и списки IP
+    SIGTERM/SIGINT  - сохранить маршруты и завершиться
+"""
+import asyncio
+import random
+import signal
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_config
+from ..models import RouteType
+from ..utils.dns_wire import (
+    DNSWireError, FLAG_QR, FLAG_RA, FLAG_RD, FLAG_TC, OPCODE_MASK, QTYPE_A,
+    RCODE_NOERROR, RCODE_NXDOMAIN, RCODE_SERVFAIL,
+    decode_name, normalize_name, parse_message, ttl_offsets,
+)
+from ..utils.domain_trie import DomainTrie
+from ..utils.metrics import REGISTRY, start_http_server
+from ..utils.network import build_prefix_tree
+from ..utils.radix import RadixTree
+from .daemon import _read_list_file
+from .dns_client import parse_server
+from .domain_processor import load_domain_index
+from .route_manager import RouteManager
+
+
+# Дерево правил доменов, дерево подсетей и известные адреса
+Indexes = Tuple[DomainTrie, Optional[RadixTree], Dict[str, RouteType]]
+
+# Виды ответов в гистограммах
+OUTCOMES = ('cache', 'forward', 'route', 'error')
+
+_HEADER = struct.Struct("!HHHHHH")
+
+_QUERY_SECONDS = REGISTRY.histogram('dns_routing_proxy_query_seconds',
+                                    'Proxy answer latency by outcome', ['outcome'])
+_RELEASED = REGISTRY.counter('dns_routing_proxy_released_before_route_total',
+                             'Answers released after proxy.route_wait before their routes were installed')
+_CACHED_ANSWERS = REGISTRY.gauge('dns_routing_proxy_cached_answers', 'Answers in the proxy cache')
+
+
+def _latency_summary(histogram) -> str:
+    if not histogram.count:
+        return "no queries"
+    return (f"{histogram.count} queries, avg {histogram.sum / histogram.count * 1000:.2f} ms, "
+            f"p50 <={histogram.percentile(50) * 1000:g} ms, p95 <={histogram.percentile(95) * 1000:g} ms, "
+            f"p99 <={histogram.percentile(99) * 1000:g} ms, max {histogram.max * 1000:.2f} ms")
+
+
+def _latency_lines(histogram) -> List[str]:
+    """Строки гистограммы: граница корзины и число ответов"""
+    lines = []
+    labels = ([f"<={bound * 1000:g} ms" for bound in histogram.bounds] +
+              [f">{histogram.bounds[-1] * 1000:g} ms"])
+    width = max(histogram.counts) or 1
+    for label, count in zip(labels, histogram.counts):
+        if count:
+            lines.append(f"{label:>11} {count:>8} {'#' * max(1, count * 40 // width)}")
+    return lines
+
+
+class _RelayChannel(asyncio.DatagramProtocol):
+    """
+    UDP сокет к одному upstream серверу.
+    Ответ сопоставляется с запросом по ID и байтам вопроса и
+    возвращается как есть, без разбора.
+    """
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.pending: Dict[int, Tuple[asyncio.Future, bytes]] = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) < 12:
+            return
+        entry = self.pending.get(int.from_bytes(data[:2], 'big'))
+        if entry is None:
+            return
+        future, question = entry
+        # Отбрасываем ответы на другой вопрос (защита от подмены)
+        if future.done() or data[12:12 + len(question)] != question:
+            return
+        future.set_result(data)
+
+    def error_received(self, exc) -> None:
+        pass
+
+    def connection_lost(self, exc) -> None:
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Socket closed: {exc}"))
+        self.pending.clear()
+
+    def allocate_id(self) -> int:
+        while True:
+            qid = random.getrandbits(16)
+            if qid not in self.pending:
+                return qid
+
+
+class DNSProxy:
+    """
+    DNS форвардер, ставящий маршруты по ответам.
+
+    Использование:
+        proxy = DNSProxy(upstream=["127.0.0.1:5353"], port=0)
+        port = proxy.start_in_thread()
+        ...
+        proxy.stop()
+    """
+
+    def __init__(self, route_manager: Optional[RouteManager] = None,
+                 upstream: Optional[List[str]] = None,
+                 listen: Optional[str] = None, port: Optional[int] = None,
+                 metrics_port: Optional[int] = None):
+        self.config = get_config()
+        self.route_manager = route_manager or RouteManager()
+
+        servers = upstream or self.config.proxy_upstream or self.config.dns_servers
+        if not servers:
+            raise ValueError("proxy.upstream or dns.servers must list upstream DNS servers "
+                             "(the system resolver points at the proxy itself)")
+        self.upstream = [parse_server(server) for server in servers]
+        self.listen = listen or self.config.proxy_listen
+        self.port = self.config.proxy_port if port is None else port
+        self.metrics_port = self.config.metrics_port if metrics_port is None else metrics_port
+
+        self.trie: Optional[DomainTrie] = None
+        self.tree: Optional[RadixTree] = None
+        # Адрес -> тип маршрута: уже установленные, покрытые подсетью или конфликтующие
+        self.known: Dict[str, RouteType] = {}
+        self._installing: Dict[str, asyncio.Future] = {}
+        self._queue: List[Tuple[str, RouteType]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._interfaces = {
+            self.config.local_interface.name: RouteType.LOCAL,
+            self.config.vpn_interface.name: RouteType.VPN,
+        }
+
+        # (имя, тип, класс, EDNS) -> (ответ, время записи, смещения TTL, истечение);
+        # порядок LRU: в конце - последние использованные
+        self.cache: 'OrderedDict[Tuple, Tuple[bytes, float, List[Tuple[int, int]], float]]' = OrderedDict()
+
+        # Гистограммы общие для процесса: их же отдают /metrics и textfile
+        self.histograms = {outcome: _QUERY_SECONDS.labels(outcome) for outcome in OUTCOMES}
+        self.routes_installed = 0
+        self.route_errors = 0
+        self.route_timeouts = 0
+
+        self._channels: Dict[Tuple[str, int], List[_RelayChannel]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="proxy-routes")
+        self._routes_dirty = False
+        self._reload_requested = False
+        self._stop_requested = False
+        self._tasks = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._udp_transport = None
+        self._tcp_server = None
+        self._metrics_server = None
+
+    # --- Домены ---
+
+    def _build_indexes(self) -> Indexes:
+        """
+        Строит дерево правил доменов, дерево подсетей из списков IP и известные
+        адреса. Во время работы прокси выполняется в потоке маршрутов: там же
+        меняется active_routes, и сборка не задерживает ответы.
+        """
+        trie = load_domain_index(self.config).trie()
+        tree = None
+        if self.config.skip_covered:
+            tree = build_prefix_tree(
+                (target, route_type)
+                for route_type, ips_file in ((RouteType.LOCAL, self.config.ips_local_file),
+                                             (RouteType.VPN, self.config.ips_vpn_file))
+                for target in _read_list_file(ips_file)
+            )
+
+        # Установленные маршруты известны сразу, остальное решится по первому ответу
+        known = {}
+        for route_key in list(self.route_manager.active_routes):
+            target, _, interface = route_key.rpartition(':')
+            if '/' not in target and interface in self._interfaces:
+                known[target] = self._interfaces[interface]
+        return trie, tree, known
+
+    def _apply_indexes(self, indexes: Indexes) -> None:
+        self.trie, self.tree, self.known = indexes
+        # Новые правила должны сработать и для имен, ответы на которые уже в кэше
+        self.cache.clear()
+        print(f"Proxy: {len(self.trie)} domain rules, {len(self.known)} routed addresses")
+
+    def load_domains(self) -> None:
+        """Загружает правила до запуска прокси"""
+        self._apply_indexes(self._build_indexes())
+
+    async def reload_domains(self) -> None:
+        """
+        Перечитывает правила работающего прокси: сборка в потоке маршрутов,
+        замена готовых деревьев - в цикле; при ошибке остаются старые правила.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            indexes = await loop.run_in_executor(self._executor, self._build_indexes)
+        except Exception as e:
+            print(f"Proxy: reload failed, keeping previous rules: {e}")
+            return
+        self._apply_indexes(indexes)
+
+    # --- Кэш ответов ---
+
+    @staticmethod
+    def _cache_ttl(data: bytes, offsets: List[Tuple[int, int]]) -> Optional[int]:
+        """Время жизни ответа в кэше: минимальный TTL его записей"""
+        rcode = data[3] & 0x0F
+        if data[2] & (FLAG_TC >> 8) or rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN) or not offsets:
+            return None
+        return min(ttl for _, ttl in offsets)
+
+    def _cache_store(self, key: Tuple, data: bytes, now: float) -> None:
+        try:
+            offsets = ttl_offsets(data)
+        except DNSWireError:
+            return
+        ttl = self._cache_ttl(data, offsets)
+        if not ttl:
+            return
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        elif len(self.cache) >= self.config.proxy_cache_size:
+            # Частые имена поднимаются в конец при каждом попадании - вытесняется давно не нужное
+            self.cache.popitem(last=False)
+        self.cache[key] = (data, now, offsets, now + ttl)
+
+    def _cache_answer(self, key: Tuple, query: bytes, question_end: int,
+                      now: float) -> Optional[bytes]:
+        """Ответ из кэша с ID и вопросом клиента и уменьшенными TTL"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        data, stored, offsets, expires = entry
+        if expires <= now:
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+
+        # Вопрос клиента того же размера (имя отличается только регистром)
+        response = bytearray(query[:2] + data[2:12] + query[12:question_end] + data[question_end:])
+        age = int(now - stored)
+        if age:
+            for offset, ttl in offsets:
+                struct.pack_into("!I", response, offset, max(0, ttl - age))
+        return bytes(response)
+
+    # --- Upstream ---
+
+    async def _channel(self, server: Tuple[str, int]) -> _RelayChannel:
+        channels = self._channels.get(server)
+        if channels is None:
+            _, channel = await asyncio.get_running_loop().create_datagram_endpoint(
+                _RelayChannel, remote_addr=server
+            )
+            channels = self._channels[server] = [channel]
+        return channels[0]
+
+    async def _forward_udp(self, server: Tuple[str, int], query: bytes, question: bytes) -> bytes:
+        channel = await self._channel(server)
+        qid = channel.allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        channel.pending[qid] = (future, question)
+        try:
+            channel.transport.sendto(qid.to_bytes(2, 'big') + query[2:])
+            return await asyncio.wait_for(future, self.config.proxy_timeout)
+        finally:
+            channel.pending.pop(qid, None)
+
+    async def _forward_tcp(self, server: Tuple[str, int], query: bytes) -> bytes:
+        async def exchange() -> bytes:
+            reader, writer = await asyncio.open_connection(*server)
+            try:
+                writer.write(struct.pack("!H", len(query)) + query)
+                await writer.drain()
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                return await reader.readexactly(length)
+            finally:
+                writer.close()
+
+        return await asyncio.wait_for(exchange(), self.config.proxy_timeout)
+
+    async def _forward(self, query: bytes, question: bytes, via_tcp: bool) -> Optional[bytes]:
+        """Ответ upstream с ID клиента; серверы перебираются при таймаутах и ошибках"""
+        for attempt in range(max(1, self.config.dns_retries)):
+            server = self.upstream[attempt % len(self.upstream)]
+            try:
+                if via_tcp:
+                    response = await self._forward_tcp(server, query)
+                else:
+                    response = await self._forward_udp(server, query, question)
+            except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError):
+                continue
+            return query[:2] + response[2:]
+        return None
+
+    # --- Маршруты ---
+
+    def _classify(self, qname: str, chain: List[str]) -> Optional[RouteType]:
+        """Тип маршрута по имени запроса или, если оно не в списках, по цепочке CNAME"""
+        for name in [qname] + chain:
+            match = self.trie.lookup(name)
+            if match is not None:
+                return match[0]
+        return None
+
+    def _needs_route(self, address: str, route_type: RouteType) -> bool:
+        if address in self.known:
+            return False
+        if self.tree is not None:
+            try:
+                covered = self.tree.lookup(address)
+            except ValueError:
+                return False
+            if covered is not None and covered[1] == route_type:
+                self.known[address] = route_type
+                return False
+        return True
+
+    def _queue_install(self, targets: List[str], route_type: RouteType) -> List[asyncio.Future]:
+        """
+        Ставит цели в очередь установки; будущие завершаются после их пакета
+        с True, если маршрут установлен, и False при ошибке.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for target in targets:
+            future = self._installing[target] = loop.create_future()
+            self._queue.append((target, route_type))
+            futures.append(future)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._flush_installs())
+        return futures
+
+    async def _flush_installs(self) -> None:
+        """
+        Ставит очередь маршрутов пакетами в потоке маршрутов (бэкенд не
+        потокобезопасен). Пока пакет выполняется, новые цели копятся и
+        уходят следующим пакетом - под нагрузкой ответы делят установки.
+        """
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            queue, self._queue = self._queue, []
+            for route_type in (RouteType.LOCAL, RouteType.VPN):
+                targets = [target for target, target_type in queue if target_type == route_type]
+                if not targets:
+                    continue
+                try:
+                    installed, errors = await loop.run_in_executor(
+                        self._executor, self.route_manager.install_routes, targets, route_type)
+                except Exception as e:
+                    installed, errors = [], [str(e)]
+
+                for target in installed:
+                    self.known[target] = route_type
+                self.routes_installed += len(installed)
+                self._routes_dirty = self._routes_dirty or bool(installed)
+                if errors:
+                    self.route_errors += len(errors)
+                    for error in errors[:3]:
+                        print(f"Proxy: route error: {error}")
+
+            for target, _ in queue:
+                future = self._installing.pop(target, None)
+                if future is not None and not future.done():
+                    future.set_result(target in self.known)
+
+    async def _route_response(self, qname: str, response: bytes) -> Tuple[bool, bool]:
+        """
+        Ставит маршруты на адреса ответа. Возвращает (ответ ждал маршрутов,
+        маршруты на месте); ответ с неустановленными маршрутами не кэшируется,
+        чтобы повторный запрос снова попробовал их поставить.
+        """
+        try:
+            message = parse_message(response)
+        except DNSWireError:
+            return False, True
+        if message.rcode != RCODE_NOERROR:
+            return False, True
+
+        addresses, chain, _ = message.resolve_chain(qname)
+        if not addresses:
+            return False, True
+        route_type = self._classify(qname, chain)
+        if route_type is None:
+            return False, True
+
+        waits = [self._installing[address] for address in addresses if address in self._installing]
+        targets = [address for address in addresses
+                   if address not in self._installing and self._needs_route(address, route_type)]
+        if targets:
+            waits.extend(self._queue_install(targets, route_type))
+        if not waits:
+            return False, True
+
+        try:
+            # shield: по таймауту отпускается только ответ, установка продолжается
+            results = await asyncio.wait_for(asyncio.shield(asyncio.gather(*waits)),
+                                             self.config.proxy_route_wait)
+        except asyncio.TimeoutError:
+            self.route_timeouts += 1
+            _RELEASED.inc()
+            return True, False
+        return True, all(results)
+
+    # --- Обработка запроса ---
+
+    async def handle_query(self, query: bytes, via_tcp: bool = False) -> Optional[bytes]:
+        """Ответ на запрос клиента или None, если запрос не разбирается"""
+        started = time.perf_counter()
+        try:
+            qid, flags, qdcount, _, _, arcount = _HEADER.unpack_from(query, 0)
+            if flags & FLAG_QR or qdcount != 1:
+                return None
+            qname, offset = decode_name(query, 12)
+        except (DNSWireError, struct.error):
+            return None
+        question_end = offset + 4
+        if question_end > len(query):
+            return None
+        qname = normalize_name(qname)
+
+        qtype, qclass = struct.unpack_from("!HH", query, question_end - 4)
+        key = (qname, qtype, qclass, arcount > 0)
+        now = time.time()
+
+        if self.config.proxy_cache_size:
+            response = self._cache_answer(key, query, question_end, now)
+            if response is not None:
+                self.histograms['cache'].observe(time.perf_counter() - started)
+                return response
+
+        response = await self._forward(query, query[12:question_end], via_tcp)
+        if response is None:
+            self.histograms['error'].observe(time.perf_counter() - started)
+            header = _HEADER.pack(qid, FLAG_QR | FLAG_RA | (flags & (OPCODE_MASK | FLAG_RD)) |
+                                  RCODE_SERVFAIL, 1, 0, 0, 0)
+            return header + query[12:question_end]
+
+        outcome, routed = 'forward', True
+        if qtype == QTYPE_A:
+            waited, routed = await self._route_response(qname, response)
+            if waited:
+                outcome = 'route'
+        if self.config.proxy_cache_size and routed:
+            self._cache_store(key, response, now)
+        self.histograms[outcome].observe(time.perf_counter() - started)
+        return response
+
+    # --- Сервер ---
+
+    async def start(self) -> int:
+        """Запускает UDP и TCP обработчики в текущем цикле, возвращает порт"""
+        loop = asyncio.get_running_loop()
+        proxy = self
+
+        if self.trie is None:
+            self._apply_indexes(await loop.run_in_executor(self._executor, self._build_indexes))
+        # Бэкенд (netlink сокет, помощник под sudo) поднимается до первого запроса
+        await loop.run_in_executor(self._executor, lambda: self.route_manager.backend)
+
+        class _UDP(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                # Ссылка на задачу держится до ее завершения
+                task = loop.create_task(self._reply(data, addr))
+                proxy._tasks.add(task)
+                task.add_done_callback(proxy._tasks.discard)
+
+            async def _reply(self, data, addr):
+                response = await proxy.handle_query(data)
+                if response is not None:
+                    self.transport.sendto(response, addr)
+
+        self._udp_transport, _ = await loop.create_datagram_endpoint(
+            _UDP, local_addr=(self.listen, self.port)
+        )
+        self.port = self._udp_transport.get_extra_info('sockname')[1]
+
+        async def handle_tcp(reader, writer):
+            try:
+                while True:
+                    length = struct.unpack("!H", await reader.readexactly(2))[0]
+                    response = await proxy.handle_query(await reader.readexactly(length), via_tcp=True)
+                    if response is None:
+                        continue
+                    writer.write(struct.pack("!H", len(response)) + response)
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        self._tcp_server = await asyncio.start_server(handle_tcp, self.listen, self.port)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        return self.port
+
+    def _save_routes(self) -> None:
+        if self._routes_dirty:
+            self._routes_dirty = False
+            self.route_manager.save_routes_cache()
+
+    def _export_metrics(self) -> None:
+        _CACHED_ANSWERS.set(len(self.cache))
+        if self.config.metrics_textfile:
+            REGISTRY.write_textfile(self.config.metrics_textfile)
+
+    def print_stats(self, detailed: bool = False) -> None:
+        print(f"Proxy: {self.routes_installed} routes installed, {self.route_errors} errors, "
+              f"{self.route_timeouts} released before route, {len(self.cache)} cached answers")
+        for outcome in OUTCOMES:
+            histogram = self.histograms[outcome]
+            if histogram.count:
+                print(f"  {outcome:<8} {_latency_summary(histogram)}")
+                if detailed:
+                    for line in _latency_lines(histogram):
+                        print(f"    {line}")
+
+    async def serve(self) -> None:
+        """Работает до SIGTERM/SIGINT или stop()"""
+        if self._loop is None:
+            await self.start()
+        loop = self._loop
+        if threading.current_thread() is threading.main_thread():
+            loop.add_signal_handler(signal.SIGHUP, self._request_reload)
+            loop.add_signal_handler(signal.SIGTERM, self._request_stop)
+            loop.add_signal_handler(signal.SIGINT, self._request_stop)
+
+        print(f"Proxy listening on {self.listen}:{self.port}, upstream "
+              f"{', '.join(f'{host}:{port}' for host, port in self.upstream)}")
+        if self.metrics_port:
+            self._metrics_server = start_http_server(self.metrics_port, self.config.metrics_listen)
+            print(f"Proxy metrics on http://{self.config.metrics_listen}:"
+                  f"{self._metrics_server.server_port}/metrics")
+        last_stats = time.monotonic()
+        try:
+            while not self._stop_requested:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.config.cache_flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if self._reload_requested:
+                    self._reload_requested = False
+                    print("Proxy: reloading domain files")
+                    await self.reload_domains()
+                await loop.run_in_executor(self._executor, self._save_routes)
+                await loop.run_in_executor(self._executor, self._export_metrics)
+
+                interval = self.config.proxy_stats_interval
+                if interval and time.monotonic() - last_stats >= interval:
+                    last_stats = time.monotonic()
+                    self.print_stats()
+        finally:
+            self.close()
+            await loop.run_in_executor(self._executor, self._save_routes)
+            await loop.run_in_executor(self._executor, self.route_manager.close)
+            await loop.run_in_executor(self._executor, self._export_metrics)
+            self._executor.shutdown()
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server = None
+            print("Proxy stopped")
+            self.print_stats(detailed=True)
+
+    def _request_reload(self) -> None:
+        self._reload_requested = True
+        self._wakeup.set()
+
+    def _request_stop(self) -> None:
+        self._stop_requested = True
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """Закрывает сокеты (вызывать из цикла прокси)"""
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+        for channels in self._channels.values():
+            for channel in channels:
+                if channel.transport is not None:
+                    channel.transport.close()
+        self._channels.clear()
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
+
+    def start_in_thread(self) -> int:
+        """Запускает прокси в фоновом потоке со своим event loop, возвращает порт"""
+        started = threading.Event()
+
+        async def main():
+            await self.start()
+            started.set()
+            await self.serve()
+
+        def run():
+            try:
+                asyncio.run(main())
+            finally:
+                started.set()
+
+        self._thread = threading.Thread(target=run, name="dns-proxy", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.port
+
+    def stop(self) -> None:
+        """Останавливает прокси, запущенный через start_in_thread"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._request_stop)
+            self._thread.join(timeout=10)
+            self._thread = None
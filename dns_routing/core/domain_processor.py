@@ -0,0 +1,193 @@
+"""
+Скомпилированный индекс списков доменов для DNS Routing Manager.
+
+domains_ru.txt и domains_com.txt компилируются в бинарный индекс
+(marshal) рядом с кэшем: строки нормализованы (нижний регистр, без
+точки в конце), классифицированы по префиксу *. / **. и очищены от
+дубликатов. Индекс хранит для каждого файла mtime, размер и хэш
+содержимого:
+    - mtime и размер совпали  - файл не читается вовсе
+    - изменился только mtime  - файл хэшируется, при совпадении хэша
+                                обновляются только метаданные
+    - изменилось содержимое   - перекомпилируется только этот файл
+"""
+import hashlib
+import marshal
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ..models import Domain, DomainType, RouteType, RoutingConfig
+from ..utils.domain_trie import DomainTrie
+
+
+# Версия формата; индекс другой версии перекомпилируется
+INDEX_VERSION = 1
+
+# Коды типов доменов в индексе (по байту на запись)
+_TYPE_CODES = {DomainType.EXACT: 0, DomainType.WILDCARD: 1, DomainType.DEEP_WILDCARD: 2}
+_CODE_TYPES = {code: domain_type for domain_type, code in _TYPE_CODES.items()}
+
+DomainEntry = Tuple[str, DomainType]
+
+
+def parse_domain_line(line: str) -> Optional[DomainEntry]:
+    """
+    Нормализует строку файла доменов: (имя, тип) или None для пустых
+    строк и комментариев. '**.Example.COM.' -> ('example.com', DEEP_WILDCARD)
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    name = line.lower()
+    if name.startswith('**.'):
+        domain_type, name = DomainType.DEEP_WILDCARD, name[3:]
+    elif name.startswith('*.'):
+        domain_type, name = DomainType.WILDCARD, name[2:]
+    else:
+        domain_type = DomainType.EXACT
+
+    name = name.rstrip('.')
+    return (name, domain_type) if name else None
+
+
+def compile_domain_list(data: bytes) -> Tuple[Tuple[str, ...], bytes]:
+    """
+    Компилирует содержимое файла доменов: (имена, коды типов).
+    Повторы имени сливаются в самый широкий тип: **. покрывает *.,
+    а *. - точное имя (базовый домен резолвится всегда).
+    """
+    codes: Dict[str, int] = {}
+    for line in data.decode('utf-8', errors='replace').splitlines():
+        entry = parse_domain_line(line)
+        if entry is None:
+            continue
+        name, domain_type = entry
+        code = _TYPE_CODES[domain_type]
+        if code > codes.get(name, -1):
+            codes[name] = code
+    return tuple(codes), bytes(codes.values())
+
+
+class DomainIndex:
+    """
+    Списки доменов по типам маршрутов.
+
+    Использование:
+        index = load_domain_index(config)
+        index.entries(RouteType.VPN)   # [('example.com', DomainType.WILDCARD), ...]
+        index.domains(RouteType.VPN)   # [Domain(...), ...]
+        index.trie().lookup('www.example.com')
+    """
+
+    def __init__(self, groups: Dict[RouteType, Tuple[Tuple[str, ...], bytes]],
+                 compiled: int = 0):
+        self._groups = groups
+        # Число файлов, перекомпилированных при загрузке
+        self.compiled = compiled
+
+    def __len__(self) -> int:
+        return sum(len(names) for names, _ in self._groups.values())
+
+    def count(self, route_type: RouteType) -> int:
+        names, _ = self._groups.get(route_type, ((), b''))
+        return len(names)
+
+    def entries(self, route_type: RouteType) -> List[DomainEntry]:
+        names, codes = self._groups.get(route_type, ((), b''))
+        return [(name, _CODE_TYPES[code]) for name, code in zip(names, codes)]
+
+    def domains(self, route_type: RouteType) -> List[Domain]:
+        """Объекты Domain группы в порядке файла"""
+        return [Domain(name=name, domain_type=domain_type, route_type=route_type)
+                for name, domain_type in self.entries(route_type)]
+
+    def trie(self) -> DomainTrie:
+        """Суффиксное дерево правил обоих списков для классификации имен"""
+        trie = DomainTrie()
+        for route_type, (names, codes) in self._groups.items():
+            trie.insert_many(names, map(_CODE_TYPES.__getitem__, codes), route_type)
+        return trie
+
+
+def _file_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _read_index(index_path: Path) -> Dict[str, Dict]:
+    """Записи индекса по пути исходного файла ({} если индекс не читается)"""
+    try:
+        # Файл читается целиком: marshal.load с файла читает его мелкими кусками
+        data = marshal.loads(Path(index_path).read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+        return {}
+    return data.get('sources', {})
+
+
+def _write_index(index_path: Path, sources: Dict[str, Dict]) -> None:
+    """Атомарно заменяет файл индекса; индекс - кэш, ошибка записи не фатальна"""
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=index_path.name + '.', suffix='.tmp',
+                                        dir=index_path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump({'version': INDEX_VERSION, 'sources': sources}, f)
+            os.replace(tmp_path, index_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Warning: Could not save domain index: {e}")
+
+
+def load_domain_sources(sources: Dict[RouteType, Path], index_path: Path) -> DomainIndex:
+    """
+    Загружает индекс для файлов sources, перекомпилируя только
+    изменившиеся. Отсутствующий файл дает пустую группу.
+    """
+    stored = _read_index(index_path)
+    updated: Dict[str, Dict] = {}
+    groups: Dict[RouteType, Tuple[Tuple[str, ...], bytes]] = {}
+    compiled = 0
+    dirty = False
+
+    for route_type, path in sources.items():
+        key = str(path)
+        record = stored.get(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            groups[route_type] = ((), b'')
+            dirty = dirty or record is not None
+            continue
+
+        if record is None or (record['mtime_ns'], record['size']) != (stat.st_mtime_ns, stat.st_size):
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = _file_hash(data)
+            if record is None or record['hash'] != digest:
+                names, codes = compile_domain_list(data)
+                record = {'hash': digest, 'names': names, 'codes': codes}
+                compiled += 1
+            record = {**record, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            dirty = True
+
+        updated[key] = record
+        groups[route_type] = (record['names'], record['codes'])
+
+    if dirty or set(updated) != set(stored):
+        _write_index(index_path, updated)
+    return DomainIndex(groups, compiled)
+
+
+def load_domain_index(config: RoutingConfig) -> DomainIndex:
+    """Индекс файлов доменов из конфигурации: ru - LOCAL, com - VPN"""
+    return load_domain_sources({
+        RouteType.LOCAL: config.domains_ru_file,
+        RouteType.VPN: config.domains_com_file,
+    }, config.domain_index_file)
@@ -2,13 +2,45 @@
 DNS Resolver для DNS Routing Manager.
 Обрабатывает резолвинг доменов с поддержкой wildcard и кэширования.
 """
+import asyncio
+import math
+import re
 import subprocess
-import json
+import threading
 import time
-from typing import List, Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Tuple
 from pathlib import Path
-from ..models import DNSResult, DomainType, Domain
+from ..models import DNSAnswer, DNSResult, DomainType, Domain
 from ..config import get_config
+from ..utils.dns_wire import QTYPE_A, RCODE_NAMES, normalize_name
+from ..utils.metrics import REGISTRY
+from ..utils.network import get_system_nameservers
+from ..utils.single_flight import SingleFlight
+from .dns_cache import DNSCache
+from .dns_client import AsyncDNSClient, DNSQueryError, DNSTimeoutError, ServerLatency, parse_server
+from .wildcard_probe import WildcardProber
+
+
+# Корзины распределения TTL для статистики: (подпись, верхняя граница в секундах)
+TTL_BUCKETS = [
+    ('<=1m', 60),
+    ('<=5m', 300),
+    ('<=1h', 3600),
+    ('<=1d', 86400),
+    ('>1d', float('inf')),
+]
+
+
+# Виды негативных записей кэша
+NEGATIVE_KINDS = ('nxdomain', 'nodata', 'timeout', 'servfail', 'error')
+
+_LOOKUP_SECONDS = REGISTRY.histogram('dns_routing_dns_lookup_seconds',
+                                     'DNS lookup latency including retries and failover', ['backend'])
+_LOOKUPS = REGISTRY.counter('dns_routing_dns_lookups_total',
+                            'DNS lookups by result (ok or a negative kind)', ['backend', 'result'])
+_UPSTREAM_EVENTS = REGISTRY.counter('dns_routing_dns_upstream_events_total',
+                                    'Hedged queries, hedges answered first and failovers', ['event'])
 
 
 class DNSResolver:
@@ -19,72 +51,152 @@ class DNSResolver:
     def __init__(self):
         self.config = get_config()
         self.cache_file = self.config.cache_dir / "dns_cache.json"
-        self.cache: Dict[str, Dict] = {}
+        self.cache = DNSCache(
+            self.cache_file,
+            flush_every=self.config.cache_flush_every,
+            flush_interval=self.config.cache_flush_interval,
+            max_entries=self.config.cache_max_entries,
+            legacy_ttl=self.config.cache_ttl_hours * 3600,
+            stats_path=self.config.stats_file
+        )
+        self.negative_hits = 0
+        # Таймауты и отказы серверов; dig вызывает _record_failure из потоков пула
+        self.lookup_failures = 0
+        self._failures_lock = threading.Lock()
+        # Запросы, не ушедшие на сервер благодаря свежей цели CNAME
+        self.cname_saved = 0
+        # Одновременные запросы одного имени делят один запрос к серверу
+        self.flight = SingleFlight()
+        self.duplicates = 0
+        # Задержки серверов переживают отдельные прогоны: порог хеджирования адаптивный
+        self.latency = ServerLatency()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.prober = WildcardProber(self.config)
         self._load_cache()
     
     def _load_cache(self) -> None:
         """Загружает DNS кэш из файла"""
         try:
-            if self.cache_file.exists():
-                with open(self.cache_file, 'r') as f:
-                    self.cache = json.load(f)
+            if self.cache.path.exists() or self.cache.journal_path.exists():
+                self.cache.load()
                 print(f"DNS cache loaded: {len(self.cache)} entries")
         except Exception as e:
             print(f"Warning: Could not load DNS cache: {e}")
-            self.cache = {}
+            self.cache.clear()
     
     def _save_cache(self) -> None:
-        """Сохраняет DNS кэш в файл"""
+        """Сбрасывает накопленные изменения кэша на диск"""
         try:
-            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f, indent=2)
+            self.cache.flush()
         except Exception as e:
             print(f"Warning: Could not save DNS cache: {e}")
     
     def _is_cache_valid(self, domain: str) -> bool:
         """Проверяет валидность кэша для домена"""
-        if domain not in self.cache:
-            return False
+        return self.cache.is_fresh(domain)
+    
+    def _get_valid_entry(self, domain: str) -> Optional[Dict]:
+        """Возвращает запись кэша, если она еще не истекла"""
+        return self.cache.lookup(domain)
+    
+    def _clamp_ttl(self, ttl: Optional[int]) -> int:
+        """Ограничивает TTL записи границами cache.min_ttl/cache.max_ttl"""
+        if ttl is None:
+            ttl = self.config.cache_ttl_hours * 3600
+        return max(self.config.cache_min_ttl, min(self.config.cache_max_ttl, ttl))
+    
+    def _dig_resolve(self, domain: str) -> DNSAnswer:
+        """
+        Резолвит домен командой dig, перебирая серверы dns.servers (или
+        системного резолвера): сервер, не ответивший за dns.timeout,
+        сменяется следующим, всего не больше max(retries, число серверов) попыток.
+        """
+        servers = [parse_server(server) for server in self._get_dns_servers()] or [None]
+        order = sorted(servers, key=lambda server: server is not None and self.latency.is_failing(server))
+        last_error: Optional[Exception] = None
         
-        cached_time = self.cache[domain].get('timestamp', 0)
-        ttl_seconds = self.config.cache_ttl_hours * 3600
+        for attempt in range(max(self.config.dns_retries, len(order))):
+            server = order[attempt % len(order)]
+            started = time.perf_counter()
+            try:
+                answer = self._dig_query(domain, server)
+            except DNSTimeoutError as e:
+                last_error = e
+                if server is not None:
+                    self.latency.record_failure(server)
+                continue
+            if server is not None:
+                self.latency.record(server, time.perf_counter() - started)
+            return answer
         
-        return (time.time() - cached_time) < ttl_seconds
+        raise last_error
     
-    def _dig_resolve(self, domain: str) -> List[str]:
+    def _dig_query(self, domain: str, server: Optional[Tuple[str, int]]) -> DNSAnswer:
         """
-        Резолвит домен используя команду dig.
-        Возвращает список IPv4 адресов.
+        Один запрос dig к серверу.
+        Возвращает IPv4 адреса, статус ответа и TTL (для NXDOMAIN/NODATA - из SOA).
         """
+        # Одна попытка dig с ожиданием dns.timeout; процесс ждем чуть дольше,
+        # чтобы таймаут subprocess не обрывал dig посреди его же ожидания
+        wait = max(1, math.ceil(self.config.dns_timeout))
         try:
-            # Используем dig для резолвинга
+            # Используем dig для резолвинга: заголовок со статусом, ответ и authority с SOA
             cmd = [
-                'dig', '+short', '+time=5', '+tries=3', 
-                domain, 'A'
+                'dig', '+noall', '+comments', '+answer', '+authority',
+                f'+time={wait}', '+tries=1'
             ]
+            if server is not None:
+                cmd += [f'@{server[0]}', '-p', str(server[1])]
+            cmd += [domain, 'A']
             
             result = subprocess.run(
                 cmd,
                 capture_output=True,
                 text=True,
-                timeout=self.config.dns_timeout
+                timeout=wait + 2
             )
             
+            # Код 9 - dig не получил ответа ни от одного сервера
+            if result.returncode == 9:
+                raise DNSTimeoutError(f"DNS timeout for {domain}" + (f" via {server[0]}" if server else ""))
             if result.returncode != 0:
                 raise subprocess.CalledProcessError(result.returncode, cmd, result.stderr)
             
-            # Фильтруем только IPv4 адреса
-            ips = []
+            # Строки записей: "name. 300 IN A 1.2.3.4", "name. 60 IN CNAME target.",
+            # "zone. 900 IN SOA mname rname serial refresh retry expire minimum"
+            answer = DNSAnswer(ips=[])
             for line in result.stdout.strip().split('\n'):
-                line = line.strip()
-                if line and self._is_valid_ipv4(line):
-                    ips.append(line)
+                if line.startswith(';'):
+                    match = re.search(r'status: (\w+)', line)
+                    if match:
+                        answer.status = match.group(1)
+                    continue
+                
+                parts = line.split()
+                if len(parts) < 5 or parts[2] != 'IN' or not parts[1].isdigit():
+                    continue
+                record_ttl = int(parts[1])
+                
+                if parts[3] == 'SOA' and len(parts) >= 11 and parts[10].isdigit():
+                    answer.negative_ttl = min(record_ttl, int(parts[10]))
+                    continue
+                if parts[3] == 'A' and self._is_valid_ipv4(parts[4]):
+                    answer.ips.append(parts[4])
+                    answer.address_ttl = record_ttl if answer.address_ttl is None else min(answer.address_ttl, record_ttl)
+                elif parts[3] == 'CNAME':
+                    answer.cnames.append((normalize_name(parts[0]), normalize_name(parts[4]), record_ttl))
+                else:
+                    continue
+                answer.ttl = record_ttl if answer.ttl is None else min(answer.ttl, record_ttl)
             
-            return ips
+            return answer
             
         except subprocess.TimeoutExpired:
-            raise Exception(f"DNS timeout for {domain}")
+            raise DNSTimeoutError(f"DNS timeout for {domain}" + (f" via {server[0]}" if server else ""))
+        except DNSTimeoutError:
+            raise
         except subprocess.CalledProcessError as e:
             raise Exception(f"DNS resolution failed for {domain}: {e.stderr}")
         except Exception as e:
@@ -108,7 +220,10 @@ class DNSResolver:
         Расширяет wildcard домены в список конкретных доменов.
         
         *.example.com -> [example.com, www.example.com]
-        **.example.com -> [example.com, www.example.com, api.example.com, cdn.example.com]
+        **.example.com -> [example.com, www.example.com, api.example.com, ...]
+        
+        Кандидаты **. выбирает WildcardProber по статистике прошлых
+        проверок: wildcard зона дает одно имя, несуществующие имена отброшены.
         """
         domains = [domain]  # Базовый домен всегда включен
         
@@ -117,23 +232,362 @@ class DNSResolver:
             domains.append(f"www.{domain}")
             
         elif domain_type == DomainType.DEEP_WILDCARD:
-            # Глубокий wildcard: добавляем популярные поддомены
-            common_subdomains = [
-                'www', 'api', 'cdn', 'static', 'images', 'assets',
-                'mail', 'ftp', 'blog', 'shop', 'store', 'admin'
-            ]
-            for subdomain in common_subdomains:
-                domains.append(f"{subdomain}.{domain}")
+            domains.extend(self.prober.expand(domain))
         
         return domains
     
-    def resolve_domain(self, domain: Domain) -> DNSResult:
+    def _lookup(self, domain: str) -> Tuple[List[str], Optional[str], float]:
+        """Резолвит имя через dig; одновременные вызовы для имени делят один запрос"""
+        return self.flight.do((domain, QTYPE_A), lambda: self._dig_lookup(domain))
+    
+    def _dig_lookup(self, domain: str) -> Tuple[List[str], Optional[str], float]:
         """
-        Резолвит один домен с учетом его типа.
+        Резолвит одно имя через dig и кладет результат в кэш.
+        Возвращает (ips, error, время резолвинга). Безопасен для вызова из потоков.
+        """
+        start_time = time.time()
+        try:
+            answer = self._dig_resolve(domain)
+        except DNSTimeoutError as e:
+            return self._record_failure(domain, 'timeout', str(e), start_time)
+        except Exception as e:
+            return self._record_failure(domain, 'error', str(e), start_time)
+        
+        return self._record_answer(domain, answer, start_time)
+    
+    def _record_answer(self, domain: str, answer: DNSAnswer,
+                       start_time: float) -> Tuple[List[str], Optional[str], float]:
+        """Кэширует ответ сервера: адреса с TTL ответа или негативный результат"""
+        if answer.status in ('SERVFAIL', 'REFUSED'):
+            return self._record_failure(domain, 'servfail', answer.status, start_time)
+        
+        if answer.status == 'NXDOMAIN' or not answer.ips:
+            kind = 'nxdomain' if answer.status == 'NXDOMAIN' else 'nodata'
+            ttl = answer.negative_ttl
+            if ttl is None:
+                ttl = self.config.negative_ttl
+            ttl = max(self.config.cache_min_ttl, min(self.config.negative_max_ttl, ttl))
+            
+            self._store(domain, {'ips': [], 'negative': kind}, ttl)
+            error_msg = f"Failed to resolve {domain}: {kind.upper()}"
+            if self.config.dns_verbose:
+                print(f"Warning: {error_msg} (cached for {ttl}s)")
+            return [], error_msg, self._observe_lookup(kind, start_time)
+        
+        ttl = self._clamp_ttl(answer.ttl)
+        if answer.cnames:
+            self._store_chain(answer)
+        else:
+            self._store(domain, {'ips': answer.ips}, ttl)
+        if self.config.dns_verbose:
+            print(f"Resolved {domain}: {answer.ips} (ttl {ttl}s)")
+        return answer.ips, None, self._observe_lookup('ok', start_time)
+    
+    def _store_chain(self, answer: DNSAnswer) -> None:
+        """
+        Кэширует каждое имя цепочки CNAME отдельно. Запись имени хранит
+        ссылку на цель со сроком жизни своей CNAME записи, а адреса - на
+        срок оставшейся части цепочки. Когда адреса истекут, а ссылка еще
+        действует, имя отвечается по цели, которую мог обновить другой алиас.
+        """
+        now = time.time()
+        remaining = answer.address_ttl if answer.address_ttl is not None else answer.ttl
+        self._store(answer.cnames[-1][1], {'ips': answer.ips}, self._clamp_ttl(remaining))
+        
+        for name, target, link_ttl in reversed(answer.cnames):
+            remaining = link_ttl if remaining is None else min(remaining, link_ttl)
+            self._store(name, {
+                'ips': answer.ips,
+                'cname': target,
+                'cname_expires': now + self._clamp_ttl(link_ttl)
+            }, self._clamp_ttl(remaining))
+    
+    def _cname_target(self, name: str) -> Optional[Tuple[str, float]]:
+        """
+        Для истекшей записи: имя, до которого ведут действующие ссылки
+        CNAME (первое со свежей записью или конец ссылок), и время
+        истечения самой короткой ссылки. None, если ссылок нет.
+        """
+        now = time.time()
+        target, expires = name, float('inf')
+        for _ in range(8):
+            entry = self.cache.get(target)
+            if entry is None:
+                break
+            if target != name and entry['expires'] > now:
+                break
+            if not entry.get('cname') or entry.get('cname_expires', 0) <= now:
+                break
+            expires = min(expires, entry['cname_expires'])
+            target = entry['cname']
+            if target == name:
+                return None
+        return (target, expires) if target != name else None
+    
+    def _refresh_alias(self, name: str, ips: List[str], link_expires: float,
+                       target_expires: float) -> None:
+        """Обновляет адреса алиаса по цели, не трогая срок его ссылки"""
+        entry = self.cache.get(name) or {}
+        ttl = max(1, int(min(link_expires, target_expires) - time.time()))
+        self._store(name, {
+            'ips': ips,
+            'cname': entry.get('cname'),
+            'cname_expires': entry.get('cname_expires', link_expires)
+        }, ttl)
+    
+    def _record_failure(self, domain: str, kind: str, error: str,
+                        start_time: float) -> Tuple[List[str], Optional[str], float]:
+        """
+        Кэширует таймаут или отказ сервера с экспоненциальной задержкой:
+        каждая следующая неудача подряд удваивает время до повторной попытки.
         """
+        previous = self.cache.get(domain) or {}
+        failures = previous.get('failures', 0) + 1
+        ttl = min(self.config.timeout_backoff * 2 ** (failures - 1), self.config.timeout_backoff_max)
+        
+        self._store(domain, {'ips': [], 'negative': kind, 'failures': failures}, ttl)
+        with self._failures_lock:
+            self.lookup_failures += 1
+        error_msg = f"Failed to resolve {domain}: {error}"
+        if self.config.dns_verbose:
+            print(f"Warning: {error_msg} (retry in {ttl}s)")
+        return [], error_msg, self._observe_lookup(kind, start_time)
+    
+    def _observe_lookup(self, result: str, start_time: float) -> float:
+        """Учитывает запрос в метриках. Возвращает время резолвинга"""
+        elapsed = time.time() - start_time
+        _LOOKUP_SECONDS.labels(self.config.dns_backend).observe(elapsed)
+        _LOOKUPS.labels(self.config.dns_backend, result).inc()
+        return elapsed
+    
+    def _store(self, domain: str, entry: Dict, ttl: int) -> None:
+        """Кладет запись в кэш с заданным TTL"""
+        now = time.time()
+        entry.update({
+            'timestamp': now,
+            'ttl': ttl,
+            'expires': now + ttl
+        })
+        try:
+            self.cache.set(domain, entry)
+        except OSError as e:
+            print(f"Warning: Could not save DNS cache: {e}")
+    
+    def _get_dns_servers(self) -> List[str]:
+        """DNS серверы из dns.servers, иначе серверы системного резолвера"""
+        return self.config.dns_servers or get_system_nameservers()
+    
+    async def _native_lookup(self, client: AsyncDNSClient, domain: str) -> Tuple[List[str], Optional[str], float]:
+        """Резолвит имя встроенным клиентом; одновременные вызовы для имени делят один запрос"""
+        return await self.flight.do_async((domain, QTYPE_A), lambda: self._native_query(client, domain))
+    
+    async def _native_query(self, client: AsyncDNSClient, domain: str) -> Tuple[List[str], Optional[str], float]:
+        """Резолвит одно имя встроенным клиентом"""
         start_time = time.time()
+        try:
+            message = await client.query(domain, QTYPE_A)
+        except DNSTimeoutError as e:
+            return self._record_failure(domain, 'timeout', str(e), start_time)
+        except DNSQueryError as e:
+            return self._record_failure(domain, 'error', str(e), start_time)
+        
+        ips, _, ttl = message.resolve_chain(domain, QTYPE_A)
+        links = message.cname_links(domain)
+        final = links[-1][1] if links else normalize_name(domain)
+        address_ttls = [record.ttl for record in message.answers
+                        if record.rtype == QTYPE_A and normalize_name(record.name) == final]
+        answer = DNSAnswer(
+            ips=ips,
+            status=RCODE_NAMES.get(message.rcode, str(message.rcode)),
+            ttl=ttl,
+            negative_ttl=message.soa_minimum(),
+            cnames=links,
+            address_ttl=min(address_ttls) if address_ttls else None
+        )
+        return self._record_answer(domain, answer, start_time)
+    
+    async def _native_resolve_all(self, names: List[str]) -> List[Tuple[List[str], Optional[str], float]]:
+        """Резолвит все имена одновременно (не более max_inflight в полете)"""
+        async with AsyncDNSClient(
+            self._get_dns_servers(),
+            timeout=self.config.dns_timeout,
+            retries=self.config.dns_retries,
+            max_inflight=self.config.max_inflight,
+            hedge=self.config.dns_hedge,
+            hedge_delay=self.config.dns_hedge_delay,
+            hedge_min_delay=self.config.dns_hedge_min_delay,
+            latency=self.latency
+        ) as client:
+            try:
+                return await asyncio.gather(*(self._native_lookup(client, name) for name in names))
+            finally:
+                self.hedged += client.hedged
+                self.hedge_wins += client.hedge_wins
+                self.failovers += client.failovers
+                for event, count in (('hedged', client.hedged), ('hedge_win', client.hedge_wins),
+                                     ('failover', client.failovers)):
+                    if count:
+                        _UPSTREAM_EVENTS.labels(event).inc(count)
+    
+    def _resolve_native(self, names: List[str]) -> Dict[str, Tuple[List[str], Optional[str], float]]:
+        """Резолвит промахи кэша встроенным асинхронным клиентом"""
+        outcomes = dict(zip(names, asyncio.run(self._native_resolve_all(names))))
+        self._save_cache()
+        return outcomes
+    
+    def _resolve_names(self, names: List[str]) -> Dict[str, Tuple[List[str], Optional[str], float]]:
+        """
+        Резолвит набор имен: сначала кэш, затем промахи встроенным клиентом
+        или (backend: dig) пакетами по batch_size через пул из max_workers потоков.
+        Каждое имя резолвится один раз; алиасы с действующей ссылкой CNAME
+        отвечаются по цели, а общая для нескольких алиасов цель резолвится один раз.
+        Кэш хранит имена в нормализованном виде (как цели CNAME); результат
+        возвращается по именам в том виде, в каком их передали.
+        """
+        canonical = {name: normalize_name(name) for name in names}
+        outcomes = self._resolve_canonical([canonical[name] for name in names])
+        return {name: outcomes[canonical[name]] for name in names}
+    
+    def _resolve_canonical(self, names: List[str]) -> Dict[str, Tuple[List[str], Optional[str], float]]:
+        """_resolve_names для уже нормализованных имен"""
+        outcomes: Dict[str, Tuple[List[str], Optional[str], float]] = {}
+        pending = []
+        # Алиас -> (цель, срок действия ссылок)
+        aliases: Dict[str, Tuple[str, float]] = {}
+        
+        unique = list(dict.fromkeys(names))
+        self.duplicates += len(names) - len(unique)
+        for name in unique:
+            entry = self._get_valid_entry(name)
+            if entry is not None and entry.get('negative'):
+                # Негативный кэш: имя не существует или сервер недавно не ответил
+                self.negative_hits += 1
+                outcomes[name] = ([], f"Failed to resolve {name}: {entry['negative'].upper()} (cached)", 0.0)
+            elif entry is not None:
+                cached_ips = entry['ips']
+                outcomes[name] = (cached_ips, None, 0.0)
+                if self.config.dns_verbose:
+                    print(f"Cache hit for {name}: {cached_ips}")
+            else:
+                alias = self._cname_target(name)
+                if alias is None:
+                    pending.append(name)
+                else:
+                    aliases[name] = alias
+        
+        # Алиасы со свежей целью отвечаются из кэша, остальные ждут запроса цели
+        by_target: Dict[str, List[str]] = {}
+        for name, (target, link_expires) in aliases.items():
+            entry = self.cache.get(target)
+            if entry is not None and entry['expires'] > time.time() and entry.get('ips'):
+                self._refresh_alias(name, entry['ips'], link_expires, entry['expires'])
+                outcomes[name] = (entry['ips'], None, 0.0)
+                self.cname_saved += 1
+                if self.config.dns_verbose:
+                    print(f"Cache hit for {name} via CNAME {target}: {entry['ips']}")
+            else:
+                by_target.setdefault(target, []).append(name)
+        
+        if not pending and not by_target:
+            return outcomes
+        
+        requested = set(pending)
+        fresh = self._resolve_pending(pending + [target for target in by_target if target not in requested])
+        
+        fallback = []
+        for target, names_via in by_target.items():
+            ips, _, elapsed = fresh[target]
+            entry = self.cache.get(target)
+            if not ips or entry is None:
+                # Цепочка могла смениться - алиасы резолвятся сами
+                fallback.extend(names_via)
+                continue
+            for name in names_via:
+                self._refresh_alias(name, ips, aliases[name][1], entry['expires'])
+                outcomes[name] = (ips, None, elapsed)
+            # Запрос цели, которую не просили отдельно, заменил запрос одного алиаса
+            self.cname_saved += len(names_via) - (0 if target in requested else 1)
+        
+        if fallback:
+            fresh.update(self._resolve_pending(fallback))
+        outcomes.update((name, fresh[name]) for name in pending + fallback)
+        
+        # Статистика проверок учитывает только свежие ответы
+        self.prober.observe(pending + fallback, self.cache)
+        self.prober.save()
+        return outcomes
+    
+    def _resolve_pending(self, pending: List[str]) -> Dict[str, Tuple[List[str], Optional[str], float]]:
+        """Резолвит промахи кэша выбранным бэкендом"""
+        if self.config.dns_backend == 'native':
+            return self._resolve_native(pending)
+        
+        outcomes: Dict[str, Tuple[List[str], Optional[str], float]] = {}
+        workers = min(self.config.max_workers, len(pending))
+        batch_size = max(1, self.config.batch_size)
+        
+        if not self.config.parallel_resolve or workers <= 1:
+            for name in pending:
+                outcomes[name] = self._lookup(name)
+            self._save_cache()
+            return outcomes
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dns") as pool:
+            for offset in range(0, len(pending), batch_size):
+                batch = pending[offset:offset + batch_size]
+                for name, outcome in zip(batch, pool.map(self._lookup, batch)):
+                    outcomes[name] = outcome
+        
+        # Остаток изменений, не сброшенный по счетчику или таймеру
+        self._save_cache()
+        return outcomes
+    
+    def _build_result(self, domain: Domain, names: List[str],
+                      outcomes: Dict[str, Tuple[List[str], Optional[str], float]]) -> DNSResult:
+        """Собирает DNSResult домена из результатов резолвинга его имен"""
         all_ips = []
         errors = []
+        resolution_time = 0.0
+        
+        for name in names:
+            ips, error, elapsed = outcomes[name]
+            all_ips.extend(ips)
+            resolution_time += elapsed
+            if error:
+                errors.append(error)
+        
+        # Убираем дубликаты IP, сохраняя порядок
+        unique_ips = list(dict.fromkeys(all_ips))
+        
+        return DNSResult(
+            domain=domain.name,
+            ips=unique_ips,
+            success=len(unique_ips) > 0,
+            error_message="; ".join(errors) if errors else None,
+            resolution_time=resolution_time
+        )
+    
+    @property
+    def deduplicated(self) -> int:
+        """Повторные запросы имени за прогон, не ушедшие на сервер отдельно"""
+        return self.duplicates + self.flight.shared
+    
+    def expand_domain(self, domain: Domain) -> List[str]:
+        """Имена, которые резолвятся для домена (с учетом wildcard)"""
+        return self._expand_wildcard_domain(domain.name, domain.domain_type)
+    
+    def resolve_names(self, names: List[str]) -> Dict[str, Tuple[List[str], Optional[str], float]]:
+        """
+        Резолвит конкретные имена без wildcard расширения.
+        Возвращает {имя: (ips, error, время резолвинга)}.
+        """
+        return self._resolve_names(names)
+    
+    def resolve_domain(self, domain: Domain) -> DNSResult:
+        """
+        Резолвит один домен с учетом его типа.
+        """
+        start_time = time.time()
         
         try:
             # Получаем список доменов для резолвинга
@@ -141,49 +595,10 @@ class DNSResolver:
                 domain.name, domain.domain_type
             )
             
-            for dom in domains_to_resolve:
-                try:
-                    # Проверяем кэш
-                    if self._is_cache_valid(dom):
-                        cached_ips = self.cache[dom]['ips']
-                        all_ips.extend(cached_ips)
-                        print(f"Cache hit for {dom}: {cached_ips}")
-                        continue
-                    
-                    # Резолвим через dig
-                    ips = self._dig_resolve(dom)
-                    if ips:
-                        all_ips.extend(ips)
-                        
-                        # Сохраняем в кэш
-                        self.cache[dom] = {
-                            'ips': ips,
-                            'timestamp': time.time()
-                        }
-                        print(f"Resolved {dom}: {ips}")
-                    
-                except Exception as e:
-                    error_msg = f"Failed to resolve {dom}: {str(e)}"
-                    errors.append(error_msg)
-                    print(f"Warning: {error_msg}")
-            
-            # Убираем дубликаты IP
-            unique_ips = list(set(all_ips))
-            resolution_time = time.time() - start_time
-            
-            # Сохраняем кэш
-            if unique_ips:
-                self._save_cache()
-            
-            success = len(unique_ips) > 0
-            
-            return DNSResult(
-                domain=domain.name,
-                ips=unique_ips,
-                success=success,
-                error_message="; ".join(errors) if errors else None,
-                resolution_time=resolution_time
-            )
+            outcomes = self._resolve_names(domains_to_resolve)
+            result = self._build_result(domain, domains_to_resolve, outcomes)
+            result.resolution_time = time.time() - start_time
+            return result
             
         except Exception as e:
             resolution_time = time.time() - start_time
@@ -200,24 +615,49 @@ class DNSResolver:
     def resolve_domains(self, domains: List[Domain]) -> List[DNSResult]:
         """
         Резолвит список доменов.
-        В будущем можно добавить параллельную обработку.
+        Все имена (включая wildcard расширения) резолвятся одним пулом,
+        результаты возвращаются в порядке входного списка.
         """
-        results = []
-        
         print(f"Resolving {len(domains)} domains...")
         
-        for i, domain in enumerate(domains, 1):
-            print(f"[{i}/{len(domains)}] Resolving {domain.name}...")
-            result = self.resolve_domain(domain)
-            results.append(result)
+        expansions = [
+            self._expand_wildcard_domain(domain.name, domain.domain_type)
+            for domain in domains
+        ]
+        all_names = [name for names in expansions for name in names]
+        
+        failures_before = self.lookup_failures
+        outcomes = self._resolve_names(all_names)
+        
+        resolved = sum(1 for ips, _, _ in outcomes.values() if ips)
+        print(f"DNS names: {resolved} of {len(outcomes)} resolved, "
+              f"{len(outcomes) - resolved} without addresses")
+        failed = self.lookup_failures - failures_before
+        if failed:
+            print(f"DNS lookups failed: {failed} timeouts or server errors, "
+                  f"retried after backoff (--verbose lists them)")
+        stats = self.cache.get_stats()
+        print(f"DNS cache: {stats['hits']} hits ({self.negative_hits} negative), "
+              f"{stats['misses'] + stats['stale']} misses ({stats['stale']} expired), "
+              f"{stats['evictions'] + stats['expired_evictions']} evictions")
+        print(f"DNS lookups saved: {self.deduplicated} duplicates shared one query, "
+              f"{self.cname_saved} answered via CNAME targets")
+        if self.hedged or self.failovers:
+            print(f"DNS upstream: {self.hedged} hedged queries ({self.hedge_wins} answered by "
+                  f"the next server first), {self.failovers} failovers after errors")
+        if any(domain.domain_type == DomainType.DEEP_WILDCARD for domain in domains):
+            probes = self.prober.summary()
+            print(f"Wildcard probing: {probes['zones']} zones ({probes['wildcard']} wildcard), "
+                  f"{probes['pruned']} pruned candidates")
         
-        return results
+        return [
+            self._build_result(domain, names, outcomes)
+            for domain, names in zip(domains, expansions)
+        ]
     
     def clear_cache(self) -> None:
         """Очищает DNS кэш"""
-        self.cache = {}
-        if self.cache_file.exists():
-            self.cache_file.unlink()
+        self.cache.clear()
         print("DNS cache cleared")
     
     def get_cache_stats(self) -> Dict:
@@ -226,9 +666,52 @@ class DNSResolver:
         valid_entries = sum(1 for domain in self.cache.keys() 
                            if self._is_cache_valid(domain))
         
+        # Распределение TTL по корзинам (записи старого формата - без TTL)
+        ttl_buckets = {label: 0 for label, _ in TTL_BUCKETS}
+        ttl_buckets['no ttl'] = 0
+        ttls = []
+        negative = {kind: 0 for kind in NEGATIVE_KINDS}
+        negative_valid = 0
+        cname_entries = 0
+        now = time.time()
+        for entry in self.cache.values():
+            if entry.get('cname'):
+                cname_entries += 1
+            kind = entry.get('negative')
+            if kind:
+                negative[kind] = negative.get(kind, 0) + 1
+                if entry['expires'] > now:
+                    negative_valid += 1
+                continue
+            
+            ttl = entry.get('ttl')
+            if ttl is None:
+                ttl_buckets['no ttl'] += 1
+                continue
+            ttls.append(ttl)
+            for label, upper in TTL_BUCKETS:
+                if ttl <= upper:
+                    ttl_buckets[label] += 1
+                    break
+        ttls.sort()
+        
         return {
             'total_entries': total_entries,
             'valid_entries': valid_entries,
             'expired_entries': total_entries - valid_entries,
+            'ttl_distribution': ttl_buckets,
+            'ttl_min': ttls[0] if ttls else None,
+            'ttl_median': ttls[len(ttls) // 2] if ttls else None,
+            'ttl_max': ttls[-1] if ttls else None,
+            'negative_entries': sum(negative.values()),
+            'negative_valid': negative_valid,
+            'negative_by_kind': negative,
+            'negative_hits': self.negative_hits,
+            'cname_entries': cname_entries,
+            'cname_saved': self.cname_saved,
+            'deduplicated': self.deduplicated,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            **self.cache.get_stats(),
             'cache_file': str(self.cache_file)
         }
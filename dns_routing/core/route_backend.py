@@ -0,0 +1,545 @@
+"""
+Бэкенды маршрутизации для DNS Routing Manager.
+
+RouteManager решает, какие маршруты нужны, а бэкенд их устанавливает:
+    macos      - команды route (пакетами через привилегированного помощника)
+    netlink    - rtnetlink Linux: пакеты сообщений одним sendmsg, без процессов
+    simulator  - таблица маршрутов в памяти с задержкой и отказами операций,
+                 для проверки и нагрузочных прогонов без root и интерфейсов
+
+Ошибки операций передаются текстом в стиле команды route:
+"File exists" при повторном добавлении, "not in table" при удалении
+отсутствующего маршрута.
+"""
+import errno
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..models import Route, RouteEntry, RoutingConfig
+from ..utils import rtnetlink
+from .route_helper import RouteHelper
+from .route_table import RouteTable, normalize_prefix, read_route_table
+
+
+# Операция пакета: ('add' | 'delete', маршрут)
+RouteOperation = Tuple[str, Route]
+
+# Колбэк потоковой обработки: (индекс операции, успех, вывод)
+ResultCallback = Callable[[int, bool, str], None]
+
+
+class RouteBackend:
+    """
+    Интерфейс бэкенда. Наследники реализуют add, delete и dump;
+    batch по умолчанию выполняет операции по одной.
+    """
+
+    name = "base"
+
+    def add(self, route: Route) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    def delete(self, route: Route) -> Tuple[bool, str]:
+        """Удаляет маршрут к route.target (интерфейс не учитывается)"""
+        raise NotImplementedError
+
+    def dump(self) -> RouteTable:
+        """Снимок всей таблицы маршрутов"""
+        raise NotImplementedError
+
+    def batch(self, operations: List[RouteOperation],
+              on_result: Optional[ResultCallback] = None) -> List[Tuple[bool, str]]:
+        """Выполняет пакет операций, результаты - в исходном порядке"""
+        results = []
+        for index, (action, route) in enumerate(operations):
+            results.append(self.add(route) if action == 'add' else self.delete(route))
+            if on_result is not None:
+                on_result(index, *results[-1])
+        return results
+
+    # Бэкенд с собственной таблицей маршрутов умеет очищать ее целиком
+    supports_flush = False
+
+    def flush(self) -> int:
+        """Удаляет все маршруты своей таблицы. Возвращает их количество"""
+        raise NotImplementedError
+
+    def lookup(self, target: str) -> Optional[Dict]:
+        """Информация о маршруте к target по снимку таблицы"""
+        entry = self.dump().get(target)
+        if entry is None:
+            return None
+        return {
+            'destination': entry.destination,
+            'gateway': entry.gateway or '-',
+            'interface': entry.interface or '-',
+            'flags': entry.flags,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class MacOSRouteBackend(RouteBackend):
+    """Команды route macOS: пакеты через помощника, одиночные - через sudo"""
+
+    name = "macos"
+
+    def __init__(self, require_sudo: bool = True, use_helper: bool = True,
+                 helper: Optional[RouteHelper] = None):
+        self.require_sudo = require_sudo
+        self.use_helper = use_helper
+        self._helper = helper
+
+    @staticmethod
+    def build_command(action: str, route: Route) -> List[str]:
+        """argv команды route add/delete для маршрута"""
+        cmd = ['route', action, '-host' if route.is_host else '-net', route.target]
+        if action == 'add':
+            if route.gateway:
+                cmd.append(route.gateway)
+            else:
+                # Для туннельных интерфейсов (utun)
+                cmd.extend(['-interface', route.interface])
+        return cmd
+
+    def _get_helper(self) -> Optional[RouteHelper]:
+        """Помощник для пакетных операций (запускается при первом использовании)"""
+        if self._helper is None and self.use_helper:
+            self._helper = RouteHelper(use_sudo=self.require_sudo)
+        return self._helper
+
+    def run_command(self, cmd: List[str]) -> Tuple[bool, str]:
+        """
+        Выполняет команду route с обработкой ошибок.
+        Возвращает (success, output/error)
+        """
+        try:
+            # Добавляем sudo если требуется
+            if self.require_sudo:
+                cmd = ['sudo'] + cmd
+
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+
+            if result.returncode == 0:
+                return True, result.stdout.strip()
+            else:
+                return False, result.stderr.strip()
+
+        except subprocess.TimeoutExpired:
+            return False, "Command timeout"
+        except Exception as e:
+            return False, str(e)
+
+    def add(self, route: Route) -> Tuple[bool, str]:
+        return self.run_command(self.build_command('add', route))
+
+    def delete(self, route: Route) -> Tuple[bool, str]:
+        return self.run_command(self.build_command('delete', route))
+
+    def batch(self, operations: List[RouteOperation],
+              on_result: Optional[ResultCallback] = None) -> List[Tuple[bool, str]]:
+        """
+        Пакет команд route: через помощника одним потоком,
+        либо (routing.helper: false) по одной через sudo.
+        """
+        helper = self._get_helper()
+        if helper is None:
+            return super().batch(operations, on_result)
+        return helper.run_batch([self.build_command(action, route) for action, route in operations],
+                                on_result)
+
+    def dump(self) -> RouteTable:
+        return read_route_table()
+
+    def lookup(self, target: str) -> Optional[Dict]:
+        """Маршрут, по которому ядро отправит трафик к target (route -n get)"""
+        success, output = self.run_command(['route', '-n', 'get', target])
+        if not success:
+            return None
+
+        route_info = {}
+        for line in output.split('\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                route_info[key.strip()] = value.strip()
+        return route_info
+
+    def close(self) -> None:
+        """Останавливает привилегированного помощника, если он запускался"""
+        if self._helper is not None:
+            self._helper.close()
+
+
+class SimulatorRouteBackend(RouteBackend):
+    """
+    Таблица маршрутов в памяти.
+
+    latency      - задержка на операцию, секунды
+    failure_rate - доля операций, завершающихся ошибкой
+    fail_targets - цели, операции с которыми всегда завершаются ошибкой
+    state_file   - файл, в котором таблица сохраняется между запусками
+    """
+
+    name = "simulator"
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0,
+                 fail_targets: Iterable[str] = (), seed: Optional[int] = None,
+                 state_file: Optional[Path] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_targets = {normalize_prefix(target) for target in fail_targets}
+        self.state_file = Path(state_file) if state_file else None
+        self.table = RouteTable()
+        self.operations = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._load_state()
+
+    def _load_state(self) -> None:
+        if self.state_file is None or not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                entries = [RouteEntry(*row) for row in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return
+        self.table = RouteTable(entries)
+
+    def _save_state(self) -> None:
+        if self.state_file is None:
+            return
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        rows = [[entry.destination, entry.gateway, entry.interface, entry.flags]
+                for entry in self.table.entries.values()]
+        with open(self.state_file, 'w') as f:
+            json.dump(rows, f, separators=(',', ':'))
+
+    def _should_fail(self, prefix: str) -> bool:
+        self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if prefix in self.fail_targets or (self.failure_rate and
+                                           self._random.random() < self.failure_rate):
+            self.failures += 1
+            return True
+        return False
+
+    def add(self, route: Route) -> Tuple[bool, str]:
+        prefix = normalize_prefix(route.target)
+        if self._should_fail(prefix):
+            return False, f"route: simulated failure adding {route.target}"
+        if prefix in self.table.entries:
+            return False, "route: writing to routing socket: File exists"
+        self.table.entries[prefix] = RouteEntry(
+            destination=prefix,
+            gateway=route.gateway,
+            interface=route.interface,
+            flags='UGHS' if route.is_host else 'UGS'
+        )
+        return True, f"add {'host' if route.is_host else 'net'} {route.target}"
+
+    def delete(self, route: Route) -> Tuple[bool, str]:
+        prefix = normalize_prefix(route.target)
+        if self._should_fail(prefix):
+            return False, f"route: simulated failure deleting {route.target}"
+        if self.table.entries.pop(prefix, None) is None:
+            return False, "route: writing to routing socket: not in table"
+        return True, f"delete {'host' if route.is_host else 'net'} {route.target}"
+
+    def dump(self) -> RouteTable:
+        return RouteTable(self.table.entries.values())
+
+    def close(self) -> None:
+        self._save_state()
+
+
+class NetlinkRouteBackend(RouteBackend):
+    """
+    Маршруты Linux через rtnetlink (нужен CAP_NET_ADMIN, например root).
+
+    Пакет операций кодируется в RTM_NEWROUTE/RTM_DELROUTE и уходит в ядро
+    блоками по несколько тысяч сообщений на один sendmsg. Ядро отвечает
+    только на ошибки; ответы каждого блока читаются до отправки следующего,
+    чтобы не переполнить приемный буфер сокета.
+
+    table         - номер таблицы (254 - main). В отдельной таблице все маршруты
+                    наши, и ее можно очистить целиком через flush()
+    rule_priority - если не 0, добавляется правило 'from all lookup <table>'
+    """
+
+    name = "netlink"
+
+    # Оценка памяти, которую ядро учитывает на одно подтверждение в буфере сокета
+    _ACK_COST = 1024
+    # Максимальный размер сообщения о маршруте
+    _MESSAGE_SIZE = 64
+    _BUFFER_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, table: int = rtnetlink.RT_TABLE_MAIN, rule_priority: int = 0,
+                 timeout: float = 10.0):
+        self.table = table
+        self.rule_priority = rule_priority
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._seq = 0
+        self._chunk = 256
+        self._ifindex: Dict[str, int] = {}
+        self._ifname: Dict[int, str] = {}
+
+    @property
+    def supports_flush(self) -> bool:
+        return self.table != rtnetlink.RT_TABLE_MAIN
+
+    def _socket(self) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            sock.bind((0, 0))
+            for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+                sock.setsockopt(socket.SOL_SOCKET, option, self._BUFFER_SIZE)
+            try:
+                sock.setsockopt(rtnetlink.SOL_NETLINK, rtnetlink.NETLINK_CAP_ACK, 1)
+            except OSError:
+                pass
+            sock.settimeout(self.timeout)
+        except OSError:
+            sock.close()
+            raise
+
+        # Ядро ограничивает буферы net.core.*mem_max - размер блока считаем по факту:
+        # блок должен поместиться в буфер отправки, а ошибки на весь блок - в приемный
+        rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        sndbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+        self._chunk = max(16, min(rcvbuf // self._ACK_COST, sndbuf // (2 * self._MESSAGE_SIZE)))
+        self._sock = sock
+
+        if self.rule_priority:
+            self._ensure_rule()
+        return sock
+
+    def _next_seq(self) -> int:
+        self._seq = self._seq % 0x7FFFFFFF + 1
+        return self._seq
+
+    def _interface_index(self, name: str) -> int:
+        if name not in self._ifindex:
+            try:
+                self._ifindex[name] = socket.if_nametoindex(name)
+            except OSError:
+                raise ValueError(f"Unknown interface {name}")
+        return self._ifindex[name]
+
+    def _interface_name(self, index: Optional[int]) -> Optional[str]:
+        if index is None:
+            return None
+        if index not in self._ifname:
+            try:
+                self._ifname[index] = socket.if_indextoname(index)
+            except OSError:
+                self._ifname[index] = str(index)
+        return self._ifname[index]
+
+    def _encode(self, action: str, route: Route, seq: int) -> bytes:
+        """
+        Кодирует операцию без запроса подтверждения: ядро ответит только
+        на ошибку, а конец пакета отмечается NLMSG_NOOP с подтверждением.
+        """
+        address, _, prefix = route.target.partition('/')
+        prefix_len = int(prefix) if prefix else 32
+        try:
+            destination = socket.inet_aton(address)
+        except OSError:
+            raise ValueError(f"Invalid IP or network: {route.target}")
+        if not 0 <= prefix_len <= 32:
+            raise ValueError(f"Invalid IP or network: {route.target}")
+        if prefix_len < 32:
+            mask = (0xFFFFFFFF << (32 - prefix_len)) & 0xFFFFFFFF
+            destination = (int.from_bytes(destination, 'big') & mask).to_bytes(4, 'big')
+
+        if action == 'add':
+            return rtnetlink.pack_route(
+                rtnetlink.RTM_NEWROUTE, seq, destination, prefix_len, self.table,
+                gateway=socket.inet_aton(route.gateway) if route.gateway else None,
+                oif=self._interface_index(route.interface) if route.interface else None,
+                flags=rtnetlink.NLM_F_REQUEST | rtnetlink.NLM_F_CREATE | rtnetlink.NLM_F_EXCL
+            )
+        return rtnetlink.pack_route(rtnetlink.RTM_DELROUTE, seq, destination, prefix_len,
+                                    self.table, flags=rtnetlink.NLM_F_REQUEST)
+    
+    def _ensure_rule(self) -> None:
+        """Правило выбора нашей таблицы (повторное добавление - не ошибка)"""
+        seq = self._next_seq()
+        self._sock.send(rtnetlink.pack_rule(seq, self.table, self.rule_priority))
+        code = self._receive_errors({}, seq).get(-1, 0)
+        if code not in (0, -errno.EEXIST):
+            raise OSError(-code, f"Could not add rule for table {self.table}: {os.strerror(-code)}")
+
+    def _receive_errors(self, pending: Dict[int, int], barrier_seq: int) -> Dict[int, int]:
+        """
+        Читает ответы до подтверждения сообщения barrier_seq.
+        pending - {seq: индекс операции}. Возвращает {индекс: код ошибки};
+        код самого barrier_seq, если он не 0, - под индексом -1.
+        """
+        codes = {}
+        while True:
+            data = self._sock.recv(1 << 20)
+            for msg_type, _, seq, body in rtnetlink.iter_messages(data):
+                if msg_type != rtnetlink.NLMSG_ERROR:
+                    continue
+                code = rtnetlink.parse_error(body)
+                if seq == barrier_seq:
+                    if code:
+                        codes[-1] = code
+                    return codes
+                if seq in pending:
+                    codes[pending[seq]] = code
+
+    def batch(self, operations: List[RouteOperation],
+              on_result: Optional[ResultCallback] = None) -> List[Tuple[bool, str]]:
+        """
+        Блоки операций уходят одним sendmsg с меткой конца; ядро обрабатывает
+        сообщения по порядку, поэтому все, для которых до подтверждения метки
+        не пришла ошибка, выполнены успешно.
+        """
+        results: List[Optional[Tuple[bool, str]]] = [None] * len(operations)
+
+        def finish(index: int, success: bool, output: str) -> None:
+            results[index] = (success, output)
+            if on_result is not None:
+                on_result(index, success, output)
+
+        sock = self._socket()
+        for start in range(0, len(operations), self._chunk):
+            buffer = []
+            pending: Dict[int, int] = {}
+            for index in range(start, min(start + self._chunk, len(operations))):
+                action, route = operations[index]
+                seq = self._next_seq()
+                try:
+                    buffer.append(self._encode(action, route, seq))
+                except ValueError as e:
+                    finish(index, False, str(e))
+                    continue
+                pending[seq] = index
+            if not pending:
+                continue
+
+            barrier_seq = self._next_seq()
+            buffer.append(rtnetlink.pack_noop(barrier_seq))
+            try:
+                sock.send(b''.join(buffer))
+                codes = self._receive_errors(pending, barrier_seq)
+            except OSError as e:
+                # Сокет в неизвестном состоянии - следующий пакет откроет новый
+                self.close()
+                for index in pending.values():
+                    finish(index, False, f"Netlink error: {e}")
+                for index in range(start + self._chunk, len(operations)):
+                    finish(index, False, f"Netlink error: {e}")
+                break
+
+            for index in pending.values():
+                code = codes.get(index, 0)
+                finish(index, code == 0, os.strerror(-code) if code else "")
+
+        return results
+
+    def add(self, route: Route) -> Tuple[bool, str]:
+        return self.batch([('add', route)])[0]
+
+    def delete(self, route: Route) -> Tuple[bool, str]:
+        return self.batch([('delete', route)])[0]
+
+    def _dump_routes(self) -> List[rtnetlink.NetlinkRoute]:
+        sock = self._socket()
+        seq = self._next_seq()
+        sock.send(rtnetlink.pack_route_dump(seq))
+
+        routes = []
+        while True:
+            data = sock.recv(1 << 20)
+            for msg_type, _, msg_seq, body in rtnetlink.iter_messages(data):
+                if msg_seq != seq:
+                    continue
+                if msg_type == rtnetlink.NLMSG_DONE:
+                    return routes
+                if msg_type == rtnetlink.NLMSG_ERROR:
+                    code = rtnetlink.parse_error(body)
+                    raise OSError(-code, f"Route dump failed: {os.strerror(-code)}")
+                if msg_type == rtnetlink.RTM_NEWROUTE:
+                    route = rtnetlink.parse_route(body)
+                    if route is not None and route.table == self.table:
+                        routes.append(route)
+
+    def dump(self) -> RouteTable:
+        try:
+            routes = self._dump_routes()
+        except OSError as e:
+            raise RuntimeError(f"Could not read routing table: {e}")
+        return RouteTable(
+            RouteEntry(
+                destination=route.destination,
+                gateway=route.gateway,
+                interface=self._interface_name(route.oif),
+                flags=rtnetlink.route_type_name(route.route_type)
+            )
+            for route in routes
+        )
+
+    def flush(self) -> int:
+        """Очищает отдельную таблицу: один дамп и один пакет удалений"""
+        if not self.supports_flush:
+            raise RuntimeError("Refusing to flush the main routing table")
+
+        operations = [
+            ('delete', Route(target=route.destination, interface='',
+                             is_host=route.destination.endswith('/32')))
+            for route in self._dump_routes()
+        ]
+        return sum(1 for success, _ in self.batch(operations) if success)
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def route_backend_name(config: RoutingConfig) -> str:
+    """Имя бэкенда по routing.backend (auto - netlink на Linux, команды route на macOS)"""
+    if config.route_backend == 'auto':
+        return 'netlink' if sys.platform.startswith('linux') else 'macos'
+    return config.route_backend
+
+
+def create_route_backend(config: RoutingConfig, helper: Optional[RouteHelper] = None) -> RouteBackend:
+    """Бэкенд по routing.backend"""
+    backend = route_backend_name(config)
+
+    if backend == 'netlink':
+        return NetlinkRouteBackend(table=config.netlink_table,
+                                   rule_priority=config.netlink_rule_priority)
+    if backend == 'simulator':
+        return SimulatorRouteBackend(
+            latency=config.simulator_latency,
+            failure_rate=config.simulator_failure_rate,
+            state_file=config.cache_dir / "simulated_routes.json"
+        )
+    if backend == 'macos':
+        return MacOSRouteBackend(require_sudo=config.require_sudo,
+                                 use_helper=config.use_route_helper, helper=helper)
+    raise ValueError(f"Unknown route backend: {config.route_backend}")
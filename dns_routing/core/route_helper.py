@@ -0,0 +1,329 @@
+"""
+Привилегированный помощник для операций с маршрутами.
+
+Запускается один раз на прогон (sudo python -m dns_routing.core.route_helper),
+получает команды route пакетами через stdin и построчно возвращает результаты
+через stdout, без повторного sudo на каждый адрес.
+
+Протокол - JSON строки:
+    запрос:  {"id": 1, "argv": ["route", "add", "-host", "1.2.3.4", "10.0.0.1"]}
+    ответ:   {"id": 1, "ok": true, "output": "..."}
+
+Режим --fake ничего не выполняет и ведет таблицу маршрутов в памяти:
+так протокол можно проверять и замерять без root.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+# Имя сетевого интерфейса (en0, utun9, wg0, eth0.100)
+_INTERFACE_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.:-]{0,14}$')
+
+# Колбэк потоковой обработки: (индекс операции, успех, вывод)
+ResultCallback = Callable[[int, bool, str], None]
+
+
+class _FakeExecutor:
+    """Имитация команды route: таблица маршрутов в памяти"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.table: Set[str] = set()
+
+    def __call__(self, argv: List[str]) -> Tuple[bool, str]:
+        if self.latency:
+            time.sleep(self.latency)
+
+        if len(argv) >= 4 and argv[0] == 'route' and argv[1] in ('add', 'delete'):
+            target = argv[3]
+            if argv[1] == 'add':
+                if target in self.table:
+                    return False, "route: writing to routing socket: File exists"
+                self.table.add(target)
+                return True, f"add {argv[2][1:]} {target}"
+            if target not in self.table:
+                return False, "route: writing to routing socket: not in table"
+            self.table.discard(target)
+            return True, f"delete {argv[2][1:]} {target}"
+
+        return True, ""
+
+
+def _is_address(value: str) -> bool:
+    try:
+        ipaddress.IPv4Address(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_network(value: str) -> bool:
+    try:
+        ipaddress.IPv4Network(value, strict=False)
+        return True
+    except ValueError:
+        return False
+
+
+def _route_allowed(args: List[str]) -> bool:
+    """route [-n] add|delete -host|-net <цель> [<шлюз> | -interface <интерфейс>]"""
+    if args[:1] == ['-n']:
+        args = args[1:]
+    if len(args) < 3 or args[0] not in ('add', 'delete') or args[1] not in ('-host', '-net'):
+        return False
+    target, rest = args[2], args[3:]
+    if not (_is_address(target) if args[1] == '-host' else _is_network(target)):
+        return False
+    if not rest:
+        return True
+    if len(rest) == 1:
+        return _is_address(rest[0])
+    return len(rest) == 2 and rest[0] == '-interface' and bool(_INTERFACE_RE.match(rest[1]))
+
+
+def _ip_allowed(args: List[str]) -> bool:
+    """ip [-4] route add|del|replace <префикс> [via <шлюз>] [dev <интерфейс>] [table N] [metric N]"""
+    if args[:1] == ['-4']:
+        args = args[1:]
+    if len(args) < 3 or args[0] != 'route' or args[1] not in ('add', 'del', 'replace'):
+        return False
+    if not _is_network(args[2]):
+        return False
+    options = args[3:]
+    if len(options) % 2:
+        return False
+    seen = set()
+    for key, value in zip(options[::2], options[1::2]):
+        if key in seen:
+            return False
+        seen.add(key)
+        if key == 'via':
+            valid = _is_address(value)
+        elif key == 'dev':
+            valid = bool(_INTERFACE_RE.match(value))
+        elif key in ('table', 'metric'):
+            valid = value.isdigit()
+        else:
+            valid = False
+        if not valid:
+            return False
+    return True
+
+
+def _netstat_allowed(args: List[str]) -> bool:
+    """netstat -rn [-f inet]"""
+    return args in (['-rn'], ['-rn', '-f', 'inet'])
+
+
+# Помощник работает от root - выполняем только команды управления маршрутами,
+# проверяя весь argv, а не только имя программы
+ALLOWED_COMMANDS: Dict[str, Callable[[List[str]], bool]] = {
+    'route': _route_allowed,
+    'ip': _ip_allowed,
+    'netstat': _netstat_allowed,
+}
+
+
+def is_allowed(argv: List[str]) -> bool:
+    """argv - одна из разрешенных команд управления маршрутами"""
+    if not argv or not all(isinstance(arg, str) for arg in argv):
+        return False
+    check = ALLOWED_COMMANDS.get(argv[0])
+    return check is not None and check(argv[1:])
+
+
+def _execute(argv: List[str]) -> Tuple[bool, str]:
+    """Выполняет разрешенную команду"""
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=30)
+        if result.returncode == 0:
+            return True, result.stdout.strip()
+        return False, result.stderr.strip()
+    except subprocess.TimeoutExpired:
+        return False, "Command timeout"
+    except Exception as e:
+        return False, str(e)
+
+
+def serve(stdin=None, stdout=None, fake: bool = False, latency: float = 0.0) -> None:
+    """Цикл помощника: читает запросы до EOF и отвечает на каждый"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    executor = _FakeExecutor(latency) if fake else _execute
+
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request['id']
+            argv = list(request['argv'])
+            if is_allowed(argv):
+                ok, output = executor(argv)
+            else:
+                ok, output = False, f"Command not allowed: {argv}"
+            response = {'id': request_id, 'ok': ok, 'output': output}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {'id': request_id, 'ok': False, 'output': f"Bad request: {e}"}
+        stdout.write(json.dumps(response) + '\n')
+        stdout.flush()
+
+
+class RouteHelper:
+    """
+    Клиент помощника: запускает процесс один раз и отправляет ему пакеты команд.
+
+    Использование:
+        with RouteHelper(use_sudo=True) as helper:
+            results = helper.run_batch([["route", "add", "-host", "1.2.3.4", "10.0.0.1"]])
+    """
+
+    def __init__(self, use_sudo: bool = True, fake: bool = False, fake_latency: float = 0.0):
+        self.use_sudo = use_sudo and not fake and os.geteuid() != 0
+        self.fake = fake
+        self.fake_latency = fake_latency
+        self._process: Optional[subprocess.Popen] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'RouteHelper':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> None:
+        """Запускает помощника (sudo спросит пароль один раз)"""
+        if self.running:
+            return
+
+        cmd = [sys.executable, '-m', 'dns_routing.core.route_helper']
+        if self.fake:
+            cmd += ['--fake', '--latency', str(self.fake_latency)]
+        if self.use_sudo:
+            cmd = ['sudo'] + cmd
+
+        # python -m ищет пакет в текущей директории - запускаем из корня проекта
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=Path(__file__).resolve().parents[2]
+        )
+
+    def close(self) -> None:
+        """Закрывает stdin - помощник завершается по EOF"""
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+            self._process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+        self._process = None
+
+    @staticmethod
+    def _parse_response(line: str, first_id: int, count: int) -> Optional[Tuple[int, bool, str]]:
+        """
+        Разбирает ответ помощника в (индекс операции, успех, вывод).
+        None - ответ не разобрать или его id не из этого пакета.
+        """
+        try:
+            response = json.loads(line)
+            response_id = response['id']
+            result = (bool(response['ok']), str(response.get('output', '')))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        if not isinstance(response_id, int) or isinstance(response_id, bool):
+            return None
+        index = response_id - first_id
+        if not 0 <= index < count:
+            return None
+        return (index,) + result
+
+    def run_batch(self, commands: List[List[str]],
+                  on_result: Optional[ResultCallback] = None) -> List[Tuple[bool, str]]:
+        """
+        Отправляет пакет команд и собирает результаты в исходном порядке.
+        Запросы пишутся отдельным потоком, пока ответы читаются по мере готовности.
+        """
+        if not commands:
+            return []
+
+        with self._lock:
+            self.start()
+            process = self._process
+            first_id = self._next_id
+            self._next_id += len(commands)
+
+            def write_requests():
+                try:
+                    for offset, argv in enumerate(commands):
+                        process.stdin.write(json.dumps({'id': first_id + offset, 'argv': argv}) + '\n')
+                    process.stdin.flush()
+                except OSError:
+                    pass
+
+            writer = threading.Thread(target=write_requests, name="route-helper-writer", daemon=True)
+            writer.start()
+
+            results: Dict[int, Tuple[bool, str]] = {}
+            error = "Route helper exited"
+            while len(results) < len(commands):
+                line = process.stdout.readline()
+                if not line:
+                    break
+                parsed = self._parse_response(line, first_id, len(commands))
+                if parsed is None or parsed[0] in results:
+                    # Ответ не сопоставить с операцией - дальше поток рассинхронизирован
+                    error = f"Route helper protocol error: {line.strip()[:200]}"
+                    process.kill()
+                    break
+                index, ok, output = parsed
+                results[index] = (ok, output)
+                if on_result is not None:
+                    on_result(index, *results[index])
+
+            writer.join()
+
+            if len(results) < len(commands):
+                # Помощник завершился (например, отказ sudo) или нарушил протокол -
+                # остальное считаем ошибками
+                self._process = None
+                for index in range(len(commands)):
+                    if index not in results:
+                        results[index] = (False, error)
+                        if on_result is not None:
+                            on_result(index, *results[index])
+
+            return [results[index] for index in range(len(commands))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DNS Routing Manager route helper")
+    parser.add_argument('--fake', action='store_true', help='не выполнять команды, вести таблицу в памяти')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка на операцию в режиме --fake')
+    args = parser.parse_args()
+    serve(fake=args.fake, latency=args.latency)
+
+
+if __name__ == '__main__':
+    main()
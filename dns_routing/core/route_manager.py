@@ -1,28 +1,103 @@
 """
 Route Manager для DNS Routing Manager.
-Управляет системными маршрутами через команды route в macOS.
+Решает, какие маршруты нужны, и ведет их учет; установка маршрутов
+выполняется бэкендом (команды route macOS или симулятор).
 """
-import subprocess
 import json
 import os
-from typing import List, Dict, Optional, Set
+import time
+from typing import Callable, Iterable, List, Dict, Optional, Set, Tuple
 from pathlib import Path
-from ..models import Route, NetworkInterface, OperationResult, RouteType
+from ..models import Route, NetworkInterface, OperationResult, ReconcilePlan, RouteEntry, RouteType
 from ..config import get_config
+from ..utils.metrics import REGISTRY
+from ..utils.stats_file import update_stats
+from .route_backend import RouteBackend, RouteOperation, create_route_backend
+from .route_helper import RouteHelper
+from .route_table import RouteTable, verify_route_keys
+
+
+_OPERATION_SECONDS = REGISTRY.histogram(
+    'dns_routing_route_operation_seconds',
+    'Route operation latency (batched operations: time since the previous result)', ['action'])
+_OPERATIONS = REGISTRY.counter('dns_routing_route_operations_total',
+                               'Route operations by action and result', ['action', 'result'])
+_ACTIVE_ROUTES = REGISTRY.gauge('dns_routing_routes_active', 'Routes recorded as installed')
 
 
 class RouteManager:
     """
-    Менеджер маршрутов для macOS.
-    Управляет добавлением/удалением маршрутов через команду route.
+    Менеджер маршрутов.
+    Управляет добавлением/удалением маршрутов через бэкенд routing.backend.
     """
     
-    def __init__(self):
+    def __init__(self, helper: Optional[RouteHelper] = None,
+                 backend: Optional[RouteBackend] = None):
         self.config = get_config()
         self.routes_cache_file = self.config.routes_cache_file
         self.active_routes: Set[str] = set()
+        self._helper = helper
+        self._backend = backend
         self._load_routes_cache()
     
+    @property
+    def backend(self) -> RouteBackend:
+        """Бэкенд создается при первой операции (netlink сокет, помощник под sudo)"""
+        if self._backend is None:
+            self._backend = create_route_backend(self.config, self._helper)
+        return self._backend
+    
+    def __enter__(self) -> 'RouteManager':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """Освобождает ресурсы бэкенда (помощник, сохранение состояния)"""
+        if self._backend is not None:
+            self._backend.close()
+    
+    def _run_route_operations(self, operations: List[RouteOperation],
+                              on_result: Optional[Callable[[int, bool, str], None]] = None) -> List[tuple]:
+        """
+        Выполняет пакет операций бэкендом.
+        Бэкенды выполняют пакет потоком, поэтому задержка операции в
+        метриках - время от предыдущего результата пакета.
+        """
+        last = time.perf_counter()
+        
+        def record(index: int, success: bool, output: str) -> None:
+            nonlocal last
+            now = time.perf_counter()
+            self._observe_operation(operations[index][0], success, output, now - last)
+            last = now
+            if on_result is not None:
+                on_result(index, success, output)
+        
+        return self.backend.batch(operations, record)
+    
+    def _run_route_operation(self, operation: RouteOperation) -> Tuple[bool, str]:
+        """Выполняет одну операцию бэкендом (без пакета)"""
+        action, route = operation
+        started = time.perf_counter()
+        success, output = self.backend.add(route) if action == 'add' else self.backend.delete(route)
+        self._observe_operation(action, success, output, time.perf_counter() - started)
+        return success, output
+    
+    def _observe_operation(self, action: str, success: bool, output: str, seconds: float) -> None:
+        """Учитывает операцию в метриках: ok, exists/missing (не ошибка) или failed"""
+        if success:
+            result = 'ok'
+        elif action == 'add' and self._is_existing_route_error(output):
+            result = 'exists'
+        elif action == 'delete' and self._is_missing_route_error(output):
+            result = 'missing'
+        else:
+            result = 'failed'
+        _OPERATION_SECONDS.labels(action).observe(seconds)
+        _OPERATIONS.labels(action, result).inc()
+    
     def _load_routes_cache(self) -> None:
         """Загружает кэш активных маршрутов"""
         try:
@@ -34,9 +109,40 @@ class RouteManager:
         except Exception as e:
             print(f"Warning: Could not load routes cache: {e}")
             self.active_routes = set()
+        _ACTIVE_ROUTES.set(len(self.active_routes))
+    
+    def read_route_table(self) -> RouteTable:
+        """Снимок всей таблицы маршрутов одним запросом к бэкенду"""
+        return self.backend.dump()
+    
+    def rebuild_from_route_table(self, table: Optional[RouteTable] = None) -> int:
+        """
+        Заполняет active_routes маршрутами из таблицы ОС, которые идут
+        через VPN интерфейс или локальный шлюз. Возвращает их количество.
+        Вызывается только явно (routes sync): записанные маршруты потом
+        удаляют reconcile, демон и routes clear. В общей таблице берутся
+        только маршруты к хостам, подсети - лишь из собственной таблицы бэкенда.
+        """
+        table = table if table is not None else self.read_route_table()
+        self.active_routes = table.managed_route_keys(self.config.local_interface,
+                                                      self.config.vpn_interface,
+                                                      include_networks=self.backend.supports_flush)
+        _ACTIVE_ROUTES.set(len(self.active_routes))
+        return len(self.active_routes)
+    
+    def verify_routes(self, route_keys: Optional[Iterable[str]] = None,
+                      table: Optional[RouteTable] = None) -> Tuple[List[str], List[str]]:
+        """
+        Проверяет по одному снимку таблицы, что маршруты действительно установлены.
+        По умолчанию проверяются все записанные маршруты. Возвращает (present, missing).
+        """
+        table = table if table is not None else self.read_route_table()
+        keys = sorted(self.active_routes) if route_keys is None else route_keys
+        return verify_route_keys(table, keys)
     
     def _save_routes_cache(self) -> None:
         """Сохраняет кэш активных маршрутов"""
+        _ACTIVE_ROUTES.set(len(self.active_routes))
         try:
             # Создаем директорию с правильными правами
             self.routes_cache_file.parent.mkdir(parents=True, exist_ok=True)
@@ -60,6 +166,11 @@ class RouteManager:
             # Меняем владельца файла на реального пользователя
             if real_user:
                 os.chown(self.routes_cache_file, real_uid, real_gid)
+            
+            update_stats(self.config.stats_file, 'routes', {
+                'active_routes': len(self.active_routes),
+                'backend': self.backend.name
+            })
                 
         except Exception as e:
             # Не показываем ошибку каждый раз - логируем только один раз
@@ -67,45 +178,6 @@ class RouteManager:
                 print(f"Info: Routes cache disabled due to permissions")
                 self._cache_error_shown = True
     
-    def _check_sudo(self) -> bool:
-        """Проверяет доступность sudo"""
-        try:
-            result = subprocess.run(
-                ['sudo', '-n', 'true'], 
-                capture_output=True, 
-                timeout=5
-            )
-            return result.returncode == 0
-        except:
-            return False
-    
-    def _run_route_command(self, cmd: List[str]) -> tuple[bool, str]:
-        """
-        Выполняет команду route с обработкой ошибок.
-        Возвращает (success, output/error)
-        """
-        try:
-            # Добавляем sudo если требуется
-            if getattr(self.config, "security", {}).get('require_sudo', True):
-                cmd = ['sudo'] + cmd
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                return True, result.stdout.strip()
-            else:
-                return False, result.stderr.strip()
-                
-        except subprocess.TimeoutExpired:
-            return False, "Command timeout"
-        except Exception as e:
-            return False, str(e)
-    
     def _is_valid_ip(self, ip: str) -> bool:
         """Проверяет валидность IP адреса"""
         try:
@@ -140,6 +212,60 @@ class RouteManager:
         
         raise ValueError(f"Invalid IP or network: {target}")
     
+    def _interface_for(self, route_type: RouteType) -> NetworkInterface:
+        """Интерфейс для типа маршрута"""
+        if route_type == RouteType.LOCAL:
+            return self.config.local_interface
+        return self.config.vpn_interface
+    
+    def _build_add_operation(self, target: str, route_type: RouteType) -> tuple[RouteOperation, str, Route]:
+        """
+        Формирует операцию добавления маршрута.
+        Возвращает (операция, ключ маршрута для кэша, маршрут).
+        """
+        # Парсим target
+        parsed_target, is_network = self._parse_network(target)
+        
+        # Выбираем интерфейс
+        interface = self._interface_for(route_type)
+        
+        # Для обычных интерфейсов маршрут идет через gateway
+        if not interface.is_tunnel and not interface.gateway:
+            raise ValueError(f"Gateway required for interface {interface.name}")
+        
+        route = Route(
+            target=parsed_target,
+            interface=interface.name,
+            gateway=interface.gateway if not interface.is_tunnel else None,
+            is_host=not is_network
+        )
+        
+        return ('add', route), route.route_key, route
+    
+    def _build_delete_operation(self, target: str) -> tuple[RouteOperation, str]:
+        """Формирует операцию удаления маршрута. Возвращает (операция, target)"""
+        parsed_target, is_network = self._parse_network(target)
+        route = Route(target=parsed_target, interface='', is_host=not is_network)
+        return ('delete', route), parsed_target
+    
+    @staticmethod
+    def _is_existing_route_error(output: str) -> bool:
+        """Маршрут уже есть в системе - при добавлении это не ошибка"""
+        return "file exists" in output.lower()
+    
+    @staticmethod
+    def _is_missing_route_error(output: str) -> bool:
+        """Маршрут уже отсутствует - при удалении это не ошибка"""
+        return "not in table" in output.lower() or "no such process" in output.lower()
+    
+    def _forget_target(self, target: str) -> None:
+        """Удаляет target из кэша для всех интерфейсов"""
+        routes_to_remove = [key for key in self.active_routes 
+                          if key.startswith(f"{target}:")]
+        
+        for route_key in routes_to_remove:
+            self.active_routes.discard(route_key)
+    
     def add_route(self, target: str, route_type: RouteType) -> OperationResult:
         """
         Добавляет маршрут для IP или подсети.
@@ -149,62 +275,27 @@ class RouteManager:
             route_type: LOCAL или VPN
         """
         try:
-            # Парсим target
-            parsed_target, is_network = self._parse_network(target)
-            
-            # Выбираем интерфейс
-            if route_type == RouteType.LOCAL:
-                interface = self.config.local_interface
-            else:
-                interface = self.config.vpn_interface
-            
-            # Создаем ключ для кэша
-            route_key = f"{parsed_target}:{interface.name}"
+            operation, route_key, route = self._build_add_operation(target, route_type)
             
             # Проверяем что маршрут еще не добавлен
             if route_key in self.active_routes:
                 return OperationResult(
                     success=True,
-                    message=f"Route {parsed_target} via {interface.name} already exists",
+                    message=f"Route {route.target} via {route.interface} already exists",
                     affected_routes=[]
                 )
             
-            # Формируем команду route
-            if is_network:
-                # Для подсети
-                cmd = ['route', 'add', '-net', parsed_target]
-            else:
-                # Для отдельного хоста
-                cmd = ['route', 'add', '-host', parsed_target]
-            
-            # Добавляем интерфейс или gateway
-            if interface.is_tunnel:
-                # Для туннельных интерфейсов (utun)
-                cmd.extend(['-interface', interface.name])
-            else:
-                # Для обычных интерфейсов через gateway
-                if not interface.gateway:
-                    raise ValueError(f"Gateway required for interface {interface.name}")
-                cmd.append(interface.gateway)
-            
-            # Выполняем команду
-            success, output = self._run_route_command(cmd)
+            # Выполняем операцию
+            success, output = self._run_route_operation(operation)
             
             if success:
                 # Добавляем в кэш
                 self.active_routes.add(route_key)
                 self._save_routes_cache()
                 
-                route = Route(
-                    target=parsed_target,
-                    interface=interface.name,
-                    gateway=interface.gateway if not interface.is_tunnel else None,
-                    is_host=not is_network
-                )
-                
                 return OperationResult(
                     success=True,
-                    message=f"Route added: {parsed_target} via {interface.name}",
+                    message=f"Route added: {route.target} via {route.interface}",
                     affected_routes=[route]
                 )
             else:
@@ -226,26 +317,15 @@ class RouteManager:
         Удаляет маршрут для IP или подсети.
         """
         try:
-            # Парсим target
-            parsed_target, is_network = self._parse_network(target)
+            # Формируем операцию удаления
+            operation, parsed_target = self._build_delete_operation(target)
             
-            # Формируем команду route delete
-            if is_network:
-                cmd = ['route', 'delete', '-net', parsed_target]
-            else:
-                cmd = ['route', 'delete', '-host', parsed_target]
-            
-            # Выполняем команду
-            success, output = self._run_route_command(cmd)
+            # Выполняем операцию
+            success, output = self._run_route_operation(operation)
             
             if success:
                 # Удаляем из кэша (пробуем все возможные интерфейсы)
-                routes_to_remove = [key for key in self.active_routes 
-                                  if key.startswith(f"{parsed_target}:")]
-                
-                for route_key in routes_to_remove:
-                    self.active_routes.discard(route_key)
-                
+                self._forget_target(parsed_target)
                 self._save_routes_cache()
                 
                 return OperationResult(
@@ -255,7 +335,7 @@ class RouteManager:
                 )
             else:
                 # Маршрут может уже отсутствовать - это не ошибка
-                if "not in table" in output.lower() or "no such process" in output.lower():
+                if self._is_missing_route_error(output):
                     return OperationResult(
                         success=True,
                         message=f"Route {parsed_target} was not present",
@@ -278,6 +358,7 @@ class RouteManager:
     def add_routes_bulk(self, targets: List[str], route_type: RouteType) -> OperationResult:
         """
         Добавляет множество маршрутов за один вызов.
+        Операции уходят бэкенду одним пакетом, кэш маршрутов сохраняется один раз.
         """
         all_routes = []
         all_errors = []
@@ -285,18 +366,38 @@ class RouteManager:
         
         print(f"Adding {len(targets)} routes via {route_type.value}...")
         
-        for i, target in enumerate(targets, 1):
-            print(f"[{i}/{len(targets)}] Adding route for {target}...")
-            
-            result = self.add_route(target, route_type)
+        # Готовим операции, отсеивая уже добавленные и некорректные цели
+        pending = []
+        for target in targets:
+            try:
+                operation, route_key, route = self._build_add_operation(target, route_type)
+            except Exception as e:
+                all_errors.append(str(e))
+                print(f"  ❌ Error adding route for {target}: {e}")
+                continue
             
-            if result.success:
+            if route_key in self.active_routes:
                 success_count += 1
-                all_routes.extend(result.affected_routes)
-                print(f"  ✅ {result.message}")
+                print(f"  ✅ Route {route.target} via {route.interface} already exists")
+                continue
+            pending.append((operation, route_key, route))
+        
+        def on_result(index: int, success: bool, output: str) -> None:
+            _, route_key, route = pending[index]
+            print(f"[{index + 1}/{len(pending)}] Adding route for {route.target}...")
+            if success:
+                self.active_routes.add(route_key)
+                all_routes.append(route)
+                print(f"  ✅ Route added: {route.target} via {route.interface}")
             else:
-                all_errors.extend(result.errors)
-                print(f"  ❌ {result.message}")
+                all_errors.append(output)
+                print(f"  ❌ Failed to add route: {output}")
+        
+        results = self._run_route_operations([operation for operation, _, _ in pending], on_result)
+        success_count += sum(1 for success, _ in results if success)
+        
+        if pending:
+            self._save_routes_cache()
         
         overall_success = success_count > 0
         
@@ -306,6 +407,123 @@ class RouteManager:
             affected_routes=all_routes,
             errors=all_errors
         )
+
+    def install_routes(self, targets: List[str], route_type: RouteType) -> Tuple[List[str], List[str]]:
+        """
+        Тихая пакетная установка маршрутов для горячего пути (прокси):
+        без вывода и без сохранения кэша - его сохраняет вызывающий.
+        Уже существующий в системе маршрут считается установленным.
+        Возвращает (установленные цели, ошибки).
+        """
+        installed: List[str] = []
+        errors: List[str] = []
+        pending = []
+        for target in targets:
+            try:
+                operation, route_key, route = self._build_add_operation(target, route_type)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            if route_key in self.active_routes:
+                installed.append(target)
+            else:
+                pending.append((operation, route_key, target))
+
+        if pending:
+            results = self._run_route_operations([operation for operation, _, _ in pending])
+            for (_, route_key, target), (success, output) in zip(pending, results):
+                if success or self._is_existing_route_error(output):
+                    self.active_routes.add(route_key)
+                    installed.append(target)
+                else:
+                    errors.append(f"{target}: {output}")
+        return installed, errors
+
+    def save_routes_cache(self) -> None:
+        """Сохраняет кэш маршрутов после серии install_routes"""
+        self._save_routes_cache()
+
+    def plan_reconcile(self, desired: Dict[str, RouteType],
+                       route_types: Iterable[RouteType]) -> ReconcilePlan:
+        """
+        Сравнивает желаемые маршруты с записанными для интерфейсов route_types.
+        Разность считается по хэш-множествам ключей target:interface за O(n).
+        """
+        scope = {self._interface_for(route_type).name for route_type in route_types}
+        
+        desired_keys: Dict[str, tuple] = {}
+        for target, route_type in desired.items():
+            parsed_target, _ = self._parse_network(target)
+            route_key = f"{parsed_target}:{self._interface_for(route_type).name}"
+            desired_keys.setdefault(route_key, (parsed_target, route_type))
+        
+        recorded = {key for key in self.active_routes if key.rpartition(':')[2] in scope}
+        
+        plan = ReconcilePlan()
+        plan.to_remove = sorted(key for key in recorded if key not in desired_keys)
+        
+        # route delete удаляет маршрут цели целиком - цели, которые остаются
+        # на другом интерфейсе, после удаления нужно добавить заново
+        removed_targets = {key.rpartition(':')[0] for key in plan.to_remove}
+        
+        for route_key, (target, route_type) in desired_keys.items():
+            if route_key not in self.active_routes or target in removed_targets:
+                plan.to_add.append((target, route_type))
+        
+        plan.unchanged = len(desired_keys) - len(plan.to_add)
+        return plan
+    
+    def apply_reconcile(self, plan: ReconcilePlan) -> OperationResult:
+        """
+        Выполняет план: сначала удаления, затем добавления.
+        Уже отсутствующие при удалении и уже существующие при добавлении
+        маршруты считаются успешными - запись приводится к реальности.
+        """
+        errors = []
+        added = []
+        removed_count = 0
+        
+        delete_operations = []
+        for route_key in plan.to_remove:
+            try:
+                operation, _ = self._build_delete_operation(route_key.rpartition(':')[0])
+                delete_operations.append((operation, route_key))
+            except ValueError as e:
+                errors.append(str(e))
+        
+        results = self._run_route_operations([operation for operation, _ in delete_operations])
+        for (_, route_key), (success, output) in zip(delete_operations, results):
+            if success or self._is_missing_route_error(output):
+                self.active_routes.discard(route_key)
+                removed_count += 1
+            else:
+                errors.append(output)
+        
+        add_operations = []
+        for target, route_type in plan.to_add:
+            try:
+                add_operations.append(self._build_add_operation(target, route_type))
+            except ValueError as e:
+                errors.append(str(e))
+        
+        results = self._run_route_operations([operation for operation, _, _ in add_operations])
+        for (_, route_key, route), (success, output) in zip(add_operations, results):
+            if success or self._is_existing_route_error(output):
+                self.active_routes.add(route_key)
+                added.append(route)
+            else:
+                errors.append(output)
+        
+        if delete_operations or add_operations:
+            self._save_routes_cache()
+        
+        return OperationResult(
+            success=not errors,
+            message=(f"Reconciled routes: +{len(added)}/{len(plan.to_add)} added, "
+                     f"-{removed_count}/{len(plan.to_remove)} removed, {plan.unchanged} unchanged"),
+            affected_routes=added,
+            errors=errors
+        )
     
     def check_route(self, target: str) -> Optional[Dict]:
         """
@@ -313,25 +531,20 @@ class RouteManager:
         Возвращает информацию о маршруте или None.
         """
         try:
-            cmd = ['route', '-n', 'get', target]
-            success, output = self._run_route_command(cmd)
-            
-            if success:
-                # Парсим вывод route get
-                route_info = {}
-                for line in output.split('\n'):
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        route_info[key.strip()] = value.strip()
-                
-                return route_info
-            
-            return None
-            
+            return self.backend.lookup(target)
         except Exception as e:
             print(f"Error checking route for {target}: {e}")
             return None
     
+    def check_routes(self, targets: Iterable[str],
+                     table: Optional[RouteTable] = None) -> Dict[str, Optional[RouteEntry]]:
+        """
+        Проверяет много целей по одному снимку таблицы.
+        Ищется маршрут с точно таким префиксом (IP - как /32).
+        """
+        table = table if table is not None else self.read_route_table()
+        return {target: table.get(target) for target in targets}
+    
     def get_active_routes_count(self) -> int:
         """Возвращает количество активных маршрутов"""
         return len(self.active_routes)
@@ -341,6 +554,17 @@ class RouteManager:
         Удаляет все маршруты из кэша.
         ВНИМАНИЕ: Это может нарушить сетевое соединение!
         """
+        if self.backend.supports_flush:
+            # Отдельная таблица содержит только наши маршруты - очищаем ее целиком
+            removed_count = self.backend.flush()
+            self.active_routes.clear()
+            self._save_routes_cache()
+            return OperationResult(
+                success=True,
+                message=f"Flushed {removed_count} routes from table",
+                affected_routes=[]
+            )
+        
         if not self.active_routes:
             return OperationResult(
                 success=True,
@@ -354,14 +578,24 @@ class RouteManager:
         # Создаем копию для итерации
         routes_to_remove = list(self.active_routes)
         
+        operations = []
         for route_key in routes_to_remove:
             target = route_key.split(':')[0]
-            result = self.remove_route(target)
-            
-            if result.success:
+            try:
+                operations.append(self._build_delete_operation(target))
+            except ValueError as e:
+                errors.append(str(e))
+        
+        results = self._run_route_operations([operation for operation, _ in operations])
+        
+        for (_, target), (success, output) in zip(operations, results):
+            if success or self._is_missing_route_error(output):
+                self._forget_target(target)
                 removed_count += 1
             else:
-                errors.extend(result.errors)
+                errors.append(output)
+        
+        self._save_routes_cache()
         
         return OperationResult(
             success=removed_count > 0,
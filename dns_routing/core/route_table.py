@@ -0,0 +1,224 @@
+"""
+Снимок таблицы маршрутизации для DNS Routing Manager.
+Читает всю таблицу одной командой (netstat -rn на macOS, ip route на Linux)
+и дает поиск маршрута по точному префиксу за O(1).
+"""
+import ipaddress
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..models import NetworkInterface, RouteEntry
+
+
+# Маршруты, которые никогда не считаются нашими при восстановлении состояния
+_SYSTEM_NETWORKS = [
+    ipaddress.IPv4Network('0.0.0.0/0'),
+    ipaddress.IPv4Network('0.0.0.0/1'),
+    ipaddress.IPv4Network('128.0.0.0/1'),
+]
+_SYSTEM_RANGES = [
+    ipaddress.IPv4Network('127.0.0.0/8'),
+    ipaddress.IPv4Network('169.254.0.0/16'),
+    ipaddress.IPv4Network('224.0.0.0/4'),
+    ipaddress.IPv4Network('255.255.255.255/32'),
+]
+
+
+def normalize_prefix(target: str) -> str:
+    """'1.2.3.4' -> '1.2.3.4/32', '10.0.0.1/8' -> '10.0.0.0/8'"""
+    return str(ipaddress.IPv4Network(target, strict=False))
+
+
+def _classful_prefix(first_octet: int) -> int:
+    """Естественная маска сети, которую netstat не печатает"""
+    if first_octet < 128:
+        return 8
+    if first_octet < 192:
+        return 16
+    return 24
+
+
+def _parse_bsd_destination(destination: str, flags: str) -> Optional[str]:
+    """
+    Разбирает сокращенную запись netstat на macOS:
+    'default', '10.255/16', '127', '8.8.8.8', '192.168.1'.
+    """
+    if destination == 'default':
+        return '0.0.0.0/0'
+
+    address, _, prefix = destination.partition('/')
+    address = address.split('%')[0]
+    octets = address.split('.')
+    if not all(octet.isdigit() for octet in octets) or len(octets) > 4:
+        return None
+
+    if prefix:
+        prefix_len = int(prefix)
+    elif 'H' in flags or len(octets) == 4:
+        prefix_len = 32
+    else:
+        prefix_len = max(_classful_prefix(int(octets[0])), 8 * len(octets))
+
+    octets += ['0'] * (4 - len(octets))
+    try:
+        return str(ipaddress.IPv4Network(f"{'.'.join(octets)}/{prefix_len}", strict=False))
+    except ValueError:
+        return None
+
+
+class RouteTable:
+    """Таблица маршрутов в памяти: префикс -> RouteEntry"""
+
+    def __init__(self, entries: Optional[Iterable[RouteEntry]] = None):
+        self.entries: Dict[str, RouteEntry] = {}
+        for entry in entries or []:
+            self.entries.setdefault(entry.destination, entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, target: str) -> Optional[RouteEntry]:
+        """Маршрут с точно таким префиксом (IP считается /32)"""
+        try:
+            return self.entries.get(normalize_prefix(target))
+        except ValueError:
+            return None
+
+    def has_route(self, target: str, interface: Optional[str] = None) -> bool:
+        entry = self.get(target)
+        return entry is not None and (interface is None or entry.interface == interface)
+
+    def has_route_key(self, route_key: str) -> bool:
+        """Проверяет ключ RouteManager вида target:interface"""
+        target, _, interface = route_key.rpartition(':')
+        return self.has_route(target, interface)
+
+    def managed_route_keys(self, local_interface: NetworkInterface,
+                           vpn_interface: NetworkInterface,
+                           include_networks: bool = False) -> Set[str]:
+        """
+        Ключи target:interface маршрутов, похожих на установленные нами:
+        через VPN интерфейс или через локальный шлюз, без системных сетей.
+
+        Подсети в основной таблице обычно ставят VPN клиент и администратор,
+        поэтому по умолчанию берутся только маршруты к хостам (/32).
+        include_networks - таблица целиком наша (отдельная таблица netlink),
+        подсети в ней тоже считаются нашими.
+        """
+        keys = set()
+        for entry in self.entries.values():
+            network = ipaddress.IPv4Network(entry.destination)
+            if network.prefixlen != 32 and not include_networks:
+                continue
+            if network in _SYSTEM_NETWORKS or any(network.subnet_of(r) for r in _SYSTEM_RANGES):
+                continue
+
+            if entry.interface == vpn_interface.name and vpn_interface.is_tunnel:
+                pass
+            elif (entry.interface == local_interface.name and
+                  entry.gateway is not None and entry.gateway == local_interface.gateway):
+                pass
+            else:
+                continue
+
+            target = str(network.network_address) if network.prefixlen == 32 else str(network)
+            keys.add(f"{target}:{entry.interface}")
+        return keys
+
+    @classmethod
+    def parse_netstat(cls, output: str) -> 'RouteTable':
+        """Разбирает вывод netstat -rn -f inet (macOS/BSD)"""
+        entries: List[RouteEntry] = []
+        netif_column = None
+
+        for line in output.splitlines():
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'Internet6:':
+                netif_column = None
+                continue
+            if parts[0] == 'Destination':
+                # Старые версии печатают еще Refs и Use - ищем колонку интерфейса по заголовку
+                netif_column = parts.index('Netif') if 'Netif' in parts else 3
+                continue
+            if netif_column is None or len(parts) <= netif_column:
+                continue
+
+            destination, gateway, flags, interface = parts[0], parts[1], parts[2], parts[netif_column]
+            prefix = _parse_bsd_destination(destination, flags)
+            if prefix is None:
+                continue
+
+            # link#N и имя интерфейса вместо шлюза - маршрут прямо в интерфейс
+            if gateway.startswith('link#') or not gateway[0].isdigit():
+                gateway = None
+
+            entries.append(RouteEntry(destination=prefix, gateway=gateway,
+                                      interface=interface, flags=flags))
+
+        return cls(entries)
+
+    @classmethod
+    def parse_ip_route(cls, output: str) -> 'RouteTable':
+        """Разбирает вывод ip -4 route show (Linux)"""
+        entries: List[RouteEntry] = []
+        route_types = {'unicast', 'local', 'broadcast', 'multicast', 'throw',
+                       'unreachable', 'prohibit', 'blackhole', 'nat'}
+
+        for line in output.splitlines():
+            parts = line.split()
+            if not parts:
+                continue
+
+            route_type = 'unicast'
+            if parts[0] in route_types:
+                route_type = parts.pop(0)
+            if not parts:
+                continue
+
+            destination = '0.0.0.0/0' if parts[0] == 'default' else parts[0]
+            try:
+                destination = normalize_prefix(destination)
+            except ValueError:
+                continue
+
+            attrs = dict(zip(parts[1::2], parts[2::2]))
+            entries.append(RouteEntry(
+                destination=destination,
+                gateway=attrs.get('via'),
+                interface=attrs.get('dev'),
+                flags=route_type
+            ))
+
+        return cls(entries)
+
+
+def read_route_table(table: str = 'main') -> RouteTable:
+    """
+    Читает таблицу маршрутов ОС одной командой.
+    table - имя/номер таблицы маршрутизации (только Linux).
+    """
+    if sys.platform == 'darwin' or 'bsd' in sys.platform:
+        cmd, parser = ['netstat', '-rn', '-f', 'inet'], RouteTable.parse_netstat
+    else:
+        cmd, parser = ['ip', '-4', 'route', 'show', 'table', str(table)], RouteTable.parse_ip_route
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"Could not read routing table: {e}")
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not read routing table: {result.stderr.strip()}")
+
+    return parser(result.stdout)
+
+
+def verify_route_keys(table: RouteTable, route_keys: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Делит ключи target:interface на присутствующие в таблице и отсутствующие"""
+    present, missing = [], []
+    for route_key in route_keys:
+        (present if table.has_route_key(route_key) else missing).append(route_key)
+    return present, missing
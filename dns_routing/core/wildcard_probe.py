@@ -0,0 +1,184 @@
+"""
+Адаптивное расширение **. доменов для DNS Routing Manager.
+
+Для каждой зоны **. хранится статистика проверок (probe_stats.json
+рядом с кэшем):
+    - wildcard статус зоны: один раз проверяется случайной меткой;
+      если она резолвится, в зоне есть wildcard запись и все
+      поддомены отвечают одним адресом - вместо списка кандидатов
+      резолвится одно имя
+    - по каждому кандидату - число NXDOMAIN подряд: после
+      prune_after таких ответов имя не проверяется до повторной
+      проверки через reprobe_days
+
+Расширение чистое (без сети): в список попадают имена по текущей
+статистике, а результаты их резолвинга учитываются через observe().
+"""
+import json
+import os
+import secrets
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..models import RoutingConfig
+
+
+# Версия формата файла статистики
+PROBE_STATS_VERSION = 1
+
+# Ответы, которые ничего не говорят о существовании имени
+_TRANSIENT = ('timeout', 'servfail', 'error')
+
+
+class WildcardProber:
+    """
+    Статистика проверок поддоменов по зонам.
+
+    Использование:
+        prober = WildcardProber(config)
+        names = prober.expand('example.com')   # кандидаты для **.example.com
+        ...                                    # резолвинг names
+        prober.observe(names, cache)
+        prober.save()
+    """
+
+    def __init__(self, config: RoutingConfig, path: Optional[Path] = None):
+        self.config = config
+        self.path = Path(path) if path is not None else config.probe_stats_file
+        self._zones: Optional[Dict[str, Dict]] = None
+        # Имя -> (зона, метка кандидата или None для случайной метки)
+        self._tracked: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._dirty = False
+        self.observed = 0
+
+    # --- Хранение ---
+
+    @property
+    def zones(self) -> Dict[str, Dict]:
+        """Статистика зон, читается при первом обращении"""
+        if self._zones is None:
+            self._zones = self._load()
+        return self._zones
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != PROBE_STATS_VERSION:
+            return {}
+        return data.get('zones', {})
+
+    def save(self) -> None:
+        """Атомарно сохраняет статистику, если она изменилась"""
+        if not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=self.path.name + '.', suffix='.tmp',
+                                            dir=self.path.parent)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'version': PROBE_STATS_VERSION, 'zones': self._zones}, f,
+                              separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._dirty = False
+        except OSError as e:
+            print(f"Warning: Could not save probe stats: {e}")
+
+    # --- Расширение ---
+
+    def candidates(self, zone: str) -> List[str]:
+        """Метки кандидатов зоны: свой список из probing.zones или общий"""
+        return self.config.probe_zones.get(zone, self.config.probe_candidates)
+
+    def _zone(self, zone: str) -> Dict:
+        stats = self.zones.get(zone)
+        if stats is None:
+            # Метка постоянна для зоны, чтобы ее ответ переиспользовался из кэша
+            stats = self.zones[zone] = {'wildcard': None, 'checked': 0,
+                                        'probe': f"dnsr-{secrets.token_hex(5)}", 'labels': {}}
+            self._dirty = True
+        return stats
+
+    def _is_due(self, last: float, now: float) -> bool:
+        return now - last >= self.config.probe_reprobe_days * 86400
+
+    def expand(self, zone: str, now: Optional[float] = None) -> List[str]:
+        """
+        Поддомены зоны для резолвинга (без самой зоны):
+            wildcard зона        - одно имя со случайной меткой
+            обычная зона         - кандидаты без отброшенных
+            статус неизвестен    - кандидаты и случайная метка
+        """
+        now = time.time() if now is None else now
+        stats = self._zone(zone)
+        names = []
+
+        probe_name = f"{stats['probe']}.{zone}"
+        if self.config.probe_detect_wildcard:
+            if stats['wildcard']:
+                self._tracked[probe_name] = (zone, None)
+                return [probe_name]
+            if stats['wildcard'] is None or self._is_due(stats['checked'], now):
+                self._tracked[probe_name] = (zone, None)
+                names.append(probe_name)
+
+        labels = stats['labels']
+        for label in self.candidates(zone):
+            nx_streak, last = labels.get(label, (0, 0))
+            if nx_streak >= self.config.probe_prune_after and not self._is_due(last, now):
+                continue
+            name = f"{label}.{zone}"
+            self._tracked[name] = (zone, label)
+            names.append(name)
+        return names
+
+    # --- Учет результатов ---
+
+    def observe(self, names: Iterable[str], cache, now: Optional[float] = None) -> None:
+        """
+        Учитывает свежие ответы на имена из expand() по записям DNS кэша.
+        Ответы из кэша сюда передавать не нужно - иначе один NXDOMAIN
+        засчитался бы несколько раз.
+        """
+        now = time.time() if now is None else now
+        for name in names:
+            tracked = self._tracked.get(name)
+            if tracked is None:
+                continue
+            entry = cache.get(name)
+            if entry is None:
+                continue
+            kind = entry.get('negative')
+            if kind in _TRANSIENT:
+                continue
+
+            zone, label = tracked
+            stats = self._zone(zone)
+            if label is None:
+                stats['wildcard'] = not kind
+                stats['checked'] = now
+            else:
+                nx_streak, _ = stats['labels'].get(label, (0, 0))
+                stats['labels'][label] = [nx_streak + 1 if kind == 'nxdomain' else 0, now]
+            self.observed += 1
+            self._dirty = True
+
+    def summary(self) -> Dict[str, int]:
+        """Число зон, wildcard зон и отброшенных кандидатов"""
+        zones = self.zones
+        pruned = sum(1 for stats in zones.values()
+                     for nx_streak, _ in stats['labels'].values()
+                     if nx_streak >= self.config.probe_prune_after)
+        return {
+            'zones': len(zones),
+            'wildcard': sum(1 for stats in zones.values() if stats['wildcard']),
+            'pruned': pruned,
+        }
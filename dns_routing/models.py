@@ -3,12 +3,19 @@
 Используем dataclasses для типизации и валидации.
 """
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Tuple, Union
 from enum import Enum
 from pathlib import Path
 import ipaddress
 
 
+# Поддомены, которые проверяются у **. доменов без своего списка
+DEFAULT_PROBE_CANDIDATES = [
+    'www', 'api', 'cdn', 'static', 'images', 'assets',
+    'mail', 'ftp', 'blog', 'shop', 'store', 'admin'
+]
+
+
 class RouteType(Enum):
     """Типы маршрутов"""
     LOCAL = "local"  # Через локальную сеть
@@ -45,15 +52,13 @@ class Domain:
     last_resolved: Optional[str] = None  # timestamp
     
     def __post_init__(self):
-        """Определяем тип домена автоматически"""
+        """Определяем тип домена по префиксу; имя без префикса сохраняет заданный тип"""
         if self.name.startswith("**."):
             self.domain_type = DomainType.DEEP_WILDCARD
             self.name = self.name[3:]  # убираем **. 
         elif self.name.startswith("*."):
             self.domain_type = DomainType.WILDCARD  
             self.name = self.name[2:]  # убираем *.
-        else:
-            self.domain_type = DomainType.EXACT
 
 
 @dataclass
@@ -86,6 +91,15 @@ class Route:
         return f"{self.target}:{self.interface}"
 
 
+@dataclass
+class RouteEntry:
+    """Запись системной таблицы маршрутизации"""
+    destination: str                 # префикс в CIDR: 8.8.8.8/32, 10.0.0.0/8
+    gateway: Optional[str] = None    # None - маршрут прямо в интерфейс
+    interface: Optional[str] = None
+    flags: str = ""
+
+
 @dataclass
 class RoutingConfig:
     """Полная конфигурация маршрутизации"""
@@ -107,14 +121,95 @@ class RoutingConfig:
     # Параметры DNS
     dns_timeout: int = 5
     dns_retries: int = 3
+    dns_servers: List[str] = field(default_factory=list)
+    dns_backend: str = "native"  # native (встроенный клиент) или dig
+    dns_hedge: bool = True       # дублировать медленный запрос на следующий сервер
+    dns_hedge_delay: float = 0.3      # порог дублирования до набора статистики, секунды
+    dns_hedge_min_delay: float = 0.02  # нижняя граница адаптивного порога (p95 сервера)
+    dns_verbose: bool = False    # строка на каждое имя вместо итогов прогона
     
     # Параметры кэширования
-    cache_ttl_hours: int = 24
+    cache_ttl_hours: int = 24    # для записей без TTL
+    cache_min_ttl: int = 60      # границы TTL из DNS ответа, секунды
+    cache_max_ttl: int = 86400
+    cache_max_entries: int = 20000    # 0 - без ограничения
+    negative_ttl: int = 300           # для NXDOMAIN/NODATA без SOA
+    negative_max_ttl: int = 3600
+    timeout_backoff: int = 60         # первая задержка после таймаута, удваивается
+    timeout_backoff_max: int = 6 * 3600
+    cache_flush_every: int = 500      # сброс на диск каждые N изменений
+    cache_flush_interval: float = 5.0  # и не реже чем раз в N секунд
+    
+    # Параметры производительности
+    parallel_resolve: bool = True
+    max_workers: int = 10
+    batch_size: int = 50
+    max_inflight: int = 1000
+    
+    # Свертка маршрутов
+    aggregate_routes: bool = True     # объединять соседние префиксы
+    promote_prefix: int = 24          # длина префикса для продвижения
+    promote_min_hosts: int = 0        # продвигать при >= N адресах (0 - выключено)
+    route_budget: int = 0             # максимум маршрутов за прогон (0 - без ограничения)
+    budget_min_prefix: int = 16       # до какого префикса можно укрупнять ради бюджета
+    route_backend: str = "auto"       # auto, macos, netlink или simulator
+    netlink_table: int = 254          # таблица маршрутов Linux (254 - main)
+    netlink_rule_priority: int = 0    # правило lookup для отдельной таблицы (0 - нет)
+    simulator_latency: float = 0.0    # задержка операции симулятора, секунды
+    simulator_failure_rate: float = 0.0  # доля отказов операций симулятора
+    use_route_helper: bool = True     # пакетные операции через привилегированного помощника
+    reconcile_max_delete_ratio: float = 0.5  # защита от массового удаления при сбое DNS
+    skip_covered: bool = True         # не ставить /32 внутри подсети того же типа
+    verify_routes: bool = True        # сверка с таблицей ОС после process
+    
+    # Режим демона
+    daemon_min_refresh: float = 30    # минимальный интервал обновления имени, секунды
+    daemon_max_batch: int = 500       # имен за один шаг планировщика
+    daemon_max_sleep: float = 60      # максимальная пауза между шагами
+    
+    # Режим DNS прокси
+    proxy_listen: str = "127.0.0.1"   # адрес, на который указывает системный резолвер
+    proxy_port: int = 53
+    proxy_upstream: List[str] = field(default_factory=list)  # пусто - dns_servers
+    proxy_timeout: float = 2.0        # таймаут одной попытки к upstream, секунды
+    proxy_cache_size: int = 10000     # ответов в памяти (0 - без кэша)
+    proxy_route_wait: float = 1.0     # дольше этого ответ не ждет установки маршрута
+    proxy_stats_interval: float = 300  # период вывода статистики (0 - только при остановке)
+    
+    # Адаптивное расширение **. доменов
+    probe_candidates: List[str] = field(default_factory=lambda: list(DEFAULT_PROBE_CANDIDATES))
+    probe_zones: Dict[str, List[str]] = field(default_factory=dict)  # свои кандидаты зоны
+    probe_prune_after: int = 3        # NXDOMAIN подряд, после которых имя не проверяется
+    probe_reprobe_days: float = 30    # через сколько дней перепроверять отброшенное
+    probe_detect_wildcard: bool = True  # проверка зоны случайной меткой
+    
+    # Метрики Prometheus
+    metrics_textfile: Optional[Path] = None  # файл для textfile collector (None - не писать)
+    metrics_listen: str = "127.0.0.1"  # адрес HTTP /metrics в daemon и proxy
+    metrics_port: int = 0             # порт HTTP /metrics (0 - выключено)
+    
+    # Безопасность
+    require_sudo: bool = True
     
     def __post_init__(self):
         """Создаем необходимые директории"""
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    @property
+    def stats_file(self) -> Path:
+        """Сводная статистика кэша и маршрутов для быстрого status"""
+        return self.cache_dir / "stats.json"
+    
+    @property
+    def domain_index_file(self) -> Path:
+        """Скомпилированный индекс файлов доменов"""
+        return self.cache_dir / "domains.idx"
+    
+    @property
+    def probe_stats_file(self) -> Path:
+        """Статистика проверок поддоменов **. зон"""
+        return self.cache_dir / "probe_stats.json"
 
 
 @dataclass
@@ -127,6 +222,55 @@ class DNSResult:
     resolution_time: Optional[float] = None
 
 
+@dataclass
+class DNSAnswer:
+    """Ответ DNS сервера на один A запрос"""
+    ips: List[str]
+    status: str = "NOERROR"              # NOERROR, NXDOMAIN, SERVFAIL...
+    ttl: Optional[int] = None            # минимальный TTL по цепочке CNAME и A
+    negative_ttl: Optional[int] = None   # TTL негативного ответа из SOA
+    cnames: List[Tuple[str, str, int]] = field(default_factory=list)  # звенья CNAME: (имя, цель, TTL)
+    address_ttl: Optional[int] = None    # TTL A записей конечного имени цепочки
+
+
+@dataclass
+class AggregationResult:
+    """Результат свертки IP адресов в маршруты"""
+    targets: List[str]                  # итоговые маршруты (IP или CIDR)
+    input_count: int = 0                # адресов и подсетей на входе
+    promoted: List[str] = field(default_factory=list)   # продвинутые подсети
+    dropped: List[str] = field(default_factory=list)    # не вошли в бюджет
+
+
+@dataclass
+class CoverageResult:
+    """Результат проверки адресов по уже существующим подсетям"""
+    targets: List[str] = field(default_factory=list)     # адреса, которым нужен свой маршрут
+    redundant: List[str] = field(default_factory=list)   # покрыты подсетью того же типа
+    conflicts: List[tuple] = field(default_factory=list)  # (IP, подсеть, RouteType) - покрыты другим типом
+
+
+@dataclass
+class ReconcilePlan:
+    """План приведения маршрутов к желаемому состоянию"""
+    to_add: List[tuple] = field(default_factory=list)     # (target, RouteType)
+    to_remove: List[str] = field(default_factory=list)    # ключи target:interface
+    unchanged: int = 0
+    
+    @property
+    def is_empty(self) -> bool:
+        return not self.to_add and not self.to_remove
+    
+    @property
+    def in_scope(self) -> int:
+        """Записанные маршруты интерфейсов плана: остающиеся и удаляемые"""
+        return self.unchanged + len(self.to_remove)
+    
+    def exceeds_delete_ratio(self, ratio: float) -> bool:
+        """Удаляется больше доли ratio маршрутов - похоже на сбой DNS, а не на изменения"""
+        return bool(self.to_remove) and len(self.to_remove) > ratio * self.in_scope
+
+
 @dataclass
 class OperationResult:
     """Результат операции с маршрутами"""
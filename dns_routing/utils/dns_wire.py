@@ -0,0 +1,356 @@
+"""
+Кодирование и разбор DNS сообщений (RFC 1035) для DNS Routing Manager.
+Только то, что нужно stub-резолверу: запросы, A/CNAME/SOA/NS записи, сжатие имен.
+"""
+import struct
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Union
+
+
+# Типы записей
+QTYPE_A = 1
+QTYPE_NS = 2
+QTYPE_CNAME = 5
+QTYPE_SOA = 6
+QTYPE_OPT = 41
+QTYPE_AAAA = 28
+
+QCLASS_IN = 1
+
+# Коды ответа
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+
+RCODE_NAMES = {
+    RCODE_NOERROR: "NOERROR",
+    RCODE_FORMERR: "FORMERR",
+    RCODE_SERVFAIL: "SERVFAIL",
+    RCODE_NXDOMAIN: "NXDOMAIN",
+    RCODE_REFUSED: "REFUSED",
+}
+
+# Флаги заголовка
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+# Биты OPCODE: ответ повторяет OPCODE запроса
+OPCODE_MASK = 0x7800
+
+# Размер UDP буфера, объявляемый через EDNS0
+EDNS_UDP_SIZE = 1232
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR_FIXED = struct.Struct("!HHIH")
+_SOA_FIXED = struct.Struct("!IIIII")
+
+
+class DNSWireError(ValueError):
+    """Некорректное DNS сообщение"""
+    pass
+
+
+@dataclass
+class DNSRecord:
+    """Ресурсная запись"""
+    name: str
+    rtype: int
+    ttl: int
+    # A/AAAA/CNAME/NS - строка, SOA - кортеж из 7 полей, остальное - bytes
+    data: Union[str, Tuple, bytes]
+    rclass: int = QCLASS_IN
+
+
+@dataclass
+class DNSMessage:
+    """Разобранное DNS сообщение"""
+    id: int
+    flags: int
+    questions: List[Tuple[str, int, int]] = field(default_factory=list)
+    answers: List[DNSRecord] = field(default_factory=list)
+    authority: List[DNSRecord] = field(default_factory=list)
+    additional: List[DNSRecord] = field(default_factory=list)
+
+    @property
+    def rcode(self) -> int:
+        return self.flags & 0x000F
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.flags & FLAG_TC)
+
+    @property
+    def is_response(self) -> bool:
+        return bool(self.flags & FLAG_QR)
+
+    def resolve_chain(self, qname: str, qtype: int = QTYPE_A) -> Tuple[List[str], List[str], Optional[int]]:
+        """
+        Проходит по цепочке CNAME от qname и собирает адреса.
+        Возвращает (адреса, цепочка CNAME целей, минимальный TTL по цепочке).
+        """
+        name = normalize_name(qname)
+        chain: List[str] = []
+        ttl: Optional[int] = None
+
+        # Цепочка не может быть длиннее числа записей в ответе
+        for _ in range(len(self.answers) + 1):
+            target = None
+            for record in self.answers:
+                if record.rtype == QTYPE_CNAME and normalize_name(record.name) == name:
+                    target = normalize_name(record.data)
+                    ttl = record.ttl if ttl is None else min(ttl, record.ttl)
+                    break
+            if target is None or target in chain:
+                break
+            chain.append(target)
+            name = target
+
+        addresses = []
+        for record in self.answers:
+            if record.rtype == qtype and normalize_name(record.name) == name:
+                addresses.append(record.data)
+                ttl = record.ttl if ttl is None else min(ttl, record.ttl)
+
+        return addresses, chain, ttl
+
+    def cname_links(self, qname: str) -> List[Tuple[str, str, int]]:
+        """Звенья цепочки CNAME от qname: [(имя, цель, TTL записи), ...]"""
+        name = normalize_name(qname)
+        links: List[Tuple[str, str, int]] = []
+        seen = {name}
+        for _ in range(len(self.answers)):
+            record = next((r for r in self.answers
+                           if r.rtype == QTYPE_CNAME and normalize_name(r.name) == name), None)
+            if record is None:
+                break
+            target = normalize_name(record.data)
+            links.append((name, target, record.ttl))
+            if target in seen:
+                break
+            seen.add(target)
+            name = target
+        return links
+
+    def soa_minimum(self) -> Optional[int]:
+        """TTL для негативного ответа по RFC 2308: min(SOA TTL, SOA MINIMUM)"""
+        for record in self.authority:
+            if record.rtype == QTYPE_SOA and isinstance(record.data, tuple):
+                return min(record.ttl, record.data[6])
+        return None
+
+
+def normalize_name(name: str) -> str:
+    """Приводит имя к каноническому виду: нижний регистр, без точки в конце"""
+    return name.rstrip('.').lower()
+
+
+def encode_name(name: str) -> bytes:
+    """Кодирует доменное имя в последовательность меток (без сжатия)"""
+    name = name.rstrip('.')
+    if not name:
+        return b'\x00'
+
+    parts = []
+    for label in name.split('.'):
+        raw = label.encode('idna') if not label.isascii() else label.encode('ascii')
+        if not raw or len(raw) > 63:
+            raise DNSWireError(f"Invalid label in name: {name}")
+        parts.append(bytes([len(raw)]) + raw)
+
+    encoded = b''.join(parts) + b'\x00'
+    if len(encoded) > 255:
+        raise DNSWireError(f"Name too long: {name}")
+    return encoded
+
+
+def decode_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """
+    Декодирует имя начиная с offset, поддерживает указатели сжатия.
+    Возвращает (имя, смещение сразу после имени).
+    """
+    labels = []
+    end_offset = None
+    jumps = 0
+
+    while True:
+        if offset >= len(data):
+            raise DNSWireError("Name runs past end of message")
+        length = data[offset]
+
+        if length & 0xC0 == 0xC0:
+            # Указатель сжатия
+            if offset + 1 >= len(data):
+                raise DNSWireError("Truncated compression pointer")
+            if end_offset is None:
+                end_offset = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            jumps += 1
+            if jumps > 64:
+                raise DNSWireError("Compression pointer loop")
+            continue
+
+        if length & 0xC0:
+            raise DNSWireError("Unsupported label type")
+
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('ascii', errors='replace'))
+        offset += length
+
+    return '.'.join(labels), end_offset if end_offset is not None else offset
+
+
+def build_query(qid: int, name: str, qtype: int = QTYPE_A, edns: bool = True) -> bytes:
+    """Собирает рекурсивный запрос с одним вопросом"""
+    header = _HEADER.pack(qid, FLAG_RD, 1, 0, 0, 1 if edns else 0)
+    question = encode_name(name) + struct.pack("!HH", qtype, QCLASS_IN)
+
+    if edns:
+        # OPT запись: корневое имя, размер UDP буфера в поле класса
+        opt = b'\x00' + _RR_FIXED.pack(QTYPE_OPT, EDNS_UDP_SIZE, 0, 0)
+        return header + question + opt
+    return header + question
+
+
+def _encode_rdata(record: DNSRecord) -> bytes:
+    """Кодирует RDATA записи"""
+    if record.rtype == QTYPE_A:
+        return bytes(int(part) for part in record.data.split('.'))
+    if record.rtype in (QTYPE_CNAME, QTYPE_NS):
+        return encode_name(record.data)
+    if record.rtype == QTYPE_SOA:
+        mname, rname, serial, refresh, retry, expire, minimum = record.data
+        return (encode_name(mname) + encode_name(rname) +
+                _SOA_FIXED.pack(serial, refresh, retry, expire, minimum))
+    return bytes(record.data)
+
+
+def encode_record(record: DNSRecord) -> bytes:
+    """Кодирует ресурсную запись (без сжатия имен)"""
+    rdata = _encode_rdata(record)
+    return (encode_name(record.name) +
+            _RR_FIXED.pack(record.rtype, record.rclass, record.ttl, len(rdata)) + rdata)
+
+
+def build_response(qid: int, question: Tuple[str, int, int], answers: List[DNSRecord],
+                   authority: Optional[List[DNSRecord]] = None,
+                   rcode: int = RCODE_NOERROR, truncated: bool = False) -> bytes:
+    """Собирает ответ на запрос (используется локальным stub сервером)"""
+    authority = authority or []
+    flags = FLAG_QR | FLAG_RD | FLAG_RA | (rcode & 0x000F)
+    if truncated:
+        flags |= FLAG_TC
+        answers = []
+        authority = []
+
+    qname, qtype, qclass = question
+    parts = [
+        _HEADER.pack(qid, flags, 1, len(answers), len(authority), 0),
+        encode_name(qname) + struct.pack("!HH", qtype, qclass),
+    ]
+    parts.extend(encode_record(record) for record in answers)
+    parts.extend(encode_record(record) for record in authority)
+    return b''.join(parts)
+
+
+def _parse_record(data: bytes, offset: int) -> Tuple[DNSRecord, int]:
+    """Разбирает одну ресурсную запись"""
+    name, offset = decode_name(data, offset)
+    if offset + _RR_FIXED.size > len(data):
+        raise DNSWireError("Truncated resource record")
+    rtype, rclass, ttl, rdlength = _RR_FIXED.unpack_from(data, offset)
+    offset += _RR_FIXED.size
+    end = offset + rdlength
+    if end > len(data):
+        raise DNSWireError("Truncated RDATA")
+
+    rdata: Union[str, Tuple, bytes]
+    if rtype == QTYPE_A and rdlength == 4:
+        rdata = '.'.join(str(b) for b in data[offset:end])
+    elif rtype in (QTYPE_CNAME, QTYPE_NS):
+        rdata, _ = decode_name(data, offset)
+    elif rtype == QTYPE_SOA:
+        mname, pos = decode_name(data, offset)
+        rname, pos = decode_name(data, pos)
+        if pos + _SOA_FIXED.size > end:
+            raise DNSWireError("Truncated SOA record")
+        rdata = (mname, rname) + _SOA_FIXED.unpack_from(data, pos)
+    else:
+        rdata = data[offset:end]
+
+    return DNSRecord(name=name, rtype=rtype, ttl=ttl, data=rdata, rclass=rclass), end
+
+
+def parse_message(data: bytes) -> DNSMessage:
+    """Разбирает DNS сообщение из wire формата"""
+    if len(data) < _HEADER.size:
+        raise DNSWireError("Message shorter than header")
+
+    qid, flags, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(data, 0)
+    message = DNSMessage(id=qid, flags=flags)
+    offset = _HEADER.size
+
+    for _ in range(qdcount):
+        qname, offset = decode_name(data, offset)
+        if offset + 4 > len(data):
+            raise DNSWireError("Truncated question")
+        qtype, qclass = struct.unpack_from("!HH", data, offset)
+        offset += 4
+        message.questions.append((qname, qtype, qclass))
+
+    for count, section in ((ancount, message.answers),
+                           (nscount, message.authority),
+                           (arcount, message.additional)):
+        for _ in range(count):
+            record, offset = _parse_record(data, offset)
+            section.append(record)
+
+    return message
+
+
+def skip_name(data: bytes, offset: int) -> int:
+    """Смещение сразу после имени без его декодирования"""
+    while True:
+        if offset >= len(data):
+            raise DNSWireError("Name runs past end of message")
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        if length & 0xC0:
+            raise DNSWireError("Unsupported label type")
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def ttl_offsets(data: bytes) -> List[Tuple[int, int]]:
+    """
+    Позиции полей TTL всех записей сообщения: [(смещение, TTL), ...].
+    OPT пропускается - в ее поле TTL лежат флаги EDNS. Нужно, чтобы
+    уменьшать TTL в готовом ответе из кэша, не пересобирая сообщение.
+    """
+    if len(data) < _HEADER.size:
+        raise DNSWireError("Message shorter than header")
+    _, _, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(data, 0)
+
+    offset = _HEADER.size
+    for _ in range(qdcount):
+        offset = skip_name(data, offset) + 4
+
+    offsets = []
+    for _ in range(ancount + nscount + arcount):
+        offset = skip_name(data, offset)
+        if offset + _RR_FIXED.size > len(data):
+            raise DNSWireError("Truncated resource record")
+        rtype, _, ttl, rdlength = _RR_FIXED.unpack_from(data, offset)
+        if rtype != QTYPE_OPT:
+            offsets.append((offset + 4, ttl))
+        offset += _RR_FIXED.size + rdlength
+    if offset > len(data):
+        raise DNSWireError("Truncated RDATA")
+    return offsets
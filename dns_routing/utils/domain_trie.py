@@ -0,0 +1,110 @@
+"""
+Суффиксное дерево доменных меток для классификации имен.
+
+Дерево по перевернутым меткам (com -> example -> www) хранится плоско:
+узел - это суффикс имени, и все узлы с правилами лежат в одном dict
+'суффикс' -> битовая маска правил. Поиск проходит суффиксы имени от
+самого длинного к короткому - не больше числа меток проверок, - а
+память на правило - одна запись dict без словарей на каждый узел.
+Ключами служат сами строки имен из индекса, поэтому на 1M правил
+дерево добавляет только таблицу dict.
+
+Семантика правил (как у wildcard расширения резолвера):
+    example.com      - только example.com
+    *.example.com    - example.com и имена на одну метку глубже
+    **.example.com   - example.com и все поддомены
+
+Приоритет: побеждает самый длинный совпавший суффикс; на одном суффиксе
+точное правило сильнее *., а *. сильнее **.; при одинаковых правилах
+в обоих списках побеждает LOCAL (как в демоне и process).
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..models import DomainType, RouteType
+
+
+# Порядок проверки на одном узле: сначала вид правила, затем тип маршрута
+_KINDS = [DomainType.EXACT, DomainType.WILDCARD, DomainType.DEEP_WILDCARD]
+_ROUTE_TYPES = [RouteType.LOCAL, RouteType.VPN]
+
+_BITS = {(kind, route_type): 1 << (index * len(_ROUTE_TYPES) + offset)
+         for index, kind in enumerate(_KINDS)
+         for offset, route_type in enumerate(_ROUTE_TYPES)}
+
+# Правила, применимые к имени на глубине 0 (сам суффикс), 1 и больше
+_ORDER_SAME = [(_BITS[kind, route_type], kind, route_type)
+               for kind in _KINDS for route_type in _ROUTE_TYPES]
+_ORDER_CHILD = [entry for entry in _ORDER_SAME if entry[1] != DomainType.EXACT]
+_ORDER_DEEP = [entry for entry in _ORDER_SAME if entry[1] == DomainType.DEEP_WILDCARD]
+
+_MASK_CHILD = sum(bit for bit, _, _ in _ORDER_CHILD)
+_MASK_DEEP = sum(bit for bit, _, _ in _ORDER_DEEP)
+
+# (тип маршрута, вид правила, домен правила)
+DomainMatch = Tuple[RouteType, DomainType, str]
+
+
+def normalize_hostname(hostname: str) -> str:
+    return hostname.strip().lower().rstrip('.')
+
+
+class DomainTrie:
+    """
+    Правила доменов -> тип маршрута.
+
+    Использование:
+        trie = DomainTrie()
+        trie.insert('example.com', DomainType.WILDCARD, RouteType.VPN)
+        trie.lookup('www.example.com')   # (RouteType.VPN, DomainType.WILDCARD, 'example.com')
+    """
+
+    def __init__(self):
+        self._nodes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def insert(self, name: str, domain_type: DomainType, route_type: RouteType) -> None:
+        """Добавляет правило; имя должно быть нормализовано (без *. и точки в конце)"""
+        self._nodes[name] = self._nodes.get(name, 0) | _BITS[domain_type, route_type]
+
+    def insert_many(self, names: Iterable[str], domain_types: Iterable[DomainType],
+                    route_type: RouteType) -> None:
+        """Добавляет группу правил одного типа маршрута (загрузка индекса)"""
+        bits = {kind: _BITS[kind, route_type] for kind in _KINDS}
+        nodes = self._nodes
+        get = nodes.get
+        for name, kind in zip(names, domain_types):
+            nodes[name] = get(name, 0) | bits[kind]
+
+    def lookup(self, hostname: str) -> Optional[DomainMatch]:
+        """Самое специфичное правило для имени или None"""
+        name = normalize_hostname(hostname)
+        nodes = self._nodes
+
+        mask = nodes.get(name)
+        if mask:
+            for bit, kind, route_type in _ORDER_SAME:
+                if mask & bit:
+                    return route_type, kind, name
+
+        position = name.find('.')
+        depth = 1
+        while position >= 0:
+            suffix = name[position + 1:]
+            mask = nodes.get(suffix)
+            if mask and mask & (_MASK_CHILD if depth == 1 else _MASK_DEEP):
+                for bit, kind, route_type in (_ORDER_CHILD if depth == 1 else _ORDER_DEEP):
+                    if mask & bit:
+                        return route_type, kind, suffix
+            position = name.find('.', position + 1)
+            depth += 1
+        return None
+
+    def rules(self, name: str) -> List[Tuple[DomainType, RouteType]]:
+        """Все правила, заданные для точно такого домена"""
+        mask = self._nodes.get(name, 0)
+        return [(kind, route_type) for bit, kind, route_type in _ORDER_SAME if mask & bit]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._nodes)
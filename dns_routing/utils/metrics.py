@@ -0,0 +1,375 @@
+"""
+Метрики DNS Routing Manager в формате Prometheus.
+
+Счетчики, значения и гистограммы живут в одном реестре процесса
+(REGISTRY) и объявляются в модулях, которые их пишут:
+
+    LOOKUPS = REGISTRY.counter('dns_routing_dns_lookups_total',
+                               'DNS lookups by result', ['backend', 'result'])
+    LOOKUPS.labels('native', 'ok').inc()
+
+На горячем пути дочерняя метрика с метками берется один раз, дальше
+запись - одно сложение под блокировкой. Экспорт:
+    - textfile: write_textfile() атомарно заменяет файл для textfile
+      collector node_exporter (после прогона process, шага демона)
+    - HTTP: start_http_server() отдает /metrics из фонового потока
+      (daemon и proxy)
+"""
+import bisect
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Границы корзин гистограмм задержки по умолчанию, секунды
+LATENCY_BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterValue:
+    """Монотонный счетчик с одним набором меток"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str) -> List[Tuple[str, str, float]]:
+        return [(name, "", self.value)]
+
+
+class _GaugeValue(_CounterValue):
+    """Значение, которое может и расти, и уменьшаться"""
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    """Гистограмма с фиксированными корзинами, границы - в секундах"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self._lock = threading.Lock()
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Учитывает длительность блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попал q-й процентиль"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def samples(self, name: str) -> List[Tuple[str, str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + [math.inf], self.counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", f'le="{_format_value(bound)}"', cumulative))
+        samples.append((f"{name}_sum", "", self.sum))
+        samples.append((f"{name}_count", "", self.count))
+        return samples
+
+
+class Metric:
+    """
+    Семейство метрик одного имени: по дочерней метрике на набор меток.
+    Метрика без меток сама принимает inc/set/observe.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _init_unlabeled(self) -> None:
+        # Метрика без меток видна в экспорте с нулем еще до первой записи,
+        # а ее методы записи вызываются напрямую, без поиска дочерней
+        if not self.labelnames:
+            child = self.labels()
+            for attr in ('inc', 'dec', 'set', 'observe', 'time'):
+                if hasattr(child, attr):
+                    setattr(self, attr, getattr(child, attr))
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """Дочерняя метрика для значений меток (по порядку или по именам)"""
+        if labels:
+            values = tuple(str(labels[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def __getattr__(self, attr: str):
+        # value/count/sum метрики без меток
+        if attr.startswith('_') or self.labelnames:
+            raise AttributeError(attr)
+        return getattr(self.labels(), attr)
+
+    def clear(self) -> None:
+        """Забывает все наборы меток"""
+        with self._lock:
+            self._children.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            for name, extra, value in child.samples(self.name):
+                lines.append(f"{name}{_format_labels(self.labelnames, values, extra)} "
+                             f"{_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeValue:
+        return _GaugeValue()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса.
+    Повторное объявление метрики с тем же именем возвращает существующую.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, cls, name: str, documentation: str,
+                  labelnames: Sequence[str], **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+                metric._init_unlabeled()
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        """
+        Атомарно записывает метрики в файл: textfile collector не должен
+        прочитать файл наполовину. Ошибки записи не прерывают работу.
+        """
+        path = Path(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(self.render())
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Warning: Could not write metrics to {path}: {e}")
+
+
+# Реестр процесса
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.counter('dns_routing_phase_seconds_total',
+                                 'Time spent in each processing phase', ['phase'])
+_RUN_DURATION = REGISTRY.gauge('dns_routing_last_run_duration_seconds',
+                               'Duration of the last run', ['mode'])
+_RUN_TIMESTAMP = REGISTRY.gauge('dns_routing_last_run_timestamp_seconds',
+                                'Unix time the last run finished', ['mode'])
+_RUN_SUCCESS = REGISTRY.gauge('dns_routing_last_run_success',
+                              'Whether the last run finished without errors', ['mode'])
+
+
+# Подписчики границ фаз (профилировщик): фаза или None - начало нового отсчета
+_phase_hooks: List[Callable[[Optional[str]], None]] = []
+
+
+def add_phase_hook(hook: Callable[[Optional[str]], None]) -> None:
+    _phase_hooks.append(hook)
+
+
+def remove_phase_hook(hook: Callable[[Optional[str]], None]) -> None:
+    if hook in _phase_hooks:
+        _phase_hooks.remove(hook)
+
+
+class PhaseTimer:
+    """
+    Разбивка прогона на фазы: lap(phase) относит время с предыдущей
+    отметки к фазе в dns_routing_phase_seconds_total, поэтому сумма фаз
+    равна длительности прогона.
+    """
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        for hook in _phase_hooks:
+            hook(None)
+
+    def lap(self, phase: str) -> float:
+        now = time.perf_counter()
+        seconds = now - self._last
+        self._last = now
+        PHASE_SECONDS.labels(phase).inc(seconds)
+        for hook in _phase_hooks:
+            hook(phase)
+        return seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+def record_run(mode: str, duration: float, success: bool) -> None:
+    """Отмечает завершение прогона (process) или шага (daemon)"""
+    _RUN_DURATION.labels(mode).set(duration)
+    _RUN_TIMESTAMP.labels(mode).set(time.time())
+    _RUN_SUCCESS.labels(mode).set(1 if success else 0)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # Опрос раз в несколько секунд не должен засорять вывод
+        pass
+
+
+def start_http_server(port: int, listen: str = "127.0.0.1",
+                      registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Отдает /metrics из фонового потока. Возвращает сервер
+    (server.server_port - фактический порт, shutdown() - остановка).
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((listen, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,181 @@
+"""
+Сетевые утилиты для DNS Routing Manager.
+"""
+import ipaddress
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from ..models import AggregationResult, CoverageResult, RoutingConfig
+from .radix import RadixTree
+
+
+def get_system_nameservers(resolv_conf: Path = Path("/etc/resolv.conf")) -> List[str]:
+    """Возвращает DNS серверы системного резолвера из resolv.conf"""
+    servers = []
+    
+    try:
+        for line in resolv_conf.read_text().splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == 'nameserver':
+                # Убираем zone id у IPv6 адресов (fe80::1%en0)
+                servers.append(parts[1].split('%')[0])
+    except OSError:
+        pass
+    
+    return servers
+
+
+def format_target(network: ipaddress.IPv4Network) -> str:
+    """Хосты - обычным IP, подсети - в CIDR нотации (как ожидает RouteManager)"""
+    if network.prefixlen == 32:
+        return str(network.network_address)
+    return str(network)
+
+
+def _merge_for_budget(networks: List[ipaddress.IPv4Network], budget: int,
+                      min_prefix: int) -> List[ipaddress.IPv4Network]:
+    """
+    Укрупняет маршруты, пока их больше budget: на каждом уровне префикса
+    (от /31 к min_prefix) сначала объединяются самые плотные группы.
+    """
+    for prefix in range(31, min_prefix - 1, -1):
+        if len(networks) <= budget:
+            break
+        
+        groups: Dict[ipaddress.IPv4Network, List[ipaddress.IPv4Network]] = {}
+        for network in networks:
+            if network.prefixlen > prefix:
+                groups.setdefault(network.supernet(new_prefix=prefix), []).append(network)
+        
+        excess = len(networks) - budget
+        merged = set()
+        for supernet, members in sorted(groups.items(), key=lambda item: -len(item[1])):
+            if excess <= 0 or len(members) < 2:
+                break
+            merged.add(supernet)
+            excess -= len(members) - 1
+        
+        if merged:
+            networks = list(ipaddress.collapse_addresses(
+                [net for net in networks
+                 if net.prefixlen <= prefix or net.supernet(new_prefix=prefix) not in merged]
+                + list(merged)
+            ))
+    
+    return networks
+
+
+def aggregate_targets(targets: Iterable[str], promote_prefix: Optional[int] = None,
+                      promote_min_hosts: int = 0, route_budget: int = 0,
+                      budget_min_prefix: int = 16) -> AggregationResult:
+    """
+    Сворачивает IP адреса и подсети в минимальный набор маршрутов.
+    
+    1. Точное объединение: соседние и вложенные префиксы сливаются без
+       расширения покрытия (10.0.0.0/32 + 10.0.0.1/32 -> 10.0.0.0/31).
+    2. Продвижение (опционально): подсеть /promote_prefix заменяет свои хосты,
+       если в ней не меньше promote_min_hosts адресов.
+    3. Бюджет (опционально): если маршрутов больше route_budget, самые плотные
+       группы укрупняются до budget_min_prefix, остаток отбрасывается
+       (сначала самые узкие маршруты).
+    """
+    networks = []
+    for target in targets:
+        try:
+            networks.append(ipaddress.IPv4Network(target, strict=False))
+        except ValueError:
+            continue
+    
+    result = AggregationResult(targets=[], input_count=len(networks))
+    
+    if promote_prefix and promote_min_hosts > 0:
+        groups: Dict[ipaddress.IPv4Network, List[ipaddress.IPv4Network]] = {}
+        rest = []
+        for network in networks:
+            if network.prefixlen > promote_prefix:
+                groups.setdefault(network.supernet(new_prefix=promote_prefix), []).append(network)
+            else:
+                rest.append(network)
+        
+        for supernet, members in groups.items():
+            if sum(member.num_addresses for member in members) >= promote_min_hosts:
+                rest.append(supernet)
+                result.promoted.append(str(supernet))
+            else:
+                rest.extend(members)
+        networks = rest
+    
+    networks = list(ipaddress.collapse_addresses(networks))
+    
+    if route_budget and len(networks) > route_budget:
+        networks = _merge_for_budget(networks, route_budget, budget_min_prefix)
+        if len(networks) > route_budget:
+            networks.sort(key=lambda net: net.prefixlen)
+            result.dropped = [format_target(net) for net in networks[route_budget:]]
+            networks = sorted(networks[:route_budget])
+    
+    result.targets = [format_target(network) for network in networks]
+    return result
+
+
+def aggregate_for_config(targets: List[str], config: RoutingConfig,
+                         routes_planned: int = 0) -> AggregationResult:
+    """
+    Свертка целей одной группы по настройкам routing.* - общая для
+    process и демона, чтобы они строили одинаковый набор маршрутов.
+    routes_planned - маршрутов уже запланировано в этом прогоне
+    (бюджет routing.route_budget общий на все группы).
+    """
+    budget = config.route_budget - routes_planned if config.route_budget else 0
+    if config.route_budget and budget <= 0:
+        return AggregationResult(targets=[], input_count=len(targets), dropped=list(targets))
+    if not config.aggregate_routes and not budget:
+        return AggregationResult(targets=list(targets), input_count=len(targets))
+    return aggregate_targets(
+        targets,
+        promote_prefix=config.promote_prefix,
+        promote_min_hosts=config.promote_min_hosts,
+        route_budget=budget,
+        budget_min_prefix=config.budget_min_prefix
+    )
+
+
+def build_prefix_tree(prefixes: Iterable[tuple]) -> RadixTree:
+    """
+    Строит дерево префиксов из пар (IP или CIDR, значение).
+    Некорректные записи пропускаются; при повторе префикса побеждает первый.
+    """
+    tree = RadixTree()
+    for target, value in prefixes:
+        try:
+            network = ipaddress.IPv4Network(target, strict=False)
+        except ValueError:
+            continue
+        if tree.get(network) is None:
+            tree.insert(network, value)
+    return tree
+
+
+def filter_covered(addresses: Iterable[str], value, tree: RadixTree) -> CoverageResult:
+    """
+    Отбрасывает адреса, уже покрытые маршрутом с тем же значением.
+    Для каждого адреса один поиск по самому длинному префиксу: если он
+    указывает туда же - отдельный маршрут не нужен; если в другое место -
+    адрес остается и попадает в конфликты.
+    """
+    result = CoverageResult()
+    for address in addresses:
+        try:
+            match = tree.lookup(address)
+        except ValueError:
+            result.targets.append(address)
+            continue
+        
+        if match is None:
+            result.targets.append(address)
+        elif match[1] == value:
+            result.redundant.append(address)
+        else:
+            result.targets.append(address)
+            result.conflicts.append((address, format_target(match[0]), match[1]))
+    return result
@@ -0,0 +1,262 @@
+"""
+Профилирование прогонов DNS Routing Manager (dns-routing --profile ...).
+
+Время и память делятся по фазам прогона: отметки PhaseTimer
+(load, resolve, plan, routes, verify, persist) переключают профиль
+на следующую фазу; время вне отметок попадает в фазу other.
+
+Режимы:
+    детерминированный  - cProfile и tracemalloc, точные вызовы, но только
+                         главного потока и с заметным замедлением
+    выборочный         - (interval > 0) фоновый поток раз в interval секунд
+                         снимает стеки всех потоков; дешево для долгой работы
+                         демона, память - пиковый RSS процесса
+
+Оба режима пишут pstats дамп (python -m pstats, snakeviz) и печатают
+в stderr сводку: по каждой фазе время, пик памяти и функции с
+наибольшим накопленным временем.
+"""
+import cProfile
+import marshal
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import add_phase_hook, remove_phase_hook
+
+
+# Функция в pstats: (файл, строка, имя)
+FuncKey = Tuple[str, int, str]
+
+# Фаза времени вне отметок PhaseTimer
+OTHER_PHASE = "other"
+
+# Файлы, функции которых не показываются в сводке: обвязка запуска и CLI
+# (они в стеке каждого снимка) и сам профилировщик
+_HIDDEN_PATHS = (
+    os.path.join(os.path.dirname(__file__), "profiling.py"),
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py"),
+    os.sep + "click" + os.sep,
+    "<frozen runpy>",
+)
+
+# Стек потока, ждущего на блокировке или сокете, - простой, а не работа
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "socketserver.py")
+
+
+def _peak_rss_mb() -> float:
+    """Максимальный RSS процесса (ru_maxrss - КБ на Linux, байты на macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _func_label(func: FuncKey) -> str:
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class _Phase:
+    """Накопленные данные одной фазы"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.peak_mb = 0.0
+        self.profiles: List[cProfile.Profile] = []
+        # Выборочный режим: число снимков, в которых функция была в стеке / на вершине
+        self.samples = 0
+        self.cumulative: Dict[FuncKey, int] = {}
+        self.own: Dict[FuncKey, int] = {}
+        self.callers: Dict[FuncKey, Dict[FuncKey, int]] = {}
+
+
+class RunProfiler:
+    """
+    Профиль одной команды CLI.
+
+    Использование:
+        profiler = RunProfiler(Path("process.pstats"), interval=0.0)
+        profiler.start()
+        ...                      # команда; PhaseTimer.lap() делит профиль на фазы
+        profiler.finish()        # дамп и сводка
+    """
+
+    def __init__(self, output: Path, interval: float = 0.0, top: int = 8):
+        self.output = Path(output)
+        self.interval = interval
+        self.top = top
+        self.phases: Dict[str, _Phase] = {}
+        self._lock = threading.Lock()
+        self._started = 0.0
+        self._segment_started = 0.0
+        self._profile: Optional[cProfile.Profile] = None
+        self._current = _Phase()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._finished = False
+
+    @property
+    def sampling(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> None:
+        self._started = self._segment_started = time.perf_counter()
+        add_phase_hook(self._on_phase)
+        if self.sampling:
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._sampler.start()
+        else:
+            tracemalloc.start()
+            self._begin_segment()
+
+    # --- Границы фаз ---
+
+    def _begin_segment(self) -> None:
+        self._segment_started = time.perf_counter()
+        if not self.sampling:
+            tracemalloc.reset_peak()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _end_segment(self, phase: str) -> None:
+        """Относит данные с начала отрезка к фазе phase"""
+        if not self.sampling and self._profile is not None:
+            self._profile.disable()
+        with self._lock:
+            segment, self._current = self._current, _Phase()
+        stats = self.phases.setdefault(phase, _Phase())
+        stats.seconds += time.perf_counter() - self._segment_started
+
+        if self.sampling:
+            stats.peak_mb = max(stats.peak_mb, _peak_rss_mb())
+            stats.samples += segment.samples
+            for source, target in ((segment.cumulative, stats.cumulative), (segment.own, stats.own)):
+                for func, count in source.items():
+                    target[func] = target.get(func, 0) + count
+            for func, callers in segment.callers.items():
+                merged = stats.callers.setdefault(func, {})
+                for caller, count in callers.items():
+                    merged[caller] = merged.get(caller, 0) + count
+        else:
+            stats.peak_mb = max(stats.peak_mb, tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+            stats.profiles.append(self._profile)
+            self._profile = None
+
+    def _on_phase(self, phase: Optional[str]) -> None:
+        self._end_segment(phase or OTHER_PHASE)
+        self._begin_segment()
+
+    # --- Выборка стеков ---
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                segment = self._current
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self._record_stack(segment, frame)
+
+    def _record_stack(self, segment: _Phase, frame) -> None:
+        if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+            return
+        stack: List[FuncKey] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+
+        segment.samples += 1
+        segment.own[stack[0]] = segment.own.get(stack[0], 0) + 1
+        # Рекурсивная функция учитывается в снимке один раз
+        for func in set(stack):
+            segment.cumulative[func] = segment.cumulative.get(func, 0) + 1
+        for callee, caller in zip(stack, stack[1:]):
+            callers = segment.callers.setdefault(callee, {})
+            callers[caller] = callers.get(caller, 0) + 1
+
+    # --- Результат ---
+
+    def finish(self) -> None:
+        """Останавливает профилирование, пишет дамп и печатает сводку"""
+        if self._finished:
+            return
+        self._finished = True
+        if self.sampling:
+            self._stop.set()
+            self._sampler.join()
+        self._end_segment(OTHER_PHASE)
+        remove_phase_hook(self._on_phase)
+        if not self.sampling:
+            tracemalloc.stop()
+
+        try:
+            self.output.parent.mkdir(parents=True, exist_ok=True)
+            self._write_stats()
+        except OSError as e:
+            print(f"Warning: Could not write profile to {self.output}: {e}", file=sys.stderr)
+        for line in self.format_summary():
+            print(line, file=sys.stderr)
+
+    def _write_stats(self) -> None:
+        if not self.sampling:
+            profiles = [profile for phase in self.phases.values() for profile in phase.profiles]
+            pstats.Stats(*profiles).dump_stats(str(self.output))
+            return
+
+        # Снимки в формате pstats: вызовы - число снимков, время - снимки * interval
+        stats = {}
+        merged = _Phase()
+        for phase in self.phases.values():
+            for source, target in ((phase.cumulative, merged.cumulative), (phase.own, merged.own)):
+                for func, count in source.items():
+                    target[func] = target.get(func, 0) + count
+            for func, callers in phase.callers.items():
+                into = merged.callers.setdefault(func, {})
+                for caller, count in callers.items():
+                    into[caller] = into.get(caller, 0) + count
+        for func, count in merged.cumulative.items():
+            own = merged.own.get(func, 0) * self.interval
+            callers = {caller: (calls, calls, 0.0, calls * self.interval)
+                       for caller, calls in merged.callers.get(func, {}).items()}
+            stats[func] = (count, count, own, count * self.interval, callers)
+        with open(self.output, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def _top_functions(self, phase: _Phase) -> List[Tuple[float, str, str]]:
+        """(накопленное время, вызовы или доля снимков, функция) по убыванию времени"""
+        rows = []
+        if self.sampling:
+            for func, count in phase.cumulative.items():
+                rows.append((count * self.interval, f"{count * 100 / phase.samples:.0f}%", func))
+        elif phase.profiles:
+            stats = pstats.Stats(*phase.profiles).stats
+            for func, (_, calls, _, cumulative, _) in stats.items():
+                rows.append((cumulative, str(calls), func))
+        rows = [row for row in rows if not any(path in row[2][0] for path in _HIDDEN_PATHS)]
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return [(seconds, calls, _func_label(func)) for seconds, calls, func in rows[:self.top]]
+
+    def format_summary(self) -> List[str]:
+        mode = (f"sampling every {self.interval * 1000:g} ms, memory - peak RSS" if self.sampling
+                else "cProfile (main thread), memory - tracemalloc peak")
+        total = sum(phase.seconds for phase in self.phases.values())
+        lines = [f"\nProfile: {total:.3f}s, {mode}",
+                 f"  written to {self.output} (python -m pstats {self.output})"]
+        column = "samples" if self.sampling else "calls"
+        for name, phase in sorted(self.phases.items(), key=lambda item: item[1].seconds, reverse=True):
+            lines.append(f"  {name:<8} {phase.seconds:8.3f}s  peak {phase.peak_mb:7.1f} MB")
+            top = self._top_functions(phase)
+            if top:
+                lines.append(f"      {'cum s':>8} {column:>8}  function")
+            for seconds, calls, label in top:
+                lines.append(f"      {seconds:8.3f} {calls:>8}  {label}")
+        return lines
@@ -0,0 +1,139 @@
+"""
+IPv4 radix (patricia) дерево для поиска по самому длинному префиксу.
+
+Ключи - 32-битные целые, цепочки узлов с одним потомком сжаты,
+поэтому глубина поиска не превышает числа различных длин префиксов
+на пути к адресу, а размер дерева - 2 * N узлов для N префиксов.
+"""
+import ipaddress
+from typing import Any, Iterator, Optional, Tuple, Union
+
+
+_NO_VALUE = object()
+
+NetworkLike = Union[str, ipaddress.IPv4Network]
+AddressLike = Union[str, int, ipaddress.IPv4Address]
+
+
+def _mask(length: int) -> int:
+    return (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+
+
+def _bit(key: int, index: int) -> int:
+    """Бит ключа с номером index (0 - старший)"""
+    return (key >> (31 - index)) & 1
+
+
+def _common_length(a: int, b: int) -> int:
+    """Длина общего префикса двух ключей"""
+    return 32 - (a ^ b).bit_length()
+
+
+class _Node:
+    __slots__ = ('key', 'length', 'value', 'children')
+
+    def __init__(self, key: int, length: int, value: Any = _NO_VALUE):
+        self.key = key
+        self.length = length
+        self.value = value
+        self.children = [None, None]
+
+
+class RadixTree:
+    """
+    Дерево префиксов IPv4 -> значение.
+
+    Использование:
+        tree = RadixTree()
+        tree.insert('52.0.0.0/11', RouteType.VPN)
+        tree.lookup('52.1.2.3')   # (IPv4Network('52.0.0.0/11'), RouteType.VPN)
+    """
+
+    def __init__(self):
+        self._root = _Node(0, 0)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _parse_network(network: NetworkLike) -> Tuple[int, int]:
+        if not isinstance(network, ipaddress.IPv4Network):
+            network = ipaddress.IPv4Network(network, strict=False)
+        return int(network.network_address), network.prefixlen
+
+    def insert(self, network: NetworkLike, value: Any) -> None:
+        """Добавляет префикс (существующее значение заменяется)"""
+        key, length = self._parse_network(network)
+        node = self._root
+
+        while True:
+            if node.length == length:
+                if node.value is _NO_VALUE:
+                    self._size += 1
+                node.value = value
+                return
+
+            branch = _bit(key, node.length)
+            child = node.children[branch]
+            if child is None:
+                node.children[branch] = _Node(key, length, value)
+                self._size += 1
+                return
+
+            common = min(length, child.length, _common_length(key, child.key))
+            if common == child.length:
+                node = child
+                continue
+
+            # Префикс расходится с потомком - вставляем узел на развилке
+            if common == length:
+                new_node = _Node(key, length, value)
+                new_node.children[_bit(child.key, length)] = child
+            else:
+                new_node = _Node(key & _mask(common), common)
+                new_node.children[_bit(child.key, common)] = child
+                new_node.children[_bit(key, common)] = _Node(key, length, value)
+            node.children[branch] = new_node
+            self._size += 1
+            return
+
+    def get(self, network: NetworkLike, default: Any = None) -> Any:
+        """Значение для точно такого префикса"""
+        key, length = self._parse_network(network)
+        node = self._root
+        while node is not None and node.length < length:
+            node = node.children[_bit(key, node.length)]
+            if node is not None and (key & _mask(node.length)) != node.key:
+                return default
+        if node is None or node.length != length or node.value is _NO_VALUE:
+            return default
+        return node.value
+
+    def lookup(self, address: AddressLike) -> Optional[Tuple[ipaddress.IPv4Network, Any]]:
+        """Самый длинный префикс, покрывающий адрес: (подсеть, значение) или None"""
+        key = int(ipaddress.IPv4Address(address)) if not isinstance(address, int) else address
+        node = self._root
+        best = None
+
+        while node is not None:
+            if node.value is not _NO_VALUE:
+                best = node
+            if node.length == 32:
+                break
+            node = node.children[_bit(key, node.length)]
+            if node is not None and (key & _mask(node.length)) != node.key:
+                break
+
+        if best is None:
+            return None
+        return ipaddress.IPv4Network((best.key, best.length)), best.value
+
+    def items(self) -> Iterator[Tuple[ipaddress.IPv4Network, Any]]:
+        """Все префиксы в порядке обхода дерева"""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.value is not _NO_VALUE:
+                yield ipaddress.IPv4Network((node.key, node.length)), node.value
+            stack.extend(child for child in reversed(node.children) if child is not None)
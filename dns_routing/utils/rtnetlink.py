@@ -0,0 +1,193 @@
+"""
+Кодирование и разбор сообщений rtnetlink (Linux) для DNS Routing Manager.
+Только маршруты IPv4 и правила выбора таблицы: RTM_NEWROUTE/DELROUTE/GETROUTE,
+RTM_NEWRULE, подтверждения NLMSG_ERROR.
+"""
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Типы сообщений
+NLMSG_NOOP = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWRULE = 32
+
+# Флаги заголовка
+NLM_F_REQUEST = 0x001
+NLM_F_MULTI = 0x002
+NLM_F_ACK = 0x004
+NLM_F_ROOT = 0x100
+NLM_F_MATCH = 0x200
+NLM_F_DUMP = NLM_F_ROOT | NLM_F_MATCH
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# Параметры сокета
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10       # подтверждения без копии исходного сообщения
+
+# Атрибуты маршрута
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+
+# Атрибуты правила
+FRA_PRIORITY = 6
+FRA_TABLE = 15
+
+# Значения полей rtmsg
+RT_TABLE_UNSPEC = 0
+RT_TABLE_MAIN = 254
+RTPROT_STATIC = 4
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255      # при удалении - любой scope
+RTN_UNICAST = 1
+FR_ACT_TO_TBL = 1
+
+_NLMSGHDR = struct.Struct("=IHHII")     # len, type, flags, seq, pid
+_RTMSG = struct.Struct("=BBBBBBBBI")    # family, dst_len, src_len, tos, table, protocol, scope, type, flags
+_FIB_RULE_HDR = _RTMSG                  # family, dst_len, src_len, tos, table, res1, res2, action, flags
+_RTATTR = struct.Struct("=HH")          # len, type
+_U32 = struct.Struct("=I")
+_ATTR_U32 = struct.Struct("=HHI")
+_ATTR_ADDR = struct.Struct("=HH4s")
+# Заголовок + rtmsg + RTA_TABLE + RTA_DST
+_ROUTE_FIXED = struct.Struct("=IHHII" "BBBBBBBBI" "HHI" "HH4s")
+_ERRNO = struct.Struct("=i")
+
+
+@dataclass
+class NetlinkRoute:
+    """Маршрут из дампа таблицы"""
+    destination: str            # CIDR
+    gateway: Optional[str]
+    oif: Optional[int]          # индекс интерфейса
+    table: int
+    route_type: int
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def pack_attr(attr_type: int, payload: bytes) -> bytes:
+    length = _RTATTR.size + len(payload)
+    return _RTATTR.pack(length, attr_type) + payload + b'\0' * (_align(length) - length)
+
+
+def pack_message(msg_type: int, flags: int, seq: int, body: bytes) -> bytes:
+    return _NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type, flags, seq, 0) + body
+
+
+def pack_route(msg_type: int, seq: int, destination: bytes, prefix_len: int, table: int,
+               gateway: Optional[bytes] = None, oif: Optional[int] = None,
+               flags: int = NLM_F_REQUEST | NLM_F_ACK) -> bytes:
+    """
+    RTM_NEWROUTE/RTM_DELROUTE для IPv4 префикса.
+    destination и gateway - адреса в сетевом порядке байт (socket.inet_aton).
+    """
+    if msg_type == RTM_DELROUTE:
+        # Удаляется маршрут к префиксу независимо от протокола и scope
+        protocol, scope = 0, RT_SCOPE_NOWHERE
+    else:
+        protocol = RTPROT_STATIC
+        scope = RT_SCOPE_UNIVERSE if gateway is not None else RT_SCOPE_LINK
+
+    # Сообщение собирается из готовых struct без промежуточных атрибутов
+    length = _ROUTE_FIXED.size + (_ATTR_ADDR.size if gateway is not None else 0) + \
+        (_ATTR_U32.size if oif is not None else 0)
+    message = _ROUTE_FIXED.pack(
+        length, msg_type, flags, seq, 0,
+        socket.AF_INET, prefix_len, 0, 0, table if table < 256 else RT_TABLE_UNSPEC,
+        protocol, scope, RTN_UNICAST, 0,
+        _ATTR_U32.size, RTA_TABLE, table,
+        _ATTR_ADDR.size, RTA_DST, destination
+    )
+    if gateway is not None:
+        message += _ATTR_ADDR.pack(_ATTR_ADDR.size, RTA_GATEWAY, gateway)
+    if oif is not None:
+        message += _ATTR_U32.pack(_ATTR_U32.size, RTA_OIF, oif)
+    return message
+
+
+def pack_noop(seq: int) -> bytes:
+    """NLMSG_NOOP с запросом подтверждения - метка конца пакета"""
+    return pack_message(NLMSG_NOOP, NLM_F_REQUEST | NLM_F_ACK, seq, b'')
+
+
+def pack_route_dump(seq: int) -> bytes:
+    """Запрос дампа всех IPv4 маршрутов"""
+    body = _RTMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)
+    return pack_message(RTM_GETROUTE, NLM_F_REQUEST | NLM_F_DUMP, seq, body)
+
+
+def pack_rule(seq: int, table: int, priority: int) -> bytes:
+    """RTM_NEWRULE: 'from all lookup <table>' с заданным приоритетом"""
+    body = _FIB_RULE_HDR.pack(socket.AF_INET, 0, 0, 0,
+                              table if table < 256 else RT_TABLE_UNSPEC,
+                              0, 0, FR_ACT_TO_TBL, 0)
+    body += pack_attr(FRA_TABLE, _U32.pack(table))
+    body += pack_attr(FRA_PRIORITY, _U32.pack(priority))
+    return pack_message(RTM_NEWRULE, NLM_F_REQUEST | NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL,
+                        seq, body)
+
+
+def iter_messages(data: bytes) -> Iterator[Tuple[int, int, int, bytes]]:
+    """Разбивает буфер на сообщения: (тип, флаги, seq, тело)"""
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        yield msg_type, flags, seq, data[offset + _NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+def parse_error(body: bytes) -> int:
+    """Код NLMSG_ERROR: 0 - подтверждение, иначе отрицательный errno"""
+    return _ERRNO.unpack_from(body)[0]
+
+
+def parse_attrs(data: bytes, offset: int = 0) -> Dict[int, bytes]:
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def parse_route(body: bytes) -> Optional[NetlinkRoute]:
+    """Разбирает тело RTM_NEWROUTE из дампа (None для не-IPv4)"""
+    family, dst_len, _, _, table, _, _, route_type, _ = _RTMSG.unpack_from(body)
+    if family != socket.AF_INET:
+        return None
+
+    attrs = parse_attrs(body, _RTMSG.size)
+    if RTA_TABLE in attrs:
+        table = _U32.unpack(attrs[RTA_TABLE])[0]
+    destination = socket.inet_ntoa(attrs[RTA_DST]) if RTA_DST in attrs else '0.0.0.0'
+    return NetlinkRoute(
+        destination=f"{destination}/{dst_len}",
+        gateway=socket.inet_ntoa(attrs[RTA_GATEWAY]) if RTA_GATEWAY in attrs else None,
+        oif=_U32.unpack(attrs[RTA_OIF])[0] if RTA_OIF in attrs else None,
+        table=table,
+        route_type=route_type
+    )
+
+
+def route_type_name(route_type: int) -> str:
+    names: List[str] = ['unspec', 'unicast', 'local', 'broadcast', 'anycast', 'multicast',
+                        'blackhole', 'unreachable', 'prohibit', 'throw', 'nat']
+    return names[route_type] if route_type < len(names) else str(route_type)
@@ -0,0 +1,76 @@
+"""
+Single-flight для DNS Routing Manager.
+
+Одновременные вызовы с одним ключом (имя, тип запроса) выполняют одну
+операцию и получают ее результат: первый вызов выполняет операцию,
+остальные ждут его. Ключ освобождается сразу после завершения, поэтому
+повторный вызов позже выполнит операцию заново (это работа кэша).
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Дедупликация одновременных операций для потоков и asyncio.
+
+    Использование:
+        flight = SingleFlight()
+        flight.do(('example.com', 1), lambda: lookup('example.com'))             # из потоков
+        await flight.do_async(('example.com', 1), lambda: query('example.com'))  # из цикла
+        flight.shared   # сколько вызовов получили чужой результат
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Выполняет fn или ждет уже идущий вызов с тем же ключом"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Асинхронный вариант: все вызовы - из одного event loop"""
+        call = self._async_calls.get(key)
+        if call is not None:
+            self.shared += 1
+            # shield: отмена ожидающего не отменяет общий запрос
+            return await asyncio.shield(call)
+
+        call = self._async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            call.set_exception(e)
+            # Исключение забирают ожидающие; без них не должно быть предупреждения
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._async_calls[key]
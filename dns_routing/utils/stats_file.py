@@ -0,0 +1,57 @@
+"""
+Файл сводной статистики (stats.json) для DNS Routing Manager.
+
+Маленький JSON рядом с кэшем: писатели (DNS кэш, менеджер маршрутов)
+обновляют в нем свою секцию при каждом сохранении, а status читает
+только его, не загружая dns_cache.json и routes.json целиком.
+"""
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def read_stats(path: Path) -> Dict:
+    """Содержимое файла статистики ({} если его нет или он поврежден)"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def update_stats(path: Path, section: str, data: Dict) -> None:
+    """
+    Заменяет одну секцию файла статистики с атомарной заменой файла.
+    Статистика вспомогательная - ошибки записи не прерывают работу.
+    """
+    path = Path(path)
+    stats = read_stats(path)
+    stats[section] = {**data, 'updated': time.time()}
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(stats, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def count_valid(section: Dict, now: Optional[float] = None) -> int:
+    """
+    Число действующих записей по гистограмме истечений секции dns_cache:
+    {'expiry_minutes': {минута: число записей}}. Записи, истекающие
+    в текущую минуту, считаются уже истекшими.
+    """
+    minute = int((time.time() if now is None else now) // 60)
+    return sum(count for bucket, count in section.get('expiry_minutes', {}).items()
+               if int(bucket) > minute)
@@ -0,0 +1,235 @@
+"""
+Локальный stub DNS сервер для DNS Routing Manager.
+Отвечает из заданной в памяти зоны по UDP и TCP на 127.0.0.1.
+Нужен для проверки DNS клиента и бенчмарков без обращения к сети.
+"""
+import asyncio
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .dns_wire import (
+    DNSRecord, DNSWireError, QTYPE_A, QTYPE_CNAME, QTYPE_SOA,
+    RCODE_NXDOMAIN, RCODE_NOERROR, RCODE_SERVFAIL,
+    build_response, normalize_name, parse_message,
+)
+
+# Попыток занять пару UDP/TCP на случайном порту
+BIND_ATTEMPTS = 20
+# Сколько ждать запуска сервера в фоновом потоке, секунды
+START_TIMEOUT = 10.0
+
+# Обработчик: (имя, тип) -> (rcode, ответы) или None для NXDOMAIN
+Handler = Callable[[str, int], Optional[Tuple[int, List[DNSRecord]]]]
+
+
+class StubDNSServer:
+    """
+    DNS сервер с зоной в памяти.
+
+    Использование:
+        server = StubDNSServer()
+        server.add_a("example.com", ["93.184.216.34"], ttl=300)
+        port = server.start_in_thread()
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 handler: Optional[Handler] = None, soa_minimum: int = 300,
+                 delay: float = 0.0):
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.soa_minimum = soa_minimum
+        self.delay = delay
+
+        self.records: Dict[str, List[DNSRecord]] = {}
+        self.truncate_udp: Set[str] = set()   # имена, на которые UDP отвечает с TC
+        self.drop: Set[str] = set()           # имена, на которые сервер молчит
+        self.servfail: Set[str] = set()       # имена, на которые сервер отвечает SERVFAIL
+
+        self.queries = 0
+        self.tcp_queries = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._udp_transport = None
+        self._tcp_server = None
+
+    @property
+    def address(self) -> str:
+        """Адрес в формате host:port для dns.servers"""
+        return f"{self.host}:{self.port}"
+
+    def add_a(self, name: str, ips: List[str], ttl: int = 300) -> None:
+        """Добавляет A записи"""
+        bucket = self.records.setdefault(normalize_name(name), [])
+        bucket.extend(DNSRecord(name=name, rtype=QTYPE_A, ttl=ttl, data=ip) for ip in ips)
+
+    def add_cname(self, name: str, target: str, ttl: int = 300) -> None:
+        """Добавляет CNAME запись"""
+        self.records.setdefault(normalize_name(name), []).append(
+            DNSRecord(name=name, rtype=QTYPE_CNAME, ttl=ttl, data=target)
+        )
+
+    def _lookup(self, qname: str, qtype: int) -> Tuple[int, List[DNSRecord]]:
+        """Ищет ответ в зоне, раскрывая CNAME цепочки"""
+        if self.handler is not None:
+            answer = self.handler(qname, qtype)
+            return answer if answer is not None else (RCODE_NXDOMAIN, [])
+
+        answers: List[DNSRecord] = []
+        name = qname
+        seen = set()
+        while name not in seen:
+            seen.add(name)
+            records = self.records.get(name)
+            if records is None:
+                return (RCODE_NXDOMAIN if not answers else RCODE_NOERROR), answers
+            cname = next((r for r in records if r.rtype == QTYPE_CNAME), None)
+            if cname is None:
+                answers.extend(r for r in records if r.rtype == qtype)
+                break
+            answers.append(cname)
+            name = normalize_name(cname.data)
+
+        return RCODE_NOERROR, answers
+
+    def _soa(self, qname: str) -> DNSRecord:
+        """SOA запись для негативных ответов"""
+        zone = '.'.join(qname.split('.')[-2:])
+        return DNSRecord(
+            name=zone, rtype=QTYPE_SOA, ttl=self.soa_minimum,
+            data=(f"ns.{zone}", f"hostmaster.{zone}", 1, 3600, 600, 86400, self.soa_minimum)
+        )
+
+    def _respond(self, data: bytes, via_tcp: bool) -> Optional[bytes]:
+        """Формирует ответ на запрос или None, если отвечать не нужно"""
+        try:
+            query = parse_message(data)
+        except DNSWireError:
+            return None
+        if not query.questions:
+            return None
+
+        self.queries += 1
+        if via_tcp:
+            self.tcp_queries += 1
+
+        question = query.questions[0]
+        qname = normalize_name(question[0])
+
+        if qname in self.drop:
+            return None
+        if qname in self.servfail:
+            return build_response(query.id, question, [], rcode=RCODE_SERVFAIL)
+        if not via_tcp and qname in self.truncate_udp:
+            return build_response(query.id, question, [], truncated=True)
+
+        rcode, answers = self._lookup(qname, question[1])
+        has_data = any(record.rtype == question[1] for record in answers)
+        authority = [self._soa(qname)] if rcode == RCODE_NXDOMAIN or not has_data else []
+        return build_response(query.id, question, answers, authority, rcode=rcode)
+
+    async def start(self) -> int:
+        """Запускает UDP и TCP обработчики в текущем цикле, возвращает порт"""
+        loop = asyncio.get_running_loop()
+        server = self
+
+        class _UDP(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                if server.delay:
+                    loop.call_later(server.delay, self._reply, data, addr)
+                else:
+                    self._reply(data, addr)
+
+            def _reply(self, data, addr):
+                response = server._respond(data, via_tcp=False)
+                if response is not None:
+                    self.transport.sendto(response, addr)
+
+        async def handle_tcp(reader, writer):
+            try:
+                while True:
+                    length = struct.unpack("!H", await reader.readexactly(2))[0]
+                    data = await reader.readexactly(length)
+                    if server.delay:
+                        await asyncio.sleep(server.delay)
+                    response = server._respond(data, via_tcp=True)
+                    if response is None:
+                        continue
+                    writer.write(struct.pack("!H", len(response)) + response)
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        # UDP порт выбирает система, TCP на том же номере может быть занят
+        # другим процессом - тогда пробуем новый порт
+        requested = self.port
+        for attempt in range(BIND_ATTEMPTS):
+            self._udp_transport, _ = await loop.create_datagram_endpoint(
+                _UDP, local_addr=(self.host, requested)
+            )
+            self.port = self._udp_transport.get_extra_info('sockname')[1]
+            try:
+                self._tcp_server = await asyncio.start_server(handle_tcp, self.host, self.port)
+                break
+            except OSError:
+                self._udp_transport.close()
+                self._udp_transport = None
+                if requested or attempt == BIND_ATTEMPTS - 1:
+                    raise
+
+        self._loop = loop
+        return self.port
+
+    def close(self) -> None:
+        """Останавливает обработчики (вызывать из цикла сервера)"""
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+
+    def start_in_thread(self) -> int:
+        """Запускает сервер в фоновом потоке со своим event loop, возвращает порт"""
+        started = threading.Event()
+        errors: List[BaseException] = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except BaseException as e:
+                errors.append(e)
+                loop.close()
+                return
+            finally:
+                started.set()
+            loop.run_forever()
+            self.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="stub-dns", daemon=True)
+        self._thread.start()
+        if not started.wait(timeout=START_TIMEOUT):
+            raise RuntimeError(f"Stub DNS server did not start within {START_TIMEOUT}s")
+        if errors:
+            self._thread.join()
+            self._thread = None
+            raise errors[0]
+        return self.port
+
+    def stop(self) -> None:
+        """Останавливает сервер, запущенный через start_in_thread"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
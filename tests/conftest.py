@@ -0,0 +1,47 @@
+"""
+Общие фикстуры тестов: конфигурация во временном каталоге.
+"""
+import pytest
+import yaml
+
+from dns_routing.config import ConfigLoader, get_config
+
+
+LOCAL_INTERFACE = "en0"
+LOCAL_GATEWAY = "192.168.1.1"
+VPN_INTERFACE = "utun9"
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """
+    Конфигурация с бэкендом simulator и всеми путями внутри tmp_path.
+    Singleton ConfigLoader перечитывает ее в каждом тесте.
+    """
+    config_dir = tmp_path / "config"
+    config_dir.mkdir()
+    settings = {
+        'network': {
+            'local': {'interface': LOCAL_INTERFACE, 'gateway': LOCAL_GATEWAY, 'is_tunnel': False},
+            'vpn': {'interface': VPN_INTERFACE, 'gateway': None, 'is_tunnel': True},
+        },
+        'files': {
+            'domains': {'ru': "config/domains_ru.txt", 'com': "config/domains_com.txt"},
+            'ips': {'local': "config/ips_local.txt", 'vpn': "config/ips_vpn.txt"},
+        },
+        'paths': {
+            'cache_dir': "data/cache",
+            'routes_cache': "data/routes.json",
+            'log_file': "logs/dns_routing.log",
+        },
+        'dns': {'timeout': 1, 'retries': 2},
+        'cache': {'ttl_hours': 24},
+        'routing': {'backend': 'simulator', 'reconcile_max_delete_ratio': 0.5},
+    }
+    settings_file = config_dir / "settings.yaml"
+    settings_file.write_text(yaml.safe_dump(settings))
+
+    monkeypatch.setenv('DNS_ROUTING_CONFIG', str(settings_file))
+    ConfigLoader.reset()
+    yield get_config()
+    ConfigLoader.reset()
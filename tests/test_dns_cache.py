@@ -0,0 +1,181 @@
+"""
+Тесты DNSCache: вытеснение, журнал и атомарный снимок.
+"""
+import json
+import os
+import time
+
+import pytest
+
+from dns_routing.core.dns_cache import DNSCache
+
+
+def _entry(ips, ttl=300.0, now=None):
+    now = time.time() if now is None else now
+    return {'ips': ips, 'timestamp': now, 'ttl': ttl, 'expires': now + ttl}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "dns_cache.json"
+
+
+def _cache(path, **kwargs):
+    # Пороги сброса недостижимы: на диск пишут только явные flush() и compact()
+    kwargs.setdefault('flush_every', 10 ** 6)
+    kwargs.setdefault('flush_interval', 10 ** 6)
+    return DNSCache(path, **kwargs)
+
+
+# --- Вытеснение ---
+
+def test_lru_eviction_keeps_recently_used(cache_path):
+    cache = _cache(cache_path, max_entries=3)
+    for name in ("a", "b", "c"):
+        cache.set(name, _entry(["192.0.2.1"]))
+
+    assert cache.lookup("a") is not None
+    cache.set("d", _entry(["192.0.2.4"]))
+
+    assert set(cache.keys()) == {"a", "c", "d"}
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_expired_entries_evicted_before_lru(cache_path):
+    cache = _cache(cache_path, max_entries=3)
+    now = time.time()
+    cache.set("fresh", _entry(["192.0.2.1"], now=now))
+    cache.set("stale", _entry(["192.0.2.2"], ttl=-10, now=now))
+    cache.set("newer", _entry(["192.0.2.3"], now=now))
+    cache.set("newest", _entry(["192.0.2.4"], now=now))
+
+    assert "stale" not in cache
+    assert "fresh" in cache
+    stats = cache.get_stats()
+    assert stats['expired_evictions'] == 1
+    assert stats['evictions'] == 0
+
+
+def test_lookup_counts_hits_misses_and_stale(cache_path):
+    cache = _cache(cache_path)
+    cache.set("live", _entry(["192.0.2.1"]))
+    cache.set("old", _entry(["192.0.2.2"], ttl=-1))
+
+    assert cache.lookup("live")['ips'] == ["192.0.2.1"]
+    assert cache.lookup("old") is None
+    assert cache.lookup("absent") is None
+    # get не учитывается и отдает запись независимо от срока
+    assert cache.get("old")['ips'] == ["192.0.2.2"]
+
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['stale'], stats['misses']) == (1, 1, 1)
+
+
+def test_updated_entry_expiry_is_not_taken_from_old_heap_item(cache_path):
+    cache = _cache(cache_path, max_entries=2)
+    now = time.time()
+    cache.set("a", _entry(["192.0.2.1"], ttl=-10, now=now))
+    # Обновление делает запись действующей - старый элемент кучи устарел
+    cache.set("a", _entry(["192.0.2.1"], now=now))
+    cache.set("b", _entry(["192.0.2.2"], now=now))
+    cache.set("c", _entry(["192.0.2.3"], now=now))
+
+    assert set(cache.keys()) == {"b", "c"}
+    assert cache.get_stats()['expired_evictions'] == 0
+
+
+# --- Журнал ---
+
+def test_journal_replay_restores_changes(cache_path):
+    cache = _cache(cache_path)
+    for index in range(5):
+        cache.set(f"name{index}", _entry([f"192.0.2.{index}"]))
+    cache.flush()
+    cache.set("name0", _entry(["198.51.100.1"]))
+    cache.delete("name1")
+    cache.flush()
+
+    assert cache.journal_path.exists()
+
+    restored = _cache(cache_path)
+    assert restored.load() == 4
+    assert restored.get("name0")['ips'] == ["198.51.100.1"]
+    assert "name1" not in restored
+
+
+def test_torn_journal_line_is_skipped(cache_path):
+    cache = _cache(cache_path)
+    cache.set("kept", _entry(["192.0.2.1"]))
+    cache.set("other", _entry(["192.0.2.2"]))
+    cache.flush()
+    with open(cache.journal_path, 'a') as f:
+        f.write('["torn", {"ips": ["192.0.2')
+
+    restored = _cache(cache_path)
+    assert restored.load() == 2
+    assert "torn" not in restored
+
+
+def test_load_applies_smaller_limit(cache_path):
+    cache = _cache(cache_path)
+    for index in range(10):
+        cache.set(f"name{index}", _entry(["192.0.2.1"]))
+    cache.compact()
+
+    restored = _cache(cache_path, max_entries=4)
+    assert restored.load() == 4
+    # Снимок хранит порядок LRU - остаются последние записанные
+    assert set(restored.keys()) == {f"name{index}" for index in range(6, 10)}
+
+
+# --- Снимок ---
+
+def test_long_journal_is_folded_into_snapshot(cache_path):
+    cache = _cache(cache_path, flush_every=1)
+    cache.set("a", _entry(["192.0.2.1"]))
+    assert not cache_path.exists()
+    assert len(cache.journal_path.read_text().splitlines()) == 1
+
+    # Журнал стал бы длиннее кэша - изменения сворачиваются в снимок
+    cache.set("a", _entry(["192.0.2.2"]))
+    assert not cache.journal_path.exists()
+    with open(cache_path) as f:
+        assert json.load(f)["a"]["ips"] == ["192.0.2.2"]
+
+    cache.set("a", _entry(["192.0.2.3"]))
+    restored = _cache(cache_path)
+    restored.load()
+    assert restored.get("a")["ips"] == ["192.0.2.3"]
+
+
+def test_snapshot_failure_keeps_previous_file(cache_path, monkeypatch):
+    cache = _cache(cache_path)
+    cache.set("a", _entry(["192.0.2.1"]))
+    cache.compact()
+    previous = cache_path.read_bytes()
+
+    cache.set("b", _entry(["192.0.2.2"]))
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", broken_replace)
+    with pytest.raises(OSError):
+        cache.compact()
+
+    assert cache_path.read_bytes() == previous
+    assert [path.name for path in cache_path.parent.iterdir() if path.suffix == '.tmp'] == []
+
+
+def test_clear_removes_files(cache_path):
+    cache = _cache(cache_path)
+    cache.set("a", _entry(["192.0.2.1"]))
+    cache.compact()
+    cache.set("b", _entry(["192.0.2.2"]))
+    cache.flush()
+
+    cache.clear()
+
+    assert len(cache) == 0
+    assert not cache_path.exists()
+    assert not cache.journal_path.exists()
@@ -0,0 +1,235 @@
+"""
+Тесты AsyncDNSClient против локального StubDNSServer: UDP, переход на TCP
+при усечении, хеджирование медленного сервера и переход после ошибок.
+"""
+import asyncio
+import socket
+
+import pytest
+
+from dns_routing.core.dns_client import AsyncDNSClient, DNSTimeoutError, ServerLatency, parse_server
+from dns_routing.utils.dns_wire import RCODE_NOERROR, RCODE_NXDOMAIN, RCODE_SERVFAIL
+from dns_routing.utils.stub_dns import StubDNSServer
+
+
+@pytest.fixture
+def stub_servers():
+    """Фабрика stub серверов с зоной example.test; все останавливаются после теста"""
+    servers = []
+
+    def start(delay: float = 0.0) -> StubDNSServer:
+        server = StubDNSServer(delay=delay)
+        server.add_a("www.example.test", ["192.0.2.1", "192.0.2.2"], ttl=120)
+        server.add_cname("alias.example.test", "www.example.test")
+        server.start_in_thread()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _query(servers, name, **kwargs):
+    """Один запрос новым клиентом; возвращает (ответ, клиент)"""
+    async def run():
+        async with AsyncDNSClient([server.address for server in servers], **kwargs) as client:
+            return await client.query(name), client
+    return asyncio.run(run())
+
+
+def test_parse_server():
+    assert parse_server("8.8.8.8") == ("8.8.8.8", 53)
+    assert parse_server("127.0.0.1:5353") == ("127.0.0.1", 5353)
+
+
+def test_stub_retries_port_taken_over_tcp(monkeypatch):
+    start_server = asyncio.start_server
+    calls = []
+
+    async def busy_once(*args, **kwargs):
+        calls.append(args[2])
+        if len(calls) == 1:
+            raise OSError("Address already in use")
+        return await start_server(*args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "start_server", busy_once)
+    server = StubDNSServer()
+    port = server.start_in_thread()
+    server.stop()
+
+    assert len(calls) == 2
+    assert port == calls[1]
+
+
+def test_stub_start_error_reaches_caller():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        server = StubDNSServer(port=busy.getsockname()[1])
+
+        with pytest.raises(OSError):
+            server.start_in_thread()
+
+
+def test_query_resolves_cname_chain(stub_servers):
+    server = stub_servers()
+
+    message, _ = _query([server], "Alias.Example.Test.")
+
+    assert message.rcode == RCODE_NOERROR
+    addresses, chain, ttl = message.resolve_chain("alias.example.test")
+    assert addresses == ["192.0.2.1", "192.0.2.2"]
+    assert chain == ["www.example.test"]
+    assert ttl == 120
+    assert server.tcp_queries == 0
+
+
+def test_nxdomain_carries_soa(stub_servers):
+    server = stub_servers()
+
+    message, _ = _query([server], "missing.example.test")
+
+    assert message.rcode == RCODE_NXDOMAIN
+    assert message.soa_minimum() == server.soa_minimum
+
+
+def test_truncated_udp_answer_retried_over_tcp(stub_servers):
+    server = stub_servers()
+    server.add_a("big.example.test", ["192.0.2.99"])
+    server.truncate_udp.add("big.example.test")
+
+    message, _ = _query([server], "big.example.test")
+
+    assert not message.truncated
+    assert [record.data for record in message.answers] == ["192.0.2.99"]
+    assert server.tcp_queries == 1
+
+
+def test_concurrent_queries_share_sockets(stub_servers):
+    server = stub_servers()
+    for index in range(50):
+        server.add_a(f"h{index}.example.test", [f"198.51.100.{index + 1}"])
+
+    async def run():
+        async with AsyncDNSClient([server.address], sockets_per_server=2) as client:
+            messages = await asyncio.gather(*(client.query(f"h{index}.example.test")
+                                              for index in range(50)))
+            return messages, sum(len(channels) for channels in client._channels.values())
+
+    messages, sockets = asyncio.run(run())
+
+    assert [message.answers[0].data for message in messages] == \
+        [f"198.51.100.{index + 1}" for index in range(50)]
+    assert sockets == 2
+
+
+def test_slow_server_is_hedged(stub_servers):
+    slow, fast = stub_servers(delay=0.5), stub_servers()
+
+    message, client = _query([slow, fast], "www.example.test",
+                             timeout=2.0, hedge_delay=0.05, hedge_min_delay=0.01)
+
+    assert message.rcode == RCODE_NOERROR
+    assert client.hedged == 1
+    assert client.hedge_wins == 1
+    assert client.failovers == 0
+    # Проигравший запрос отменен: это не неудача, а оценка задержки снизу
+    assert client.latency.failures.get(parse_server(slow.address), 0) == 0
+    assert len(client.latency._samples[parse_server(slow.address)]) == 1
+
+
+def test_fast_server_is_not_hedged(stub_servers):
+    first, second = stub_servers(), stub_servers()
+
+    _, client = _query([first, second], "www.example.test", timeout=2.0, hedge_delay=1.0)
+
+    assert client.hedged == 0
+    assert second.queries == 0
+
+
+def test_servfail_fails_over_to_next_server(stub_servers):
+    broken, healthy = stub_servers(), stub_servers()
+    broken.servfail.add("www.example.test")
+
+    message, client = _query([broken, healthy], "www.example.test", timeout=2.0, hedge_delay=1.0)
+
+    assert message.rcode == RCODE_NOERROR
+    assert client.failovers == 1
+    assert client.hedged == 0
+
+
+def test_servfail_returned_when_no_server_answers_better(stub_servers):
+    first, second = stub_servers(), stub_servers()
+    for server in (first, second):
+        server.servfail.add("www.example.test")
+
+    message, _ = _query([first, second], "www.example.test", timeout=2.0, hedge_delay=1.0)
+
+    assert message.rcode == RCODE_SERVFAIL
+
+
+def test_timeout_without_hedging_moves_to_next_server(stub_servers):
+    silent, healthy = stub_servers(), stub_servers()
+    silent.drop.add("www.example.test")
+
+    message, client = _query([silent, healthy], "www.example.test",
+                             timeout=0.2, retries=2, hedge=False)
+
+    assert message.rcode == RCODE_NOERROR
+    assert silent.queries == 1 and healthy.queries == 1
+    assert client.hedged == 0
+
+
+def test_all_servers_silent_raises_timeout(stub_servers):
+    first, second = stub_servers(), stub_servers()
+    for server in (first, second):
+        server.drop.add("www.example.test")
+
+    with pytest.raises(DNSTimeoutError):
+        _query([first, second], "www.example.test", timeout=0.2, retries=2,
+               hedge_delay=0.05, hedge_min_delay=0.01)
+
+
+def test_failing_server_is_asked_last(stub_servers):
+    # Задержка здорового сервера: таймаут молчащего срабатывает раньше ответа
+    silent, healthy = stub_servers(), stub_servers(delay=0.05)
+    silent.drop.add("www.example.test")
+
+    async def run():
+        async with AsyncDNSClient([silent.address, healthy.address], timeout=0.2,
+                                  hedge_delay=1.0) as client:
+            for _ in range(3):
+                await client.query("www.example.test")
+            return client
+
+    client = asyncio.run(run())
+
+    # После двух таймаутов подряд молчащий сервер уходит в конец очереди
+    assert silent.queries == 2
+    assert healthy.queries == 3
+    assert client.latency.is_failing(parse_server(silent.address))
+
+
+def test_lost_hedge_races_raise_hedge_delay_without_demotion(stub_servers):
+    slow, fast = stub_servers(delay=1.0), stub_servers(delay=0.1)
+    latency = ServerLatency()
+    latency.MIN_SAMPLES = 3
+
+    async def run():
+        async with AsyncDNSClient([slow.address, fast.address], timeout=2.0, retries=2, hedge_delay=0.05,
+                                  hedge_min_delay=0.01, latency=latency) as client:
+            for _ in range(3):
+                await client.query("www.example.test")
+                # Отмена проигравшего запроса завершается после ответа
+                await asyncio.sleep(0.01)
+            return client
+
+    client = asyncio.run(run())
+
+    # Медленный сервер не понижен и по-прежнему спрашивается первым
+    assert client.hedged == 3
+    assert client._server_order()[0] == parse_server(slow.address)
+    assert len(latency._samples[parse_server(slow.address)]) == 3
+    # Порог дубля вырос до задержки, при которой сервер проигрывал (~0.15 с)
+    assert client._hedge_after(parse_server(slow.address)) >= 0.1
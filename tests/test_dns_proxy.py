@@ -0,0 +1,236 @@
+"""
+Тесты DNSProxy против локального StubDNSServer с бэкендом simulator:
+маршрут до ответа, кэш ответов, SERVFAIL и таймаут ожидания маршрута.
+"""
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from dns_routing.core.dns_client import AsyncDNSClient
+from dns_routing.core.dns_proxy import DNSProxy
+from dns_routing.core.route_backend import SimulatorRouteBackend
+from dns_routing.core.route_manager import RouteManager
+from dns_routing.models import RouteType
+from dns_routing.utils.dns_wire import (
+    DNSRecord, FLAG_QR, OPCODE_MASK, QCLASS_IN, QTYPE_A, RCODE_NOERROR, RCODE_SERVFAIL,
+    build_query, build_response, parse_message,
+)
+from dns_routing.utils.stub_dns import StubDNSServer
+
+from .conftest import VPN_INTERFACE
+
+
+@pytest.fixture
+def stub():
+    server = StubDNSServer()
+    server.add_a("www.vpn.test", ["203.0.113.10", "203.0.113.11"], ttl=300)
+    server.add_a("plain.test", ["198.51.100.1"], ttl=300)
+    server.start_in_thread()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def proxy_config(config):
+    config.domains_com_file.write_text("*.vpn.test\n")
+    config.domains_ru_file.write_text("")
+    config.proxy_timeout = 0.3
+    config.proxy_route_wait = 2.0
+    config.dns_retries = 1
+    return config
+
+
+@pytest.fixture
+def backend():
+    return SimulatorRouteBackend(latency=0.05)
+
+
+@pytest.fixture
+def start_proxy(proxy_config, backend):
+    """Фабрика прокси на случайном порту; останавливаются после теста"""
+    proxies = []
+
+    def start(upstream) -> DNSProxy:
+        proxy = DNSProxy(route_manager=RouteManager(backend=backend), upstream=upstream,
+                         listen="127.0.0.1", port=0, metrics_port=0)
+        proxy.start_in_thread()
+        proxies.append(proxy)
+        return proxy
+
+    yield start
+    for proxy in proxies:
+        proxy.stop()
+
+
+def _ask(proxy: DNSProxy, name: str):
+    async def run():
+        async with AsyncDNSClient([f"127.0.0.1:{proxy.port}"], timeout=5.0, hedge=False) as client:
+            return await client.query(name)
+    return asyncio.run(run())
+
+
+def test_route_installed_before_answer_is_released(start_proxy, stub, backend):
+    proxy = start_proxy([stub.address])
+
+    message = _ask(proxy, "www.vpn.test")
+
+    assert [record.data for record in message.answers] == ["203.0.113.10", "203.0.113.11"]
+    # Ответ отдан только после установки: маршруты уже в таблице
+    table = backend.dump()
+    assert table.has_route("203.0.113.10", VPN_INTERFACE)
+    assert table.has_route("203.0.113.11", VPN_INTERFACE)
+    assert proxy.routes_installed == 2
+    assert proxy.known["203.0.113.10"] == RouteType.VPN
+
+
+def test_names_outside_lists_are_forwarded_without_routes(start_proxy, stub, backend):
+    proxy = start_proxy([stub.address])
+
+    message = _ask(proxy, "plain.test")
+
+    assert message.answers[0].data == "198.51.100.1"
+    assert len(backend.dump()) == 0
+    assert proxy.routes_installed == 0
+
+
+def test_cache_hit_skips_upstream(start_proxy, stub):
+    proxy = start_proxy([stub.address])
+
+    first = _ask(proxy, "www.vpn.test")
+    second = _ask(proxy, "WWW.vpn.test")
+
+    assert stub.queries == 1
+    assert [record.data for record in second.answers] == [record.data for record in first.answers]
+
+
+def _answer(name: str, ttl: int = 300) -> bytes:
+    """Ответ upstream с одной записью A"""
+    record = DNSRecord(name=name, rtype=QTYPE_A, ttl=ttl, data="192.0.2.1")
+    return build_response(1, (name, QTYPE_A, QCLASS_IN), [record])
+
+
+def _key(name: str):
+    return (name, QTYPE_A, QCLASS_IN, False)
+
+
+@pytest.fixture
+def offline_proxy(proxy_config):
+    return DNSProxy(route_manager=RouteManager(backend=SimulatorRouteBackend()),
+                    upstream=["127.0.0.1:53"], port=0, metrics_port=0)
+
+
+def test_cached_answer_has_client_id_and_decremented_ttls(offline_proxy):
+    proxy = offline_proxy
+    now = time.time()
+    proxy._cache_store(_key("plain.test"), _answer("plain.test"), now)
+
+    query = build_query(0x2222, "Plain.Test", edns=False)
+    message = parse_message(proxy._cache_answer(_key("plain.test"), query, len(query), now + 30))
+
+    assert message.id == 0x2222
+    assert message.questions[0][0] == "Plain.Test"
+    assert [record.ttl for record in message.answers] == [270]
+    # Истекший ответ удаляется из кэша
+    assert proxy._cache_answer(_key("plain.test"), query, len(query), now + 301) is None
+    assert _key("plain.test") not in proxy.cache
+
+
+def test_cache_evicts_least_recently_used(proxy_config, offline_proxy):
+    proxy_config.proxy_cache_size = 2
+    proxy = offline_proxy
+    now = time.time()
+
+    proxy._cache_store(_key("a.test"), _answer("a.test"), now)
+    proxy._cache_store(_key("b.test"), _answer("b.test"), now)
+    # Попадание делает a.test последним использованным - вытесняется b.test
+    query = build_query(1, "a.test", edns=False)
+    assert proxy._cache_answer(_key("a.test"), query, len(query), now) is not None
+    proxy._cache_store(_key("c.test"), _answer("c.test"), now)
+
+    assert list(proxy.cache) == [_key("a.test"), _key("c.test")]
+
+
+def test_servfail_when_upstream_is_down(start_proxy):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        # Сокет занимает порт, но никогда не отвечает
+        silent.bind(("127.0.0.1", 0))
+        proxy = start_proxy([f"127.0.0.1:{silent.getsockname()[1]}"])
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+            client.settimeout(5)
+            query = bytearray(build_query(0x4242, "www.vpn.test", edns=False))
+            # Opcode клиента сохраняется в ответе
+            struct.pack_into("!H", query, 2, struct.unpack_from("!H", query, 2)[0] | (2 << 11))
+            client.sendto(bytes(query), ("127.0.0.1", proxy.port))
+            data = client.recv(512)
+
+    message = parse_message(data)
+    assert message.id == 0x4242
+    assert message.rcode == RCODE_SERVFAIL
+    assert message.flags & FLAG_QR
+    assert message.flags & OPCODE_MASK == 2 << 11
+    assert message.questions[0][0] == "www.vpn.test"
+    assert proxy.cache == {}
+
+
+def test_answer_released_after_route_wait(proxy_config, start_proxy, stub, backend):
+    proxy_config.proxy_route_wait = 0.05
+    backend.latency = 0.5
+    proxy = start_proxy([stub.address])
+
+    began = time.monotonic()
+    message = _ask(proxy, "www.vpn.test")
+    elapsed = time.monotonic() - began
+
+    assert message.rcode == RCODE_NOERROR
+    assert elapsed < 0.5
+    assert proxy.route_timeouts == 1
+    # Ответ без маршрутов не кэшируется
+    assert proxy.cache == {}
+
+    # Установка продолжается после ответа
+    deadline = time.monotonic() + 5
+    while proxy.routes_installed < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert backend.dump().has_route("203.0.113.10", VPN_INTERFACE)
+
+
+def test_reload_rebuilds_rules_in_executor(proxy_config, offline_proxy):
+    proxy = offline_proxy
+    proxy.route_manager.install_routes(["203.0.113.10"], RouteType.VPN)
+    proxy.load_domains()
+    proxy._cache_store(_key("a.test"), _answer("a.test"), time.time())
+    proxy_config.domains_ru_file.write_text("plain.test\n")
+
+    threads = []
+    original = proxy._build_indexes
+
+    def build():
+        threads.append(threading.current_thread().name)
+        return original()
+
+    proxy._build_indexes = build
+    asyncio.run(proxy.reload_domains())
+
+    assert len(threads) == 1 and threads[0].startswith("proxy-routes")
+    assert proxy.trie.lookup("plain.test")[0] == RouteType.LOCAL
+    assert proxy.known == {"203.0.113.10": RouteType.VPN}
+    assert proxy.cache == {}
+
+
+def test_failed_reload_keeps_previous_rules(offline_proxy, monkeypatch):
+    proxy = offline_proxy
+    proxy.load_domains()
+    trie = proxy.trie
+
+    def broken(config):
+        raise OSError("domains file unreadable")
+
+    monkeypatch.setattr("dns_routing.core.dns_proxy.load_domain_index", broken)
+    asyncio.run(proxy.reload_domains())
+
+    assert proxy.trie is trie
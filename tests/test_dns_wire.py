@@ -0,0 +1,148 @@
+"""
+Тесты кодирования и разбора DNS сообщений.
+"""
+import struct
+
+import pytest
+
+from dns_routing.utils.dns_wire import (
+    DNSRecord, DNSWireError, FLAG_QR, FLAG_RD, FLAG_TC, QCLASS_IN, QTYPE_A, QTYPE_CNAME,
+    QTYPE_OPT, QTYPE_SOA, RCODE_NXDOMAIN, build_query, build_response, decode_name,
+    encode_name, normalize_name, parse_message, skip_name, ttl_offsets,
+)
+
+
+def _chain_response():
+    """Ответ www.example.com -> cdn.example.net -> два адреса"""
+    answers = [
+        DNSRecord(name="www.example.com", rtype=QTYPE_CNAME, ttl=600, data="cdn.example.net"),
+        DNSRecord(name="cdn.example.net", rtype=QTYPE_A, ttl=60, data="192.0.2.1"),
+        DNSRecord(name="cdn.example.net", rtype=QTYPE_A, ttl=30, data="192.0.2.2"),
+    ]
+    return build_response(0x1234, ("www.example.com", QTYPE_A, QCLASS_IN), answers)
+
+
+def test_normalize_name():
+    assert normalize_name("WWW.Example.COM.") == "www.example.com"
+    assert normalize_name("example.com") == "example.com"
+
+
+def test_encode_decode_name_roundtrip():
+    encoded = encode_name("www.example.com.")
+    assert encoded == b"\x03www\x07example\x03com\x00"
+    assert decode_name(encoded, 0) == ("www.example.com", len(encoded))
+    assert encode_name(".") == b"\x00"
+
+
+def test_encode_name_rejects_bad_labels():
+    with pytest.raises(DNSWireError):
+        encode_name("a..b")
+    with pytest.raises(DNSWireError):
+        encode_name("x" * 64 + ".com")
+    with pytest.raises(DNSWireError):
+        encode_name(".".join(["abcdefgh"] * 40))
+
+
+def test_decode_name_follows_compression_pointer():
+    # example.com по смещению 0, затем www + указатель на него
+    data = b"\x07example\x03com\x00" + b"\x03www\xc0\x00"
+    name, end = decode_name(data, 13)
+    assert name == "www.example.com"
+    assert end == len(data)
+    assert skip_name(data, 13) == len(data)
+
+
+def test_decode_name_rejects_pointer_loop_and_truncation():
+    with pytest.raises(DNSWireError):
+        decode_name(b"\xc0\x00", 0)
+    with pytest.raises(DNSWireError):
+        decode_name(b"\x05abc", 0)
+    with pytest.raises(DNSWireError):
+        decode_name(b"\x40abc", 0)
+
+
+def test_build_query_with_edns():
+    query = build_query(0xBEEF, "Example.com", edns=True)
+    message = parse_message(query)
+
+    assert message.id == 0xBEEF
+    assert message.flags == FLAG_RD
+    assert message.questions == [("Example.com", QTYPE_A, QCLASS_IN)]
+    assert len(message.additional) == 1
+    assert message.additional[0].rtype == QTYPE_OPT
+
+    plain = parse_message(build_query(1, "example.com", edns=False))
+    assert plain.additional == []
+
+
+def test_response_roundtrip_and_chain():
+    message = parse_message(_chain_response())
+
+    assert message.is_response
+    assert message.flags & FLAG_QR
+    assert not message.truncated
+    addresses, chain, ttl = message.resolve_chain("WWW.example.com.")
+    assert addresses == ["192.0.2.1", "192.0.2.2"]
+    assert chain == ["cdn.example.net"]
+    assert ttl == 30
+    assert message.cname_links("www.example.com") == [("www.example.com", "cdn.example.net", 600)]
+
+
+def test_cname_loop_terminates():
+    answers = [
+        DNSRecord(name="a.example", rtype=QTYPE_CNAME, ttl=60, data="b.example"),
+        DNSRecord(name="b.example", rtype=QTYPE_CNAME, ttl=60, data="a.example"),
+    ]
+    message = parse_message(build_response(1, ("a.example", QTYPE_A, QCLASS_IN), answers))
+
+    addresses, chain, _ = message.resolve_chain("a.example")
+    assert addresses == []
+    assert chain == ["b.example", "a.example"]
+    assert len(message.cname_links("a.example")) == 2
+
+
+def test_negative_response_soa_minimum():
+    soa = DNSRecord(name="example.com", rtype=QTYPE_SOA, ttl=900,
+                    data=("ns.example.com", "hostmaster.example.com", 1, 3600, 600, 86400, 300))
+    message = parse_message(build_response(7, ("nx.example.com", QTYPE_A, QCLASS_IN), [],
+                                           [soa], rcode=RCODE_NXDOMAIN))
+
+    assert message.rcode == RCODE_NXDOMAIN
+    assert message.authority[0].data[:2] == ("ns.example.com", "hostmaster.example.com")
+    assert message.soa_minimum() == 300
+
+
+def test_truncated_response_carries_no_records():
+    data = build_response(9, ("big.example", QTYPE_A, QCLASS_IN),
+                          [DNSRecord(name="big.example", rtype=QTYPE_A, ttl=60, data="192.0.2.9")],
+                          truncated=True)
+    message = parse_message(data)
+
+    assert message.flags & FLAG_TC
+    assert message.truncated
+    assert message.answers == []
+
+
+def test_parse_message_rejects_truncated_data():
+    data = _chain_response()
+    with pytest.raises(DNSWireError):
+        parse_message(data[:8])
+    with pytest.raises(DNSWireError):
+        parse_message(data[:-3])
+
+
+def test_ttl_offsets_point_at_ttl_fields_and_skip_opt():
+    data = _chain_response() + b"\x00" + struct.pack("!HHIH", QTYPE_OPT, 1232, 0x8000, 0)
+    data = data[:10] + struct.pack("!H", 1) + data[12:]
+
+    offsets = ttl_offsets(data)
+
+    assert [ttl for _, ttl in offsets] == [600, 60, 30]
+    for offset, ttl in offsets:
+        assert struct.unpack_from("!I", data, offset)[0] == ttl
+
+    # Уменьшение TTL на месте дает корректное сообщение
+    patched = bytearray(data)
+    for offset, ttl in offsets:
+        struct.pack_into("!I", patched, offset, ttl - 10)
+    assert [record.ttl for record in parse_message(bytes(patched)).answers] == [590, 50, 20]
@@ -0,0 +1,137 @@
+"""
+Тесты свертки адресов в маршруты и дерева префиксов (LPM).
+"""
+import ipaddress
+import random
+from types import SimpleNamespace
+
+from dns_routing.models import RouteType
+from dns_routing.utils.network import (
+    aggregate_for_config, aggregate_targets, build_prefix_tree, filter_covered,
+)
+from dns_routing.utils.radix import RadixTree
+
+
+def _covered(address: str, targets) -> bool:
+    address = ipaddress.IPv4Address(address)
+    return any(address in ipaddress.IPv4Network(target) for target in targets)
+
+
+# --- aggregate_targets ---
+
+def test_exact_merge_does_not_widen_coverage():
+    result = aggregate_targets(["10.0.0.0", "10.0.0.1", "10.0.0.2", "10.0.0.3",
+                                "10.0.0.5", "10.0.0.0/31", "invalid"])
+
+    assert result.targets == ["10.0.0.0/30", "10.0.0.5"]
+    assert result.input_count == 6
+    assert result.promoted == [] and result.dropped == []
+
+
+def test_promotion_replaces_dense_subnets():
+    hosts = [f"203.0.113.{i}" for i in (1, 7, 99)] + ["198.51.100.1", "198.51.100.2"]
+
+    result = aggregate_targets(hosts, promote_prefix=24, promote_min_hosts=3)
+
+    assert result.promoted == ["203.0.113.0/24"]
+    assert result.targets == ["198.51.100.1", "198.51.100.2", "203.0.113.0/24"]
+
+
+def test_budget_merges_dense_groups_then_drops_narrowest():
+    hosts = [f"10.0.0.{i}" for i in (1, 3, 5, 7)] + ["192.0.2.1", "198.51.100.1", "203.0.113.1"]
+
+    result = aggregate_targets(hosts, route_budget=3, budget_min_prefix=24)
+
+    assert len(result.targets) == 3
+    assert "10.0.0.0/29" in result.targets
+    assert len(result.dropped) == 1
+    kept_and_dropped = result.targets + result.dropped
+    assert all(_covered(host, kept_and_dropped) for host in hosts)
+
+
+def test_budget_respects_min_prefix():
+    hosts = ["10.0.0.1", "10.0.128.1", "10.1.0.1"]
+
+    result = aggregate_targets(hosts, route_budget=1, budget_min_prefix=16)
+
+    assert all(ipaddress.IPv4Network(target).prefixlen >= 16
+               for target in result.targets + result.dropped)
+    assert len(result.targets) == 1
+
+
+def test_aggregate_for_config_shares_budget_across_groups():
+    config = SimpleNamespace(aggregate_routes=True, promote_prefix=24, promote_min_hosts=0,
+                             route_budget=3, budget_min_prefix=32)
+    hosts = ["192.0.2.1", "198.51.100.1", "203.0.113.1"]
+
+    assert len(aggregate_for_config(hosts, config).targets) == 3
+    assert aggregate_for_config(hosts, config, routes_planned=2).targets == ["192.0.2.1"]
+
+    exhausted = aggregate_for_config(hosts, config, routes_planned=3)
+    assert exhausted.targets == [] and exhausted.dropped == hosts
+
+
+def test_aggregate_for_config_passes_targets_through_when_disabled():
+    config = SimpleNamespace(aggregate_routes=False, promote_prefix=24, promote_min_hosts=0,
+                             route_budget=0, budget_min_prefix=16)
+
+    assert aggregate_for_config(["10.0.0.1", "10.0.0.0"], config).targets == ["10.0.0.1", "10.0.0.0"]
+
+
+# --- RadixTree ---
+
+def test_radix_longest_prefix_match():
+    tree = RadixTree()
+    tree.insert("10.0.0.0/8", "wide")
+    tree.insert("10.1.0.0/16", "narrow")
+    tree.insert("10.1.2.3/32", "host")
+    tree.insert("0.0.0.0/0", "default")
+
+    assert tree.lookup("10.1.2.3") == (ipaddress.IPv4Network("10.1.2.3/32"), "host")
+    assert tree.lookup("10.1.9.9")[1] == "narrow"
+    assert tree.lookup("10.200.0.1")[1] == "wide"
+    assert tree.lookup("192.0.2.1")[1] == "default"
+    assert len(tree) == 4
+
+
+def test_radix_get_is_exact_and_insert_replaces():
+    tree = RadixTree()
+    tree.insert("10.1.0.0/16", 1)
+    tree.insert("10.1.0.0/16", 2)
+
+    assert len(tree) == 1
+    assert tree.get("10.1.0.0/16") == 2
+    assert tree.get("10.0.0.0/8") is None
+    assert tree.get("10.1.0.0/24", "missing") == "missing"
+    assert tree.lookup("11.0.0.1") is None
+
+
+def test_radix_matches_brute_force():
+    rng = random.Random(13)
+    prefixes = {}
+    tree = RadixTree()
+    for index in range(300):
+        network = ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(4, 32)), strict=False)
+        prefixes[network] = index
+        tree.insert(network, index)
+
+    assert len(tree) == len(prefixes)
+    assert dict(tree.items()) == prefixes
+
+    for _ in range(2000):
+        address = ipaddress.IPv4Address(rng.getrandbits(32))
+        matches = [network for network in prefixes if address in network]
+        expected = max(matches, key=lambda network: network.prefixlen) if matches else None
+        found = tree.lookup(address)
+        assert (found[0] if found else None) == expected
+
+
+def test_filter_covered_splits_redundant_and_conflicts():
+    tree = build_prefix_tree([("10.0.0.0/8", RouteType.VPN), ("10.1.0.0/16", RouteType.LOCAL),
+                              ("10.0.0.0/8", RouteType.LOCAL), ("bogus", RouteType.VPN)])
+
+    result = filter_covered(["10.2.0.1", "10.1.0.1", "192.0.2.1", "not-an-ip"], RouteType.VPN, tree)
+
+    assert result.redundant == ["10.2.0.1"]
+    assert result.targets == ["10.1.0.1", "192.0.2.1", "not-an-ip"]
+    assert result.conflicts == [("10.1.0.1", "10.1.0.0/16", RouteType.LOCAL)]
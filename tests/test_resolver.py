@@ -0,0 +1,99 @@
+"""
+Тесты DNSResolver со встроенным клиентом против StubDNSServer:
+TTL из ответа, негативный кэш и кэширование цепочек CNAME.
+"""
+import pytest
+
+from dns_routing.core.resolver import DNSResolver
+from dns_routing.models import Domain, DomainType, RouteType
+from dns_routing.utils.stub_dns import StubDNSServer
+
+
+@pytest.fixture
+def stub():
+    server = StubDNSServer(soa_minimum=120)
+    server.add_a("www.example.test", ["192.0.2.1"], ttl=600)
+    server.add_cname("a.example.test", "edge.cdn.test", ttl=3600)
+    server.add_cname("b.example.test", "edge.cdn.test", ttl=3600)
+    server.add_a("edge.cdn.test", ["198.51.100.7"], ttl=90)
+    server.start_in_thread()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def resolver(config, stub):
+    config.dns_servers = [stub.address]
+    config.dns_backend = 'native'
+    config.dns_hedge = False
+    config.cache_min_ttl = 30
+    return DNSResolver()
+
+
+def test_cache_entry_uses_answer_ttl(resolver, stub):
+    outcomes = resolver.resolve_names(["www.example.test"])
+
+    assert outcomes["www.example.test"][0] == ["192.0.2.1"]
+    assert resolver.cache.get("www.example.test")['ttl'] == 600
+
+    resolver.resolve_names(["www.example.test"])
+    assert stub.queries == 1
+
+
+def test_nxdomain_cached_for_soa_minimum(resolver, stub):
+    ips, error, _ = resolver.resolve_names(["missing.example.test"])["missing.example.test"]
+
+    assert ips == [] and "NXDOMAIN" in error
+    entry = resolver.cache.get("missing.example.test")
+    assert entry['negative'] == 'nxdomain'
+    assert entry['ttl'] == 120
+
+    resolver.resolve_names(["missing.example.test"])
+    assert stub.queries == 1
+    assert resolver.negative_hits == 1
+
+
+def test_aliases_share_cname_target(resolver, stub):
+    resolver.resolve_names(["a.example.test"])
+    assert resolver.cache.get("a.example.test")['cname'] == "edge.cdn.test"
+    assert resolver.cache.get("edge.cdn.test")['ttl'] == 90
+
+    # Адреса алиаса истекли, ссылка CNAME жива - отвечает свежая цель
+    resolver.cache.get("a.example.test")['expires'] = 0
+    queries = stub.queries
+    assert resolver.resolve_names(["a.example.test"])["a.example.test"][0] == ["198.51.100.7"]
+    assert stub.queries == queries
+    assert resolver.cname_saved == 1
+
+
+def test_names_normalized_before_cache(resolver, stub):
+    outcomes = resolver.resolve_names(["WWW.Example.test.", "www.example.test"])
+
+    assert list(outcomes) == ["WWW.Example.test.", "www.example.test"]
+    assert outcomes["WWW.Example.test."][0] == ["192.0.2.1"]
+    assert resolver.cache.keys() == ["www.example.test"]
+    assert stub.queries == 1
+    assert resolver.deduplicated == 1
+
+
+def test_failures_counted_in_summary_not_printed_per_name(resolver, stub, capsys):
+    names = [f"broken{index}.example.test" for index in range(3)]
+    stub.servfail.update(names)
+
+    resolver.resolve_domains([Domain(name, DomainType.EXACT, RouteType.VPN)
+                              for name in names + ["www.example.test"]])
+
+    output = capsys.readouterr().out
+    assert "Warning" not in output
+    assert "DNS names: 1 of 4 resolved, 3 without addresses" in output
+    assert "DNS lookups failed: 3 timeouts or server errors" in output
+    assert resolver.cache.get("broken0.example.test")['negative'] == 'servfail'
+
+
+def test_failures_printed_in_verbose_mode(config, resolver, stub, capsys):
+    config.dns_verbose = True
+    stub.servfail.add("broken.example.test")
+
+    resolver.resolve_names(["broken.example.test"])
+
+    assert "Warning: Failed to resolve broken.example.test: SERVFAIL" in capsys.readouterr().out
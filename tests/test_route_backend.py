@@ -0,0 +1,81 @@
+"""
+Тесты SimulatorRouteBackend: одиночные операции, пакеты и состояние на диске.
+"""
+from dns_routing.core.route_backend import SimulatorRouteBackend
+from dns_routing.models import Route
+
+
+def _host(target: str, interface: str = "utun9") -> Route:
+    return Route(target=target, interface=interface)
+
+
+def _net(target: str, interface: str = "utun9") -> Route:
+    return Route(target=target, interface=interface, is_host=False)
+
+
+def test_add_and_delete():
+    backend = SimulatorRouteBackend()
+
+    assert backend.add(_host("203.0.113.1"))[0]
+    assert backend.add(_net("10.8.0.0/16"))[0]
+
+    table = backend.dump()
+    assert table.has_route("203.0.113.1", "utun9")
+    assert table.get("10.8.0.0/16").flags == "UGS"
+
+    assert backend.delete(_host("203.0.113.1"))[0]
+    assert not backend.dump().has_route("203.0.113.1")
+
+
+def test_duplicate_add_and_missing_delete_report_route_errors():
+    backend = SimulatorRouteBackend()
+    backend.add(_host("203.0.113.1"))
+
+    success, output = backend.add(_host("203.0.113.1"))
+    assert not success
+    assert "File exists" in output
+
+    success, output = backend.delete(_host("203.0.113.2"))
+    assert not success
+    assert "not in table" in output
+
+
+def test_batch_keeps_order_and_streams_results():
+    backend = SimulatorRouteBackend(fail_targets=["203.0.113.3"])
+    operations = [
+        ('add', _host("203.0.113.1")),
+        ('add', _host("203.0.113.2")),
+        ('add', _host("203.0.113.3")),
+        ('add', _host("203.0.113.1")),
+        ('delete', _host("203.0.113.2")),
+    ]
+    streamed = []
+
+    results = backend.batch(operations, lambda index, success, output: streamed.append((index, success)))
+
+    assert [success for success, _ in results] == [True, True, False, False, True]
+    assert "simulated failure" in results[2][1]
+    assert streamed == [(index, success) for index, (success, _) in enumerate(results)]
+    assert backend.operations == 5
+    assert backend.failures == 1
+    assert set(backend.dump().entries) == {"203.0.113.1/32"}
+
+
+def test_failure_rate_is_reproducible_with_seed():
+    operations = [('add', _host(f"198.51.100.{i}")) for i in range(1, 101)]
+
+    first = SimulatorRouteBackend(failure_rate=0.3, seed=7).batch(operations)
+    second = SimulatorRouteBackend(failure_rate=0.3, seed=7).batch(operations)
+
+    assert first == second
+    assert 0 < sum(1 for success, _ in first if not success) < 100
+
+
+def test_state_survives_restart(tmp_path):
+    state_file = tmp_path / "simulated_routes.json"
+    backend = SimulatorRouteBackend(state_file=state_file)
+    backend.batch([('add', _host("203.0.113.1")), ('add', _net("10.8.0.0/16"))])
+    backend.close()
+
+    restored = SimulatorRouteBackend(state_file=state_file)
+    assert set(restored.dump().entries) == {"203.0.113.1/32", "10.8.0.0/16"}
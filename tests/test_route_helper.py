@@ -0,0 +1,106 @@
+"""
+Тесты привилегированного помощника: проверка argv и протокол ответов.
+"""
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from dns_routing.core.route_backend import MacOSRouteBackend
+from dns_routing.core.route_helper import RouteHelper, is_allowed, serve
+from dns_routing.models import Route
+
+
+@pytest.mark.parametrize("argv", [
+    MacOSRouteBackend.build_command('add', Route(target="203.0.113.1", interface="utun9")),
+    MacOSRouteBackend.build_command('add', Route(target="203.0.113.1", interface="en0",
+                                                 gateway="192.168.1.1")),
+    MacOSRouteBackend.build_command('add', Route(target="10.8.0.0/16", interface="utun9",
+                                                 is_host=False)),
+    MacOSRouteBackend.build_command('delete', Route(target="203.0.113.1", interface="utun9")),
+    ["route", "-n", "delete", "-net", "10.8.0.0/16"],
+    ["ip", "route", "replace", "203.0.113.1/32", "via", "192.168.1.1", "dev", "eth0", "table", "100"],
+    ["ip", "-4", "route", "del", "10.8.0.0/16", "table", "100"],
+    ["netstat", "-rn", "-f", "inet"],
+])
+def test_route_commands_allowed(argv):
+    assert is_allowed(argv)
+
+
+@pytest.mark.parametrize("argv", [
+    [],
+    ["sh", "-c", "id"],
+    ["ip", "netns", "exec", "ns", "/bin/sh", "-c", "id"],
+    ["ip", "route", "add", "203.0.113.1/32", "dev", "eth0", "table", "100", "exec", "/bin/sh"],
+    ["ip", "route", "add", "203.0.113.1/32", "dev", "-eth0"],
+    ["ip", "route", "add", "203.0.113.1/32", "dev", "eth0", "dev", "eth1"],
+    ["ip", "-b", "/tmp/batch"],
+    ["route", "add", "-host", "example.com", "192.168.1.1"],
+    ["route", "add", "-host", "203.0.113.1", "192.168.1.1", "-interface", "en0"],
+    ["route", "add", "-host", "203.0.113.1", "-interface", "en0; id"],
+    ["route", "flush"],
+    ["netstat", "-anv"],
+    ["route", "add", "-host", "203.0.113.1", 53],
+])
+def test_other_commands_rejected(argv):
+    assert not is_allowed(argv)
+
+
+def test_serve_rejects_disallowed_commands_and_keeps_id():
+    requests = [
+        {'id': 1, 'argv': ["route", "add", "-host", "203.0.113.1", "-interface", "utun9"]},
+        {'id': 2, 'argv': ["ip", "netns", "exec", "ns", "/bin/sh"]},
+        {'id': 3},
+    ]
+    stdin = io.StringIO(''.join(json.dumps(request) + '\n' for request in requests) + "not json\n")
+    stdout = io.StringIO()
+
+    serve(stdin=stdin, stdout=stdout, fake=True)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [(response['id'], response['ok']) for response in responses] == \
+        [(1, True), (2, False), (3, False), (None, False)]
+    assert "not allowed" in responses[1]['output']
+
+
+def test_run_batch_through_fake_helper():
+    commands = [MacOSRouteBackend.build_command('add', Route(target=f"203.0.113.{i}", interface="utun9"))
+                for i in (1, 2, 1)]
+
+    with RouteHelper(fake=True) as helper:
+        results = helper.run_batch(commands)
+
+    assert [ok for ok, _ in results] == [True, True, False]
+
+
+def _scripted_helper(script: str) -> RouteHelper:
+    """Помощник, вместо которого отвечает заданный скрипт"""
+    helper = RouteHelper(fake=True)
+    helper._process = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, text=True, bufsize=1)
+    return helper
+
+
+@pytest.mark.parametrize("reply", [
+    '{"ok": true, "output": "no id"}',
+    '{"id": null, "ok": false, "output": "Bad request"}',
+    '{"id": 7, "ok": true, "output": "unknown id"}',
+    'garbage',
+])
+def test_unmatched_response_is_protocol_error(reply):
+    script = ("import sys\n"
+              "first = sys.stdin.readline()\n"
+              f"print({reply!r}, flush=True)\n"
+              "sys.stdin.read()\n")
+    helper = _scripted_helper(script)
+    streamed = []
+
+    results = helper.run_batch([["netstat", "-rn"], ["netstat", "-rn"]],
+                               lambda index, ok, output: streamed.append(index))
+
+    assert [ok for ok, _ in results] == [False, False]
+    assert all("protocol error" in output for _, output in results)
+    assert sorted(streamed) == [0, 1]
+    assert not helper.running
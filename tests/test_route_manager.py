@@ -0,0 +1,141 @@
+"""
+Тесты RouteManager поверх симулятора: reconcile, защита от массового
+удаления и восстановление кэша маршрутов по таблице.
+"""
+import pytest
+
+from dns_routing.core.route_backend import SimulatorRouteBackend
+from dns_routing.core.route_manager import RouteManager
+from dns_routing.models import Route, RouteType
+
+from .conftest import LOCAL_GATEWAY, LOCAL_INTERFACE, VPN_INTERFACE
+
+
+BOTH = [RouteType.LOCAL, RouteType.VPN]
+
+
+@pytest.fixture
+def backend():
+    return SimulatorRouteBackend()
+
+
+@pytest.fixture
+def manager(config, backend):
+    with RouteManager(backend=backend) as route_manager:
+        yield route_manager
+
+
+def test_constructor_does_not_touch_backend_without_routes_cache(config, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("backend created in constructor")
+
+    monkeypatch.setattr("dns_routing.core.route_manager.create_route_backend", fail)
+    route_manager = RouteManager()
+
+    assert not config.routes_cache_file.exists()
+    assert route_manager.active_routes == set()
+
+
+def test_plan_reconcile_diffs_recorded_routes(manager):
+    manager.install_routes(["203.0.113.1", "203.0.113.2"], RouteType.VPN)
+    manager.install_routes(["198.51.100.1"], RouteType.LOCAL)
+
+    plan = manager.plan_reconcile({
+        "203.0.113.1": RouteType.VPN,
+        "203.0.113.3": RouteType.VPN,
+        "198.51.100.1": RouteType.LOCAL,
+    }, BOTH)
+
+    assert plan.to_remove == [f"203.0.113.2:{VPN_INTERFACE}"]
+    assert plan.to_add == [("203.0.113.3", RouteType.VPN)]
+    assert plan.unchanged == 2
+    assert plan.in_scope == 3
+
+
+def test_plan_reconcile_readds_target_moved_between_interfaces(manager):
+    manager.install_routes(["203.0.113.1"], RouteType.VPN)
+
+    plan = manager.plan_reconcile({"203.0.113.1": RouteType.LOCAL}, BOTH)
+
+    assert plan.to_remove == [f"203.0.113.1:{VPN_INTERFACE}"]
+    assert plan.to_add == [("203.0.113.1", RouteType.LOCAL)]
+
+
+def test_plan_reconcile_ignores_interfaces_out_of_scope(manager):
+    manager.install_routes(["198.51.100.1"], RouteType.LOCAL)
+
+    plan = manager.plan_reconcile({"203.0.113.1": RouteType.VPN}, [RouteType.VPN])
+
+    assert plan.to_remove == []
+    assert plan.to_add == [("203.0.113.1", RouteType.VPN)]
+
+
+def test_apply_reconcile_converges_table_and_cache(manager, backend):
+    manager.install_routes(["203.0.113.1", "203.0.113.2"], RouteType.VPN)
+    desired = {"203.0.113.1": RouteType.VPN, "10.8.0.0/16": RouteType.LOCAL}
+
+    result = manager.apply_reconcile(manager.plan_reconcile(desired, BOTH))
+
+    assert result.success
+    assert manager.active_routes == {f"203.0.113.1:{VPN_INTERFACE}",
+                                     f"10.8.0.0/16:{LOCAL_INTERFACE}"}
+    assert set(backend.dump().entries) == {"203.0.113.1/32", "10.8.0.0/16"}
+    assert manager.plan_reconcile(desired, BOTH).is_empty
+
+
+def test_apply_reconcile_accepts_missing_and_existing_routes(manager, backend):
+    manager.install_routes(["203.0.113.1"], RouteType.VPN)
+    # Таблица разошлась с записью: маршрут уже удален, нужный уже стоит
+    backend.delete(Route(target="203.0.113.1", interface=""))
+    backend.add(Route(target="203.0.113.2", interface=VPN_INTERFACE))
+
+    result = manager.apply_reconcile(manager.plan_reconcile({"203.0.113.2": RouteType.VPN}, BOTH))
+
+    assert result.success
+    assert manager.active_routes == {f"203.0.113.2:{VPN_INTERFACE}"}
+
+
+def test_apply_reconcile_keeps_failed_routes_recorded(config):
+    backend = SimulatorRouteBackend(fail_targets=["203.0.113.2"])
+    with RouteManager(backend=backend) as manager:
+        manager.install_routes(["203.0.113.1"], RouteType.VPN)
+        backend.fail_targets.add("203.0.113.1/32")
+
+        result = manager.apply_reconcile(manager.plan_reconcile({"203.0.113.2": RouteType.VPN}, BOTH))
+
+        assert not result.success
+        assert len(result.errors) == 2
+        assert manager.active_routes == {f"203.0.113.1:{VPN_INTERFACE}"}
+
+
+def test_delete_ratio_guard(manager):
+    targets = [f"203.0.113.{i}" for i in range(1, 11)]
+    manager.install_routes(targets, RouteType.VPN)
+
+    # Сбой DNS: из 10 маршрутов остались 2
+    plan = manager.plan_reconcile({target: RouteType.VPN for target in targets[:2]}, BOTH)
+    assert plan.exceeds_delete_ratio(0.5)
+    assert not plan.exceeds_delete_ratio(0.9)
+
+    plan = manager.plan_reconcile({target: RouteType.VPN for target in targets[:6]}, BOTH)
+    assert not plan.exceeds_delete_ratio(0.5)
+
+    plan = manager.plan_reconcile({target: RouteType.VPN for target in targets}, BOTH)
+    assert not plan.exceeds_delete_ratio(0.0)
+
+
+def test_rebuild_adopts_only_host_routes_in_shared_table(manager, backend):
+    backend.batch([
+        ('add', Route(target="203.0.113.1", interface=VPN_INTERFACE)),
+        ('add', Route(target="198.51.100.1", interface=LOCAL_INTERFACE, gateway=LOCAL_GATEWAY)),
+        # Подсети VPN клиента и администратора не наши
+        ('add', Route(target="10.8.0.0/16", interface=VPN_INTERFACE, is_host=False)),
+        ('add', Route(target="172.16.0.0/12", interface=LOCAL_INTERFACE,
+                      gateway=LOCAL_GATEWAY, is_host=False)),
+        # Маршрут через другой шлюз тоже не наш
+        ('add', Route(target="198.51.100.2", interface=LOCAL_INTERFACE, gateway="192.168.1.254")),
+    ])
+
+    assert manager.rebuild_from_route_table() == 2
+    assert manager.active_routes == {f"203.0.113.1:{VPN_INTERFACE}",
+                                     f"198.51.100.1:{LOCAL_INTERFACE}"}
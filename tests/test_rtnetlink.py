@@ -0,0 +1,299 @@
+"""
+Тесты rtnetlink: кодирование и разбор сообщений, ошибки NLMSG_ERROR и метка
+конца пакета. Интеграционный тест выполняется в отдельном сетевом
+пространстве имен (unshare -rn) и пропускается, если его не создать.
+"""
+import errno
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from dns_routing.core.route_backend import NetlinkRouteBackend
+from dns_routing.models import Route
+from dns_routing.utils import rtnetlink
+
+
+_HEADER = struct.Struct("=IHHII")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+
+
+def _single_message(data: bytes):
+    messages = list(rtnetlink.iter_messages(data))
+    assert len(messages) == 1
+    assert _HEADER.unpack_from(data)[0] == len(data)
+    return messages[0]
+
+
+def _error_message(seq: int, code: int) -> bytes:
+    """NLMSG_ERROR с кодом и заголовком исходного сообщения (как при NETLINK_CAP_ACK)"""
+    body = struct.pack("=i", code) + _HEADER.pack(16, rtnetlink.NLMSG_NOOP, 0, seq, 0)
+    return rtnetlink.pack_message(rtnetlink.NLMSG_ERROR, 0, seq, body)
+
+
+# --- Кодирование и разбор ---
+
+def test_newroute_carries_table_destination_gateway_and_oif():
+    data = rtnetlink.pack_route(rtnetlink.RTM_NEWROUTE, 7, socket.inet_aton("203.0.113.0"), 24, 100,
+                                gateway=socket.inet_aton("192.168.1.1"), oif=3)
+
+    msg_type, flags, seq, body = _single_message(data)
+    assert (msg_type, flags, seq) == (rtnetlink.RTM_NEWROUTE,
+                                      rtnetlink.NLM_F_REQUEST | rtnetlink.NLM_F_ACK, 7)
+    family, dst_len, _, _, table, protocol, scope, route_type, _ = _RTMSG.unpack_from(body)
+    assert (family, dst_len, table) == (socket.AF_INET, 24, 100)
+    assert (protocol, scope, route_type) == (rtnetlink.RTPROT_STATIC, rtnetlink.RT_SCOPE_UNIVERSE,
+                                             rtnetlink.RTN_UNICAST)
+
+    attrs = rtnetlink.parse_attrs(body, _RTMSG.size)
+    assert attrs[rtnetlink.RTA_TABLE] == struct.pack("=I", 100)
+    assert attrs[rtnetlink.RTA_DST] == socket.inet_aton("203.0.113.0")
+    assert attrs[rtnetlink.RTA_GATEWAY] == socket.inet_aton("192.168.1.1")
+    assert attrs[rtnetlink.RTA_OIF] == struct.pack("=I", 3)
+
+
+def test_newroute_without_gateway_is_link_scope():
+    data = rtnetlink.pack_route(rtnetlink.RTM_NEWROUTE, 1, socket.inet_aton("203.0.113.1"), 32, 100,
+                                oif=5)
+
+    _, _, _, body = _single_message(data)
+    assert _RTMSG.unpack_from(body)[6] == rtnetlink.RT_SCOPE_LINK
+    assert rtnetlink.RTA_GATEWAY not in rtnetlink.parse_attrs(body, _RTMSG.size)
+
+
+def test_delroute_matches_any_protocol_and_scope():
+    data = rtnetlink.pack_route(rtnetlink.RTM_DELROUTE, 2, socket.inet_aton("203.0.113.1"), 32, 100,
+                                flags=rtnetlink.NLM_F_REQUEST)
+
+    msg_type, flags, _, body = _single_message(data)
+    assert (msg_type, flags) == (rtnetlink.RTM_DELROUTE, rtnetlink.NLM_F_REQUEST)
+    _, _, _, _, _, protocol, scope, _, _ = _RTMSG.unpack_from(body)
+    assert (protocol, scope) == (0, rtnetlink.RT_SCOPE_NOWHERE)
+    assert set(rtnetlink.parse_attrs(body, _RTMSG.size)) == {rtnetlink.RTA_TABLE, rtnetlink.RTA_DST}
+
+
+def test_large_table_id_goes_only_into_attribute():
+    data = rtnetlink.pack_route(rtnetlink.RTM_NEWROUTE, 1, socket.inet_aton("10.0.0.0"), 8, 1000,
+                                oif=1)
+
+    body = _single_message(data)[3]
+    assert _RTMSG.unpack_from(body)[4] == rtnetlink.RT_TABLE_UNSPEC
+    assert rtnetlink.parse_route(body).table == 1000
+
+
+def test_parse_route_roundtrip():
+    data = rtnetlink.pack_route(rtnetlink.RTM_NEWROUTE, 1, socket.inet_aton("198.51.100.0"), 24, 100,
+                                gateway=socket.inet_aton("192.168.1.1"), oif=4)
+
+    route = rtnetlink.parse_route(_single_message(data)[3])
+
+    assert route == rtnetlink.NetlinkRoute(destination="198.51.100.0/24", gateway="192.168.1.1",
+                                           oif=4, table=100, route_type=rtnetlink.RTN_UNICAST)
+    assert rtnetlink.route_type_name(route.route_type) == "unicast"
+
+
+def test_iter_messages_splits_aligned_stream_and_stops_on_bad_length():
+    stream = rtnetlink.pack_noop(1) + rtnetlink.pack_rule(2, 100, 1000) + _HEADER.pack(4, 0, 0, 3, 0)
+
+    messages = list(rtnetlink.iter_messages(stream))
+
+    assert [(msg_type, seq) for msg_type, _, seq, _ in messages] == \
+        [(rtnetlink.NLMSG_NOOP, 1), (rtnetlink.RTM_NEWRULE, 2)]
+    rule_attrs = rtnetlink.parse_attrs(messages[1][3], _RTMSG.size)
+    assert rule_attrs[rtnetlink.FRA_TABLE] == struct.pack("=I", 100)
+    assert rule_attrs[rtnetlink.FRA_PRIORITY] == struct.pack("=I", 1000)
+
+
+def test_parse_error_returns_negative_errno():
+    (_, _, _, ack), = rtnetlink.iter_messages(_error_message(1, 0))
+    (_, _, _, failure), = rtnetlink.iter_messages(_error_message(2, -errno.EEXIST))
+
+    assert rtnetlink.parse_error(ack) == 0
+    assert rtnetlink.parse_error(failure) == -errno.EEXIST
+
+
+# --- Пакеты NetlinkRouteBackend против имитации ядра ---
+
+class _FakeKernel:
+    """
+    Сокет, отвечающий как ядро: NLMSG_ERROR только на ошибочные сообщения
+    и подтверждение на NLMSG_NOOP с NLM_F_ACK.
+    """
+
+    def __init__(self, existing=()):
+        self.table = set(existing)
+        self.sends = 0
+        self._replies = []
+
+    def send(self, data: bytes) -> int:
+        self.sends += 1
+        reply = b''
+        for msg_type, flags, seq, body in rtnetlink.iter_messages(data):
+            code = 0
+            if msg_type in (rtnetlink.RTM_NEWROUTE, rtnetlink.RTM_DELROUTE):
+                route = rtnetlink.parse_route(body)
+                if msg_type == rtnetlink.RTM_NEWROUTE:
+                    code = -errno.EEXIST if route.destination in self.table else 0
+                    self.table.add(route.destination)
+                else:
+                    code = 0 if route.destination in self.table else -errno.ESRCH
+                    self.table.discard(route.destination)
+            if code or flags & rtnetlink.NLM_F_ACK:
+                reply += _error_message(seq, code)
+        # Ответ приходит несколькими датаграммами
+        self._replies.extend(message for message in _split(reply))
+        return len(data)
+
+    def recv(self, size: int) -> bytes:
+        return self._replies.pop(0)
+
+    def close(self) -> None:
+        pass
+
+
+def _split(data: bytes):
+    offset = 0
+    while offset < len(data):
+        length = _HEADER.unpack_from(data, offset)[0]
+        yield data[offset:offset + length]
+        offset += length
+
+
+@pytest.fixture
+def kernel():
+    return _FakeKernel(existing={"203.0.113.2/32"})
+
+
+@pytest.fixture
+def netlink(kernel, monkeypatch):
+    monkeypatch.setattr(socket, "if_nametoindex", lambda name: {"eth0": 2}[name])
+    backend = NetlinkRouteBackend(table=100)
+    backend._sock = kernel
+    return backend
+
+
+def test_batch_maps_errors_before_barrier_to_operations(netlink, kernel):
+    operations = [
+        ('add', Route(target="203.0.113.1", interface="eth0")),
+        ('add', Route(target="203.0.113.2", interface="eth0")),
+        ('add', Route(target="bogus", interface="eth0")),
+        ('delete', Route(target="198.51.100.1", interface="")),
+        ('add', Route(target="10.8.1.2/16", interface="eth0", is_host=False)),
+    ]
+    streamed = []
+
+    results = netlink.batch(operations, lambda index, success, output: streamed.append(index))
+
+    assert [success for success, _ in results] == [True, False, False, False, True]
+    assert results[1][1] == os.strerror(errno.EEXIST)
+    assert "Invalid IP" in results[2][1]
+    assert results[3][1] == os.strerror(errno.ESRCH)
+    # Префикс сети выравнивается по маске
+    assert "10.8.0.0/16" in kernel.table
+    assert sorted(streamed) == list(range(5))
+    assert kernel.sends == 1
+
+
+def test_batch_is_split_into_blocks_with_own_barrier(netlink, kernel):
+    netlink._chunk = 16
+    operations = [('add', Route(target=f"198.51.100.{i}", interface="eth0")) for i in range(1, 41)]
+
+    results = netlink.batch(operations)
+
+    assert all(success for success, _ in results)
+    assert kernel.sends == 3
+
+
+def test_receive_errors_stops_at_barrier(netlink, kernel):
+    kernel._replies = [_error_message(11, -errno.EEXIST), rtnetlink.pack_noop(99),
+                       _error_message(13, -errno.ENETUNREACH), _error_message(14, 0),
+                       _error_message(15, -errno.EEXIST)]
+
+    codes = netlink._receive_errors({11: 0, 12: 1, 13: 2, 15: 3}, barrier_seq=14)
+
+    assert codes == {0: -errno.EEXIST, 2: -errno.ENETUNREACH}
+    assert kernel._replies == [_error_message(15, -errno.EEXIST)]
+
+
+def test_failed_barrier_is_reported_under_minus_one(netlink, kernel):
+    kernel._replies = [_error_message(5, -errno.EPERM)]
+
+    assert netlink._receive_errors({}, barrier_seq=5) == {-1: -errno.EPERM}
+
+
+def test_main_table_cannot_be_flushed():
+    with pytest.raises(RuntimeError):
+        NetlinkRouteBackend().flush()
+
+
+# --- Интеграция в сетевом пространстве имен ---
+
+def _can_unshare() -> bool:
+    if not sys.platform.startswith('linux') or shutil.which('unshare') is None:
+        return False
+    try:
+        return subprocess.run(['unshare', '-rn', 'true'], capture_output=True, timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+_NAMESPACE_SCENARIO = textwrap.dedent('''
+    import json, socket, struct, fcntl
+    from dns_routing.core.route_backend import NetlinkRouteBackend
+    from dns_routing.models import Route
+
+    # Поднимаем lo (SIOCGIFFLAGS/SIOCSIFFLAGS, IFF_UP) без утилиты ip:
+    # маршруты через него не требуют других интерфейсов
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        request = struct.pack("16sH14s", b"lo", 0, b"")
+        flags = struct.unpack_from("16sH", fcntl.ioctl(s, 0x8913, request))[1]
+        fcntl.ioctl(s, 0x8914, struct.pack("16sH14s", b"lo", flags | 1, b""))
+
+    backend = NetlinkRouteBackend(table=100)
+    hosts = [Route(target=f"10.{i >> 8}.{i & 255}.1", interface="lo") for i in range(2000)]
+    report = {}
+    added = backend.batch([("add", route) for route in hosts]
+                          + [("add", Route(target="172.16.0.0/12", interface="lo", is_host=False)),
+                             ("add", hosts[0])])
+    report["added"] = sum(1 for ok, _ in added if ok)
+    report["duplicate"] = added[-1][1]
+    table = backend.dump()
+    report["dumped"] = len(table)
+    report["has_host"] = table.has_route("10.0.5.1", "lo")
+    report["has_net"] = table.get("172.16.0.0/12") is not None
+    deleted = backend.batch([("delete", route) for route in hosts[:10]])
+    report["deleted"] = sum(1 for ok, _ in deleted if ok)
+    report["flushed"] = backend.flush()
+    report["after_flush"] = len(backend.dump())
+    backend.close()
+    print(json.dumps(report))
+''')
+
+
+@pytest.mark.skipif(not _can_unshare(), reason="needs Linux with unprivileged user/network namespaces")
+def test_netlink_backend_in_network_namespace():
+    root = Path(__file__).resolve().parents[1]
+    env = dict(os.environ, PYTHONPATH=str(root))
+
+    result = subprocess.run(['unshare', '-rn', sys.executable, '-c', _NAMESPACE_SCENARIO],
+                            capture_output=True, text=True, timeout=120, cwd=root, env=env)
+
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout)
+    assert report == {
+        'added': 2001,
+        'duplicate': os.strerror(errno.EEXIST),
+        'dumped': 2001,
+        'has_host': True,
+        'has_net': True,
+        'deleted': 10,
+        'flushed': 1991,
+        'after_flush': 0,
+    }